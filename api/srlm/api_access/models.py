@@ -1,4 +1,5 @@
 from api.srlm.app import db
+from api.srlm.app.token_cache import forget_token
 from datetime import datetime, timezone, timedelta
 import secrets
 
@@ -13,6 +14,7 @@ class AuthorizedApp(db.Model):
 
     def get_new_token(self, expires_in=2592000):
         now = datetime.now(timezone.utc)
+        forget_token(AuthorizedApp, self.token)
         self.token = secrets.token_hex(17)
         self.token_expiration = now + timedelta(seconds=min(expires_in, 2592000))
         db.session.add(self)
@@ -20,6 +22,7 @@ class AuthorizedApp(db.Model):
 
     def revoke_token(self):
         self.token_expiration = datetime.utcnow() - timedelta(seconds=1)
+        forget_token(AuthorizedApp, self.token)
 
     @staticmethod
     def check_token(token):
@@ -47,6 +47,11 @@ Values `false`, `No` and `no` also work for this override.
 ## Rate Limits
 
 The API has a global rate limit of 50 requests per minute. Request Headers carry information on the rate limiting.
+
+## Exports
+
+Whole seasons of match data can be exported in a single request instead of paging through the collections, i.e.
+/api/seasons/1/export/player_match_data. Exports are streamed as newline delimited JSON, or CSV with `format=csv`.
 """
 
 from flask import Flask
@@ -110,6 +115,9 @@ def create_app(config_class=Config):
 
     app.register_blueprint(api_bp, url_prefix='/api')
 
+    from api.srlm.app.links import init_links
+    init_links(app)
+
     if not app.debug and not app.testing:
         # only runs when app not in debug or testing mode
         app.logger = log
@@ -1,15 +1,17 @@
 """Auth endpoints relating to permissions"""
-from apifairy import response, authenticate, other_responses, body, arguments
+from apifairy import authenticate, other_responses, body, arguments
 from flask import request, url_for, Blueprint
 import sqlalchemy as sa
 from api.srlm.app import db
 from api.srlm.app.api.utils.functions import ensure_exists, force_fields, force_unique, clean_data
 from api.srlm.app.fairy.errors import unauthorized, not_found, bad_request
+from api.srlm.app.serializers import response
 from api.srlm.app.fairy.schemas import PermissionSchema, LinkSuccessSchema, UpdatePermissionSchema, PermUsersSchema, \
-    PaginationArgs, PermissionCollection
+    CursorPaginationArgs, PermissionCollection
 from api.srlm.app.models import Permission
 from api.srlm.app.api.auth import auth_bp as auth
 from api.srlm.app.api.utils import responses
+from api.srlm.app.api.utils.cache import invalidate
 from api.srlm.app.api.auth.utils import app_auth
 from api.srlm.app.api.utils.errors import BadRequest
 
@@ -40,7 +42,7 @@ def get_permission(perm_id_or_key):
 
 
 @permissions.route('/', methods=['GET'])
-@arguments(PaginationArgs())
+@arguments(CursorPaginationArgs())
 @response(PermissionCollection())
 @authenticate(app_auth)
 @other_responses(unauthorized | not_found)
@@ -48,7 +50,8 @@ def get_permissions(pagination):
     """Get a collection of all permissions"""
     page = pagination['page']
     per_page = pagination['per_page']
-    return Permission.to_collection_dict(sa.select(Permission), page, per_page, 'api.auth.permissions.get_permissions')
+    return Permission.to_collection_dict(sa.select(Permission), page, per_page, 'api.auth.permissions.get_permissions',
+                                         after=pagination.get('after'), total=pagination['total'])
 
 
 @permissions.route('', methods=['POST'])
@@ -86,7 +89,11 @@ def update_permission(perm_id_or_key):
     if 'key' in data and data['key'] != permission.key and check_key_exists(data['key']):
         raise BadRequest('Permission key is not unique')
     permission.from_dict(data)
+    for user in permission.users:
+        user.permissions_changed()
     db.session.commit()
+    # users list their permission keys
+    invalidate('user')
     return responses.request_success(f"Permission {permission.key} updated", 'api.auth.permissions.get_permission', perm_id_or_key=permission.id)
 
 
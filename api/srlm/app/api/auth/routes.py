@@ -1,15 +1,14 @@
 """Main auth endpoints"""
 from flask import request, url_for
-from apifairy import response, body, other_responses, authenticate
-from api.srlm.api_access.models import AuthorizedApp
+from apifairy import body, other_responses, authenticate
 from api.srlm.app import db
 from api.srlm.app.api.auth import auth_bp as auth
 from api.srlm.app.api.auth.utils import basic_auth, user_auth, dual_auth, app_auth
 from api.srlm.app.api.utils import responses
-from api.srlm.app.api.auth.utils import get_bearer_token
+from api.srlm.app.api.auth.utils import get_bearer_token, check_app_token, check_user_token
 from api.srlm.app.fairy.schemas import TokenSchema, BasicAuthSchema, BasicSuccessSchema, UserVerifySchema
 from api.srlm.app.fairy.errors import unauthorized
-from api.srlm.app.models import User
+from api.srlm.app.serializers import response
 
 
 @auth.route('/user', methods=['POST'])
@@ -43,7 +42,7 @@ def revoke_user_token():
 def validate_user_token():
     """Check if the user token provided is valid"""
     user_token = get_bearer_token(request.headers)['user']
-    user = User.check_token(user_token)
+    user = check_user_token(user_token)
 
     response_json = {
         'user': user.id,
@@ -64,7 +63,7 @@ def request_new_app_token():
     Replaces the current token"""
     app_token = get_bearer_token(request.headers)['app']
 
-    authorized_app = AuthorizedApp.check_token(app_token)
+    authorized_app = check_app_token(app_token)
     token = authorized_app.get_new_token()
     db.session.commit()
     response_json = {
@@ -82,7 +81,7 @@ def get_app_token():
     """Get the current app token and expiry date"""
     app_token = get_bearer_token(request.headers)['app']
 
-    authorized_app = AuthorizedApp.check_token(app_token)
+    authorized_app = check_app_token(app_token)
     response_json = {
         'token': authorized_app.token,
         'expiry': authorized_app.token_expiration
@@ -4,6 +4,7 @@ from flask_httpauth import HTTPBasicAuth, HTTPTokenAuth
 from api.srlm.api_access.models import AuthorizedApp
 from api.srlm.app import db
 from api.srlm.app.models import User
+from api.srlm.app.token_cache import verified_token
 from api.srlm.app.api.utils.errors import error_response, AppAuthError, UserAuthError, DualAuthError
 from functools import wraps
 from flask import request
@@ -26,10 +27,20 @@ def basic_auth_error(status):
     return error_response(status, 'User credentials invalid')
 
 
+def check_app_token(app_token):
+    """Cached AuthorizedApp.check_token - use this instead of checking the same token against the database again"""
+    return verified_token(AuthorizedApp, app_token)
+
+
+def check_user_token(user_token):
+    """Cached User.check_token - use this instead of checking the same token against the database again"""
+    return verified_token(User, user_token)
+
+
 @user_auth.verify_token
 def verify_user_token(token):
     user_token = token[34:]
-    return User.check_token(user_token) if user_token else None
+    return check_user_token(user_token) if user_token else None
 
 
 @user_auth.error_handler
@@ -40,7 +51,7 @@ def token_auth_error(status):
 @app_auth.verify_token
 def verify_app_token(token):
     app_token = token[:34]
-    return AuthorizedApp.check_token(app_token) if app_token else None
+    return check_app_token(app_token) if app_token else None
 
 
 @app_auth.error_handler
@@ -53,7 +64,7 @@ def verify_dual_token(token):
     app_token = token[:34]
     user_token = token[34:]
     if app_token and user_token:
-        return User.check_token(user_token)
+        return check_user_token(user_token)
     else:
         return None
 
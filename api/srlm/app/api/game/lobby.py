@@ -1,11 +1,12 @@
 """Provides routes for generating and cancelling in game lobbies"""
-from apifairy import body, response, authenticate, other_responses
+from apifairy import body, authenticate, other_responses
 from flask import request, Blueprint
 from api.srlm.app.api import bp
 from api.srlm.app.api.auth.utils import app_auth
 from api.srlm.app.api.utils import responses
 from api.srlm.app.api.utils.functions import force_fields, ensure_exists
 from api.srlm.app.fairy.errors import unauthorized, bad_request, not_found
+from api.srlm.app.serializers import response
 from api.srlm.app.fairy.schemas import GenerateLobbySchema, LinkSuccessSchema, BasicSuccessSchema
 from api.srlm.app.models import Match, Lobby
 from api.srlm.app.spapi.lobby_manager import generate_lobby
@@ -1,25 +1,27 @@
 """Provides endpoints for creating matches and retrieving match data"""
 from datetime import datetime, timezone
 
-from apifairy import body, response, authenticate, other_responses
+from apifairy import arguments, body, authenticate, other_responses
 from flask import request, Blueprint
 import sqlalchemy as sa
 
-from api.srlm.app.api.utils.cache import force_refresh
+from api.srlm.app.api.utils.cache import cached, invalidate, entity_tags
 from api.srlm.app.spapi.lobby import get_lobby_matches
 from api.srlm.app.task_manager.tasks import cancel_task
-from api.srlm.app import db, cache
+from api.srlm.app import db
 from api.srlm.app.api import bp
 from api.srlm.app.api.utils import responses
-from api.srlm.app.api.auth.utils import get_bearer_token, app_auth, dual_auth
+from api.srlm.app.api.auth.utils import get_bearer_token, app_auth, dual_auth, check_user_token
 from api.srlm.app.api.utils.errors import BadRequest
 from api.srlm.app.api.utils.functions import force_fields, ensure_exists, clean_data, force_unique
 from api.srlm.app.fairy.errors import unauthorized, bad_request, not_found
+from api.srlm.app.serializers import response
 from api.srlm.app.fairy.schemas import LinkSuccessSchema, NewMatchSchema, ViewMatchSchema, MatchReviewSchema, \
-    MatchtypeSchema, MatchStatsSchema, NewMatchFlag
-from api.srlm.app.models import SeasonDivision, Team, Match, MatchSchedule, MatchReview, MatchData, Matchtype, User, \
+    MatchtypeSchema, MatchStatsSchema, NewMatchFlag, BatchArgs, MatchBatch, MatchExpandArgs
+from api.srlm.app.models import SeasonDivision, Team, Match, MatchSchedule, MatchReview, MatchData, Matchtype, \
     PlayerMatchData
 from api.srlm.app.spapi.lobby_manager import generate_lobby, validate_stats
+from api.srlm.app.stats import add_player_stats
 
 match = Blueprint('match', __name__)
 bp.register_blueprint(match, url_prefix='/match')
@@ -59,23 +61,45 @@ def create_match():
 
     db.session.add(match_db)
     db.session.commit()
+    invalidate(*entity_tags('match'), f'season_division:{season_division.id}')
 
     return responses.create_success(f'Match between {match_db.home_team.name} and {match_db.away_team.name} created', 'api.match.get_match', match_id=match_db.id)
 
 
+@match.route('/batch', methods=['GET'])
+@cached(tags=['match', 'match:{ids}', 'team', 'user', 'season', 'division', 'player'])
+@arguments(BatchArgs())
+@arguments(MatchExpandArgs())
+@response(MatchBatch())
+@authenticate(app_auth)
+@other_responses(unauthorized | bad_request)
+def get_matches_batch(args, expand_args):
+    """Get many matches by id in one call
+    Pass up to 100 comma separated ids, e.g. `?ids=1,2,3`. Matches are keyed by id, ids that don't exist are listed in
+    missing. Related resources can be embedded with `expand` as in Get details of a match"""
+    return Match.to_batch_dict(args['ids'], expand_args['expand'])
+
+
 @match.route('/<int:match_id>', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=['match:{match_id}', 'team', 'user', 'season', 'division', 'player'])
+@arguments(MatchExpandArgs())
 @response(ViewMatchSchema())
 @authenticate(app_auth)
 @other_responses(unauthorized | not_found)
-def get_match(match_id):
-    """Get details of a match"""
-    match_db = ensure_exists(Match, id=match_id)
-    response_json = match_db.to_dict()
+def get_match(expand_args, match_id):
+    """Get details of a match
+    Related resources can be embedded under `_embedded` with comma separated names in `expand`, e.g.
+    `?expand=home_team,away_team,stats`. Valid values are: "home_team", "away_team", "results", "schedule", "stats"
+    """
+    expand = expand_args['expand']
+    options = Match.collection_options() + Match.expansion_options(expand)
+    match_db = ensure_exists(Match, id=match_id, options=options)
+    response_json = match_db.to_expanded_dict(expand)
     return response_json
 
 
 @match.route('/<int:match_id>/review', methods=['GET'])
+@cached(tags=['match:{match_id}', 'player'], lock=True, stale=60, early_refresh=1)
 @response(MatchReviewSchema())
 @authenticate(app_auth)
 @other_responses(unauthorized | not_found)
@@ -93,12 +117,14 @@ def get_match_review(match_id):
     for lobby in match_db.lobbies:
         lobby_ids.append(lobby.id)
 
-    period_query = db.session.query(MatchData).filter(MatchData.lobby_id.in_(lobby_ids)).order_by(sa.asc(MatchData.created))
+    period_query = db.session.query(MatchData).filter(
+        MatchData.lobby_id.in_(lobby_ids)).order_by(sa.asc(MatchData.created)).all()
+    player_data = MatchData.get_player_data([period.id for period in period_query])
     periods = []
     for period in period_query:
         period_data = period.to_dict()
         period_data['player_data'] = []
-        for player in period.player_data_assoc:
+        for player in player_data[period.id]:
             period_data['player_data'].append(player.to_dict())
         periods.append(period_data)
 
@@ -124,7 +150,7 @@ def update_match_review(match_id):
         raise BadRequest('Match results already confirmed. Unable to submit review')
 
     user_token = get_bearer_token(request.headers)['user']
-    user = User.check_token(user_token)
+    user = check_user_token(user_token)
 
     data = request.get_json()
 
@@ -144,6 +170,7 @@ def update_match_review(match_id):
             flag.resolved_by = user.id
             flag.resolved_on = datetime.now(timezone.utc)
 
+    edited_players = set()
     if 'periods' in data:
         for period_data in data['periods']:
             if 'id' not in period_data:
@@ -157,9 +184,18 @@ def update_match_review(match_id):
                     if 'id' not in player_data:
                         raise BadRequest('One or more player data entries are missing ID tags')
                     player_match_data = ensure_exists(PlayerMatchData, id=player_data['id'])
-                    player_match_data.from_dict(player_data)
+                    if period.accepted:
+                        # swap the old values for the edited ones in the players season totals
+                        add_player_stats(match_db.season_division_id, [player_match_data], sign=-1)
+                        player_match_data.from_dict(player_data)
+                        add_player_stats(match_db.season_division_id, [player_match_data])
+                        edited_players.add(player_match_data.player_id)
+                    else:
+                        player_match_data.from_dict(player_data)
 
     db.session.commit()
+    invalidate(f'match:{match_db.id}', f'season_division:{match_db.season_division_id}',
+               *[f'player:{player_id}' for player_id in edited_players])
 
     match_db = db.session.get(Match, match_db.id)
     lobby_ids = [lb.id for lb in match_db.lobbies]
@@ -173,7 +209,7 @@ def update_match_review(match_id):
 
 
 @match.route('/<int:match_id>/stats', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=['match:{match_id}', 'player', 'team'])
 @response(MatchStatsSchema())
 @authenticate(app_auth)
 @other_responses(unauthorized | not_found)
@@ -181,19 +217,10 @@ def get_match_stats(match_id):
     """Get the accepted match stats"""
     match_db = ensure_exists(Match, id=match_id)
 
-    period_query = db.session.query(MatchData).filter_by(accepted=True).order_by(sa.asc(MatchData.current_period))
-    periods = []
-    for period in period_query:
-        period_data = period.to_dict()
-        period_data['player_data'] = []
-        for player in period.player_data_assoc:
-            period_data['player_data'].append(player.to_dict())
-        periods.append(period_data)
-
     response_json = {
         'match_id': match_db.id,
         'match_details': match_db.to_simple_dict(),
-        'periods': periods
+        'periods': match_db.accepted_periods()
     }
     return response_json
 
@@ -210,7 +237,7 @@ def report_issue(match_id):
     match_db = ensure_exists(Match, id=match_id)
     data = request.get_json()
     user_token = get_bearer_token(request.headers)['user']
-    user = User.check_token(user_token)
+    user = check_user_token(user_token)
 
     required_fields = valid_fields = ['type', 'reason', 'comments']
     force_fields(data, required_fields)
@@ -221,6 +248,7 @@ def report_issue(match_id):
 
     db.session.add(flag)
     db.session.commit()
+    invalidate(f'match:{match_db.id}')
 
     # Check if the issue reported was technical and if a new lobby was requested
     if data['type'] == 'Technical' and 'new_lobby' in data:
@@ -267,7 +295,7 @@ def report_issue(match_id):
 
 
 @match.route('/type/<int:match_type_id>', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=['match_type'])
 @response(MatchtypeSchema())
 @authenticate(app_auth)
 @other_responses(unauthorized | not_found)
@@ -297,5 +325,6 @@ def add_match_type():
     match_type.from_dict(cleaned_data)
     db.session.add(match_type)
     db.session.commit()
+    invalidate(*entity_tags('match_type'))
 
     return responses.create_success(f'Match type {match_type.name} created.', 'api.match.get_match_type', match_type_id=match_type.id)
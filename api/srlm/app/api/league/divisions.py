@@ -1,14 +1,15 @@
 """Endpoints relating to Divisions"""
-from apifairy import arguments, body, response, authenticate, other_responses
+from apifairy import arguments, body, authenticate, other_responses
 
-from api.srlm.app import db, cache
+from api.srlm.app import db
 from api.srlm.app.api import bp
 from flask import request, url_for, Blueprint
 from api.srlm.app.api.utils import responses
-from api.srlm.app.api.utils.cache import force_refresh
+from api.srlm.app.api.utils.cache import cached, invalidate, entity_tags
 from api.srlm.app.api.utils.functions import force_fields, clean_data, ensure_exists, force_unique
 from api.srlm.app.fairy.errors import unauthorized, not_found, bad_request
-from api.srlm.app.fairy.schemas import PaginationArgs, DivisionCollection, DivisionSchema, LinkSuccessSchema, \
+from api.srlm.app.serializers import response
+from api.srlm.app.fairy.schemas import CursorPaginationArgs, DivisionCollection, DivisionSchema, LinkSuccessSchema, \
     UpdateDivisionSchema, SeasonsOfDivision
 from api.srlm.app.models import Division, League
 from api.srlm.app.api.auth.utils import app_auth
@@ -24,8 +25,8 @@ bp.register_blueprint(divisions, url_prefix='/divisions')
 
 
 @divisions.route('', methods=['GET'])
-@cache.cached(unless=force_refresh)
-@arguments(PaginationArgs())
+@cached(tags=['division', 'league', 'season_division'])
+@arguments(CursorPaginationArgs())
 @response(DivisionCollection())
 @authenticate(app_auth)
 @other_responses(unauthorized)
@@ -33,11 +34,12 @@ def get_divisions(pagination):
     """Get the collection of all divisions"""
     page = pagination['page']
     per_page = pagination['per_page']
-    return Division.to_collection_dict(sa.select(Division), page, per_page, 'api.divisions.get_divisions')
+    return Division.to_collection_dict(sa.select(Division), page, per_page, 'api.divisions.get_divisions',
+                                       after=pagination.get('after'), total=pagination['total'])
 
 
 @divisions.route('/<int:division_id>', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=['division', 'league', 'season_division'])
 @response(DivisionSchema())
 @authenticate(app_auth)
 @other_responses(unauthorized | not_found)
@@ -74,6 +76,7 @@ def add_division():
 
     db.session.add(division)
     db.session.commit()
+    invalidate(*entity_tags('division'))
 
     return responses.create_success(f'{league_db.acronym} {division.name} added', 'api.divisions.get_division', division_id=division.id)
 
@@ -97,12 +100,13 @@ def update_division(division_id):
     division.from_dict(cleaned_data)
 
     db.session.commit()
+    invalidate(*entity_tags('division'))
 
     return responses.request_success(f'Division {division.name} updated', 'api.divisions.get_division', division_id=division.id)
 
 
 @divisions.route('/<int:division_id>/seasons', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=['division', 'season', 'league', 'season_division'])
 @response(SeasonsOfDivision())
 @authenticate(app_auth)
 @other_responses(unauthorized | not_found)
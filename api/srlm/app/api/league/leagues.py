@@ -1,16 +1,17 @@
 """Endpoints relating to Leagues"""
-from apifairy import arguments, body, response, authenticate, other_responses
+from apifairy import arguments, body, authenticate, other_responses
 
-from api.srlm.app import db, cache
+from api.srlm.app import db
 from api.srlm.app.api import bp
 from api.srlm.app.api.utils import responses
 from flask import request, Blueprint
 
-from api.srlm.app.api.utils.cache import force_refresh
+from api.srlm.app.api.utils.cache import cached, invalidate, entity_tags
 from api.srlm.app.api.utils.functions import force_fields, clean_data, force_unique, ensure_exists
 from api.srlm.app.fairy.errors import unauthorized, not_found, bad_request
-from api.srlm.app.fairy.schemas import PaginationArgs, LeagueCollection, LeagueSchema, LinkSuccessSchema, \
-    EditLeagueSchema, DivisionsInLeague, SeasonsInLeague
+from api.srlm.app.serializers import response
+from api.srlm.app.fairy.schemas import PaginationArgs, CursorPaginationArgs, LeagueCollection, LeagueSchema, \
+    LinkSuccessSchema, EditLeagueSchema, DivisionsInLeague, SeasonsInLeague
 from api.srlm.app.models import League, Season, Division
 from api.srlm.app.api.auth.utils import app_auth
 import sqlalchemy as sa
@@ -25,8 +26,8 @@ bp.register_blueprint(leagues, url_prefix='/leagues')
 
 
 @leagues.route('', methods=['GET'])
-@cache.cached(unless=force_refresh)
-@arguments(PaginationArgs())
+@cached(tags=['league', 'season', 'division'])
+@arguments(CursorPaginationArgs())
 @response(LeagueCollection())
 @authenticate(app_auth)
 @other_responses(unauthorized)
@@ -34,11 +35,12 @@ def get_leagues(pagination):
     """Get the collection of all leagues"""
     page = pagination['page']
     per_page = pagination['per_page']
-    return League.to_collection_dict(sa.select(League), page, per_page, 'api.leagues.get_leagues')
+    return League.to_collection_dict(sa.select(League), page, per_page, 'api.leagues.get_leagues',
+                                     after=pagination.get('after'), total=pagination['total'])
 
 
 @leagues.route('/<league_id_or_acronym>', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=['league', 'season', 'division'])
 @response(LeagueSchema())
 @authenticate(app_auth)
 @other_responses(unauthorized | not_found)
@@ -68,6 +70,7 @@ def add_leagues():
 
     db.session.add(league_db)
     db.session.commit()
+    invalidate(*entity_tags('league'))
 
     return responses.create_success(f'League {league_db.name} added', 'api.leagues.get_league', league_id_or_acronym=league_db.id)
 
@@ -90,12 +93,13 @@ def update_leagues(league_id_or_acronym):
     league_db.from_dict(cleaned_data)
 
     db.session.commit()
+    invalidate(*entity_tags('league'))
 
     return responses.request_success(f'League {league_db.name} updated', 'api.leagues.get_league', league_id_or_acronym=league_db.id)
 
 
 @leagues.route('/<league_id_or_acronym>/seasons', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=['league', 'season', 'match_type', 'season_division'])
 @arguments(PaginationArgs())
 @response(SeasonsInLeague())
 @authenticate(app_auth)
@@ -121,8 +125,8 @@ def get_league_seasons(pagination, league_id_or_acronym):
 
 
 @leagues.route('/<league_id_or_acronym>/divisions', methods=['GET'])
-@cache.cached(unless=force_refresh)
-@arguments(PaginationArgs())
+@cached(tags=['league', 'division', 'season_division'])
+@arguments(CursorPaginationArgs())
 @response(DivisionsInLeague())
 @authenticate(app_auth)
 @other_responses(unauthorized | not_found)
@@ -133,7 +137,9 @@ def get_league_divisions(pagination, league_id_or_acronym):
 
     league_db = ensure_exists(League, join_method='or', id=league_id_or_acronym, acronym=league_id_or_acronym)
 
-    divisions = Division.to_collection_dict(league_db.divisions, page, per_page, 'api.leagues.get_league_divisions', league_id_or_acronym=league_db.id)
+    divisions = Division.to_collection_dict(league_db.divisions, page, per_page, 'api.leagues.get_league_divisions',
+                                            after=pagination.get('after'), total=pagination['total'],
+                                            league_id_or_acronym=league_db.id)
 
     response_json = {
         'league': league_db.name,
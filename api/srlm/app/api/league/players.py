@@ -1,23 +1,26 @@
 """Endpoints relating to Players"""
 from datetime import datetime, timezone
 
-from apifairy import arguments, response, authenticate, other_responses, body
+from apifairy import arguments, authenticate, other_responses, body
 from flask import request, Blueprint, url_for
 import sqlalchemy as sa
 from sqlalchemy import func
 
-from api.srlm.app import db, cache
+from api.srlm.app import db
 from api.srlm.app.api import bp
 from api.srlm.app.api.utils import responses
 from api.srlm.app.api.auth.utils import app_auth
-from api.srlm.app.api.utils.cache import force_refresh
+from api.srlm.app.api.utils.cache import cached, invalidate, entity_tags
 from api.srlm.app.api.utils.errors import BadRequest, ResourceNotFound
 from api.srlm.app.api.utils.functions import ensure_exists, force_fields, force_unique, clean_data
 from api.srlm.app.fairy.errors import unauthorized, not_found, bad_request
-from api.srlm.app.fairy.schemas import PaginationArgs, PlayerSchema, PlayerCollection, LinkSuccessSchema, \
-    EditPlayerSchema, PlayerTeams, PlayerSeasons, CurrentFilterSchema, PlayerStatsSchema, StatsFilterSchema
-from api.srlm.app.models import Player, SeasonDivision, Team, PlayerTeam, FreeAgent, PlayerMatchData, Match, Lobby, \
-    MatchData, Season, Division
+from api.srlm.app.serializers import response
+from api.srlm.app.fairy.schemas import CursorPaginationArgs, PlayerSchema, PlayerCollection, LinkSuccessSchema, \
+    EditPlayerSchema, PlayerTeams, PlayerSeasons, CurrentFilterSchema, PlayerStatsSchema, StatsFilterSchema, \
+    BatchArgs, PlayerBatch, PlayerExpandArgs, PlayerFieldsArgs
+from api.srlm.app.models import Player, SeasonDivision, Team, PlayerTeam, FreeAgent, Season, Division, \
+    PlayerSeasonStats
+from api.srlm.app.rosters import invalidate_season_intervals
 from api.srlm.logger import get_logger
 log = get_logger(__name__)
 
@@ -27,27 +30,59 @@ bp.register_blueprint(players, url_prefix='/players')
 
 
 @players.route('/<int:player_id>', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=['player:{player_id}', 'team', 'season', 'division', 'user'])
+@arguments(PlayerExpandArgs())
+@arguments(PlayerFieldsArgs())
 @response(PlayerSchema())
 @authenticate(app_auth)
 @other_responses(unauthorized | not_found)
-def get_player(player_id):
-    """Get details of a player"""
-    player = ensure_exists(Player, id=player_id)
-    return player.to_dict()
+def get_player(expand_args, fields_args, player_id):
+    """Get details of a player
+    Related resources can be embedded under `_embedded` with comma separated names in `expand`. Valid values are:
+    "current_team".
+    Pass comma separated names in `fields` to render only those fields (plus the self link), e.g.
+    `?fields=id,player_name`. The queries behind fields that aren't requested are skipped
+    """
+    expand = expand_args['expand']
+    fields = fields_args['fields']
+    options = Player.sparse_options(fields) + Player.expansion_options(expand)
+    player = ensure_exists(Player, id=player_id, options=options)
+    return player.to_expanded_dict(expand, fields)
 
 
 @players.route('', methods=['GET'])
-@cache.cached(unless=force_refresh)
-@arguments(PaginationArgs())
+@cached(tags=['player', 'team', 'season', 'division', 'user'])
+@arguments(CursorPaginationArgs())
+@arguments(PlayerExpandArgs())
+@arguments(PlayerFieldsArgs())
 @response(PlayerCollection())
 @authenticate(app_auth)
 @other_responses(unauthorized)
-def get_players(pagination):
-    """Get the collection of all players"""
+def get_players(pagination, expand_args, fields_args):
+    """Get the collection of all players
+    Related resources can be embedded with `expand`, and `fields` limits the rendered fields, as in Get details of a
+    player"""
     page = pagination['page']
     per_page = pagination['per_page']
-    return Player.to_collection_dict(sa.select(Player), page, per_page, 'api.players.get_players')
+    return Player.to_collection_dict(sa.select(Player), page, per_page, 'api.players.get_players',
+                                     after=pagination.get('after'), total=pagination['total'],
+                                     expand=expand_args['expand'], fields=fields_args['fields'])
+
+
+@players.route('/batch', methods=['GET'])
+@cached(tags=['player', 'player:{ids}', 'team', 'season', 'division', 'user'])
+@arguments(BatchArgs())
+@arguments(PlayerExpandArgs())
+@arguments(PlayerFieldsArgs())
+@response(PlayerBatch())
+@authenticate(app_auth)
+@other_responses(unauthorized | bad_request)
+def get_players_batch(args, expand_args, fields_args):
+    """Get many players by id in one call
+    Pass up to 100 comma separated ids, e.g. `?ids=1,2,3`. Players are keyed by id, ids that don't exist are listed
+    in missing. Related resources can be embedded with `expand`, and `fields` limits the rendered fields, as in Get
+    details of a player"""
+    return Player.to_batch_dict(args['ids'], expand_args['expand'], fields_args['fields'])
 
 
 @players.route('', methods=['POST'])
@@ -75,6 +110,7 @@ def new_player():
 
     db.session.add(player)
     db.session.commit()
+    invalidate(*entity_tags('player'), f'season_division:{player.first_season_id}')
 
     return responses.create_success(f"Player {player.player_name} created", 'api.players.get_player', player_id=player.id)
 
@@ -99,14 +135,17 @@ def update_player(player_id):
     if 'first_season_id' in cleaned_data:
         ensure_exists(SeasonDivision, id=cleaned_data['first_season_id'])
 
+    previous_season_id = player.first_season_id
     player.from_dict(cleaned_data)
     db.session.commit()
+    invalidate(*entity_tags('player', player.id), f'season_division:{previous_season_id}',
+               f'season_division:{player.first_season_id}')
 
     return responses.request_success(f"Player {player.player_name} updated", 'api.players.get_player', player_id=player.id)
 
 
 @players.route('/<int:player_id>/teams', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=['player:{player_id}', 'team'])
 @arguments(CurrentFilterSchema())
 @response(PlayerTeams())
 @authenticate(app_auth)
@@ -125,7 +164,7 @@ def get_player_teams(search_filter, player_id):
 
 
 @players.route('/<int:player_id>/stats', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=['player:{player_id}', 'team', 'season', 'division'], lock=True, stale=60, early_refresh=1)
 @arguments(StatsFilterSchema())
 @response(PlayerStatsSchema())
 @authenticate(app_auth)
@@ -150,51 +189,18 @@ def get_player_stats(search_filters, player_id):
         division = ensure_exists(Division, id=division_id)
         sd_filters['division_id'] = division_id
 
-    filters = {
-        'player_id': player.id
-    }
-    if 'team_id' in search_filters:
+    filters = [PlayerSeasonStats.player_id == player.id]
+    if 'team' in search_filters:
         team = ensure_exists(Team, id=search_filters['team'])
-        filters['team_id'] = search_filters['team']
-
-    season_divisions = db.session.query(SeasonDivision).filter_by(**sd_filters)
-    sd_ids = [sd.id for sd in season_divisions]
-
-    sd_match_query = db.session.query(Match).filter(Match.season_division_id.in_(sd_ids))
-    sd_matches = [sd.id for sd in sd_match_query]
-
-    lobby_query = db.session.query(Lobby).filter(Lobby.match_id.in_(sd_matches))
-    lobbies = [lb.id for lb in lobby_query]
+        filters.append(PlayerSeasonStats.team_id == team.id)
 
-    match_data_query = db.session.query(MatchData).filter(
-        MatchData.accepted == True,
-        MatchData.lobby_id.in_(lobbies)
+    stats_query = db.session.query(
+        *[func.sum(getattr(PlayerSeasonStats, field)).label(field) for field in PlayerSeasonStats.stat_fields]
     )
-    filtered_matches = [match.id for match in match_data_query]
-
-    stats = db.session.query(PlayerMatchData).with_entities(
-        func.sum(PlayerMatchData.goals).label("goals"),
-        func.max(PlayerMatchData.shots).label("shots"),
-        func.max(PlayerMatchData.assists).label("assists"),
-        func.max(PlayerMatchData.saves).label("saves"),
-        func.max(PlayerMatchData.primary_assists).label("primary_assists"),
-        func.max(PlayerMatchData.secondary_assists).label("secondary_assists"),
-        func.max(PlayerMatchData.passes).label("passes"),
-        func.max(PlayerMatchData.blocks).label("blocks"),
-        func.max(PlayerMatchData.takeaways).label("takeaways"),
-        func.max(PlayerMatchData.turnovers).label("turnovers"),
-        func.max(PlayerMatchData.game_winning_goals).label("game_winning_goals"),
-        func.max(PlayerMatchData.overtime_goals).label("overtime_goals"),
-        func.max(PlayerMatchData.post_hits).label("post_hits"),
-        func.max(PlayerMatchData.faceoffs_won).label("faceoffs_won"),
-        func.max(PlayerMatchData.faceoffs_lost).label("faceoffs_lost"),
-        func.max(PlayerMatchData.score).label("score"),
-        func.max(PlayerMatchData.possession_time_sec).label("possession_time_sec")
-    ).filter_by(
-        **filters
-    ).filter(
-        PlayerMatchData.match_id.in_(filtered_matches)
-    ).first()
+    if sd_filters:
+        stats_query = stats_query.join(SeasonDivision, PlayerSeasonStats.season_division_id == SeasonDivision.id)
+        filters += [getattr(SeasonDivision, field) == value for field, value in sd_filters.items()]
+    stats = stats_query.filter(*filters).first()
 
     response_json = {
         'player': player.to_dict(),
@@ -215,7 +221,7 @@ def get_player_stats(search_filters, player_id):
             'faceoffs_won': stats.faceoffs_won,
             'faceoffs_lost': stats.faceoffs_lost,
             'score': stats.score,
-            'possession_time_sec': stats.goals
+            'possession_time_sec': stats.possession_time_sec
         },
         'season': season.name if season else None,
         'division': division.name if division else None,
@@ -261,6 +267,8 @@ def register_player_team(player_id):
 
     db.session.add(player_team)
     db.session.commit()
+    invalidate_season_intervals()
+    invalidate(*entity_tags('player', player.id), *entity_tags('team', team.id))
 
     return responses.request_success(f'Player {player.player_name} registered to team {team.name}', 'api.players.get_team', team_id=team.id)
 
@@ -284,13 +292,15 @@ def deregister_player_team(player_id):
     current_team.end_date = datetime.now(timezone.utc)
 
     db.session.commit()
+    invalidate_season_intervals()
+    invalidate(*entity_tags('player', player.id), *entity_tags('team', current_team.team_id))
 
     return responses.request_success(f'Player {player.player_name} de-registered from team '
                                      f'{current_team.team.name}', 'api.players.get_player', player_id=player.id)
 
 
 @players.route('/<int:player_id>/free_agent', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=['player:{player_id}', 'season', 'division', 'league'])
 @response(PlayerSeasons())
 @authenticate(app_auth)
 @other_responses(unauthorized | not_found)
@@ -340,6 +350,8 @@ def register_player_free_agent(player_id):
 
     db.session.add(free_agent)
     db.session.commit()
+    # free agent counts of season divisions and the free_agent_seasons of players are in the collections too
+    invalidate(*entity_tags('player', player.id), *entity_tags('season_division', season_division.id))
 
     return responses.request_success(f"Player {player.player_name} registered as a Free Agent to "
                                      f"{season_division.get_readable_name()} ({season_division.season.league.acronym})",
@@ -347,7 +359,7 @@ def register_player_free_agent(player_id):
 
 
 @players.route('/<int:player_id>/awards', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=['player:{player_id}'])
 def get_player_awards(player_id):  # TODO
     pass
 
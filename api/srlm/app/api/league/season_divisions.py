@@ -1,18 +1,21 @@
 """Endpoints Relating to SeasonDivisions"""
-from apifairy import authenticate, other_responses, response, body, arguments
+from apifairy import authenticate, other_responses, body, arguments
 
-from api.srlm.app import db, cache
+from api.srlm.app import db
 from api.srlm.app.api import bp
 from api.srlm.app.api.utils import responses
 from flask import request, Blueprint
 
-from api.srlm.app.api.utils.cache import force_refresh
+from api.srlm.app.api.utils.cache import cached, invalidate, entity_tags
 from api.srlm.app.api.utils.errors import ResourceNotFound, BadRequest
 from api.srlm.app.api.utils.functions import ensure_exists, force_fields
 from api.srlm.app.fairy.errors import unauthorized, not_found, bad_request
+from api.srlm.app.serializers import response
 from api.srlm.app.fairy.schemas import LinkSuccessSchema, SeasonDivisionSchema, SeasonDivisionTeams, \
-    SeasonDivisionFreeAgents, SeasonDivisionRookies, SeasonDivisionMatches, UnplayedFilterSchema
-from api.srlm.app.models import SeasonDivision, FreeAgent, Season, Division
+    SeasonDivisionFreeAgents, SeasonDivisionRookies, SeasonDivisionMatches, UnplayedFilterSchema, \
+    SeasonDivisionStandings, MatchExpandArgs, ExportArgs
+from api.srlm.app.models import SeasonDivision, FreeAgent, Season, Division, MatchData, PlayerMatchData
+from api.srlm.app.exports import stream_export
 from api.srlm.app.api.auth.utils import app_auth
 
 # create a new logger for this module
@@ -23,9 +26,12 @@ log = get_logger(__name__)
 season_division = Blueprint('season_division', __name__)
 bp.register_blueprint(season_division, url_prefix='/season_division')
 
+# every season division response includes the season, division and league names
+SEASON_DIVISION_TAGS = ['season_division:{season_division_id}', 'season', 'division', 'league']
+
 
 @season_division.route('/<int:season_division_id>', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=SEASON_DIVISION_TAGS)
 @response(SeasonDivisionSchema())
 @authenticate(app_auth)
 @other_responses(unauthorized | not_found)
@@ -59,13 +65,14 @@ def add_season_division():
     season_division_db.division = division
     db.session.add(season_division_db)
     db.session.commit()
+    invalidate(*entity_tags('season_division'))
 
     return responses.create_success(f'{season_division_db.get_readable_name()} created.',
                                     'api.season_division.get_season_division', season_division_id=season_division_db.id)
 
 
 @season_division.route('/<int:season_division_id>/teams', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=SEASON_DIVISION_TAGS + ['team'])
 @response(SeasonDivisionTeams())
 @authenticate(app_auth)
 @other_responses(unauthorized | not_found)
@@ -80,7 +87,7 @@ def get_teams_in_season_division(season_division_id):
 
 
 @season_division.route('/<int:season_division_id>/rookies', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=SEASON_DIVISION_TAGS + ['player', 'team'])
 @response(SeasonDivisionRookies())
 @authenticate(app_auth)
 @other_responses(unauthorized | not_found)
@@ -93,7 +100,7 @@ def get_rookies_in_season_division(season_division_id):
 
 
 @season_division.route('/<int:season_division_id>/free_agents', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=SEASON_DIVISION_TAGS + ['player'])
 @response(SeasonDivisionFreeAgents())
 @authenticate(app_auth)
 @other_responses(unauthorized)
@@ -110,22 +117,62 @@ def get_free_agents_in_season_division(season_division_id):
 
 
 @season_division.route('/<int:season_division_id>/matches', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=SEASON_DIVISION_TAGS + ['match', 'team', 'player'], lock=True, stale=60, early_refresh=1)
 @arguments(UnplayedFilterSchema())
+@arguments(MatchExpandArgs())
 @response(SeasonDivisionMatches())
 @authenticate(app_auth)
 @other_responses(unauthorized | not_found)
-def get_matches_in_season_division(search_filter, season_division_id):
-    """Get a list of matches in a Season Division"""
+def get_matches_in_season_division(search_filter, expand_args, season_division_id):
+    """Get a list of matches in a Season Division
+    Related resources can be embedded with `expand` as in Get details of a match"""
     season_division_db = ensure_exists(SeasonDivision, id=season_division_id)
-    unplayed = search_filter.get('unplayed', False, bool)
+    unplayed = search_filter.get('unplayed', False)
 
-    matches = season_division_db.get_matches_dict(unplayed)
+    matches = season_division_db.get_matches_dict(unplayed, expand_args['expand'])
 
     return matches
 
 
+@season_division.route('/<int:season_division_id>/standings', methods=['GET'])
+@cached(tags=SEASON_DIVISION_TAGS + ['team'])
+@response(SeasonDivisionStandings())
+@authenticate(app_auth)
+@other_responses(unauthorized | not_found)
+def get_season_division_standings(season_division_id):
+    """Get the standings of a Season Division"""
+    season_division_db = ensure_exists(SeasonDivision, id=season_division_id)
+
+    return season_division_db.get_standings_dict()
+
+
+@season_division.route('/<int:season_division_id>/export/match_data', methods=['GET'])
+@arguments(ExportArgs())
+@authenticate(app_auth)
+@other_responses(unauthorized | not_found | bad_request)
+def export_season_division_match_data(export_args, season_division_id):
+    """Export the match data of a Season Division
+    Streams every period of its matches as newline delimited JSON (`format=ndjson`) or CSV (`format=csv`).
+    Only accepted periods are included unless `accepted=false`"""
+    ensure_exists(SeasonDivision, id=season_division_id)
+    statement = MatchData.export_select([season_division_id], export_args['accepted'])
+    return stream_export(statement, export_args['format'], f'season_division_{season_division_id}_match_data')
+
+
+@season_division.route('/<int:season_division_id>/export/player_match_data', methods=['GET'])
+@arguments(ExportArgs())
+@authenticate(app_auth)
+@other_responses(unauthorized | not_found | bad_request)
+def export_season_division_player_match_data(export_args, season_division_id):
+    """Export the player match data of a Season Division
+    Streams the stats of every player in each period of its matches as newline delimited JSON (`format=ndjson`) or
+    CSV (`format=csv`). Only accepted periods are included unless `accepted=false`"""
+    ensure_exists(SeasonDivision, id=season_division_id)
+    statement = PlayerMatchData.export_select([season_division_id], export_args['accepted'])
+    return stream_export(statement, export_args['format'], f'season_division_{season_division_id}_player_match_data')
+
+
 @season_division.route('/<int:season_division_id>/finals', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=SEASON_DIVISION_TAGS)
 def get_finals_in_season_division(season_division_id):
     pass
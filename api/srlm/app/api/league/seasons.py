@@ -1,18 +1,21 @@
 """Endpoints relating to Seasons"""
-from apifairy import arguments, body, response, authenticate, other_responses
+from apifairy import arguments, body, authenticate, other_responses
 
-from api.srlm.app import db, cache
+from api.srlm.app import db
 from api.srlm.app.api import bp
 from api.srlm.app.api.utils import responses
 from flask import request, Blueprint
 
-from api.srlm.app.api.utils.cache import force_refresh
+from api.srlm.app.api.utils.cache import cached, invalidate, entity_tags
 from api.srlm.app.api.utils.functions import force_fields, clean_data, force_unique, ensure_exists, \
     force_date_format
 from api.srlm.app.fairy.errors import unauthorized, not_found, bad_request
-from api.srlm.app.fairy.schemas import PaginationArgs, SeasonSchema, LinkSuccessSchema, SeasonCollection, \
-    DivisionsInSeason
-from api.srlm.app.models import Season, League, SeasonDivision, Matchtype
+from api.srlm.app.serializers import response
+from api.srlm.app.fairy.schemas import CursorPaginationArgs, SeasonSchema, LinkSuccessSchema, SeasonCollection, \
+    DivisionsInSeason, ExportArgs
+from api.srlm.app.models import Season, League, SeasonDivision, Matchtype, MatchData, PlayerMatchData
+from api.srlm.app.exports import stream_export
+from api.srlm.app.rosters import invalidate_season_intervals
 from api.srlm.app.api.auth.utils import app_auth
 import sqlalchemy as sa
 
@@ -26,8 +29,8 @@ bp.register_blueprint(seasons, url_prefix='/seasons')
 
 
 @seasons.route('', methods=['GET'])
-@cache.cached(unless=force_refresh)
-@arguments(PaginationArgs())
+@cached(tags=['season', 'league', 'match_type', 'season_division'])
+@arguments(CursorPaginationArgs())
 @response(SeasonCollection())
 @authenticate(app_auth)
 @other_responses(unauthorized)
@@ -35,11 +38,12 @@ def get_seasons(pagination):
     """Get the collection of all seasons"""
     page = pagination['page']
     per_page = pagination['per_page']
-    return Season.to_collection_dict(sa.select(Season), page, per_page, 'api.seasons.get_seasons')
+    return Season.to_collection_dict(sa.select(Season), page, per_page, 'api.seasons.get_seasons',
+                                     after=pagination.get('after'), total=pagination['total'])
 
 
 @seasons.route('/<int:season_id>', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=['season', 'league', 'match_type', 'season_division'])
 @response(SeasonSchema())
 @authenticate(app_auth)
 @other_responses(unauthorized | not_found)
@@ -81,6 +85,7 @@ def add_season():
 
     db.session.add(season)
     db.session.commit()
+    invalidate(*entity_tags('season'))
 
     return responses.create_success(f'{season.league.acronym} {season.name} added', 'api.seasons.get_season', season_id=season.id)
 
@@ -108,13 +113,15 @@ def update_season(season_id):
     season.from_dict(cleaned_data)
 
     db.session.commit()
+    invalidate_season_intervals(season.id)
+    invalidate(*entity_tags('season'))
 
     return responses.request_success(f'Season {season.name} updated', 'api.seasons.get_season', season_id=season.id)
 
 
 @seasons.route('/<int:season_id>/divisions', methods=['GET'])
-@cache.cached(unless=force_refresh)
-@arguments(PaginationArgs())
+@cached(tags=['season', 'division', 'league', 'season_division', 'team', 'player', 'match'])
+@arguments(CursorPaginationArgs())
 @response(DivisionsInSeason())
 @authenticate(app_auth)
 @other_responses(unauthorized | not_found)
@@ -125,7 +132,9 @@ def get_divisions_in_season(pagination, season_id):
 
     season = ensure_exists(Season, id=season_id)
 
-    divisions = SeasonDivision.to_collection_dict(season.division_association, page, per_page, 'api.seasons.get_divisions_in_season', season_id=season_id)
+    divisions = SeasonDivision.to_collection_dict(season.division_association, page, per_page,
+                                                  'api.seasons.get_divisions_in_season', after=pagination.get('after'),
+                                                  total=pagination['total'], season_id=season_id)
 
     response_json = {
         'season': season.name,
@@ -135,3 +144,31 @@ def get_divisions_in_season(pagination, season_id):
     response_json.update(divisions)
 
     return response_json
+
+
+@seasons.route('/<int:season_id>/export/match_data', methods=['GET'])
+@arguments(ExportArgs())
+@authenticate(app_auth)
+@other_responses(unauthorized | not_found | bad_request)
+def export_season_match_data(export_args, season_id):
+    """Export the match data of a Season
+    Streams every period of the matches in all of its divisions as newline delimited JSON (`format=ndjson`) or CSV
+    (`format=csv`). Only accepted periods are included unless `accepted=false`"""
+    ensure_exists(Season, id=season_id)
+    season_division_ids = sa.select(SeasonDivision.id).where(SeasonDivision.season_id == season_id)
+    statement = MatchData.export_select(season_division_ids, export_args['accepted'])
+    return stream_export(statement, export_args['format'], f'season_{season_id}_match_data')
+
+
+@seasons.route('/<int:season_id>/export/player_match_data', methods=['GET'])
+@arguments(ExportArgs())
+@authenticate(app_auth)
+@other_responses(unauthorized | not_found | bad_request)
+def export_season_player_match_data(export_args, season_id):
+    """Export the player match data of a Season
+    Streams the stats of every player in each period of the matches in all of its divisions as newline delimited JSON
+    (`format=ndjson`) or CSV (`format=csv`). Only accepted periods are included unless `accepted=false`"""
+    ensure_exists(Season, id=season_id)
+    season_division_ids = sa.select(SeasonDivision.id).where(SeasonDivision.season_id == season_id)
+    statement = PlayerMatchData.export_select(season_division_ids, export_args['accepted'])
+    return stream_export(statement, export_args['format'], f'season_{season_id}_player_match_data')
@@ -1,21 +1,21 @@
 """Endpoints relating to Teams"""
-from datetime import datetime, timezone
+from apifairy import arguments, authenticate, other_responses, body
 
-from apifairy import arguments, response, authenticate, other_responses, body
-
-from api.srlm.app import db, cache
+from api.srlm.app import db
 from api.srlm.app.api import bp
 from api.srlm.app.api.utils import responses
 from flask import request, url_for, Blueprint
 import sqlalchemy as sa
 
-from api.srlm.app.api.utils.cache import force_refresh
+from api.srlm.app.api.utils.cache import cached, invalidate, entity_tags
 from api.srlm.app.api.utils.errors import ResourceNotFound, BadRequest
 from api.srlm.app.api.utils.functions import ensure_exists, force_fields, force_unique, clean_data
 from api.srlm.app.fairy.errors import unauthorized, not_found, bad_request
-from api.srlm.app.fairy.schemas import PaginationArgs, TeamCollection, TeamSchema, LinkSuccessSchema, EditTeamSchema, \
-    TeamPlayers, TeamSeasonPlayers, TeamSeasons, CurrentFilterSchema
-from api.srlm.app.models import Team, SeasonDivision, PlayerTeam
+from api.srlm.app.serializers import response
+from api.srlm.app.fairy.schemas import CursorPaginationArgs, TeamCollection, TeamSchema, LinkSuccessSchema, EditTeamSchema, \
+    TeamPlayers, TeamSeasonPlayers, TeamSeasons, CurrentFilterSchema, BatchArgs, TeamBatch, TeamFieldsArgs
+from api.srlm.app.models import Team, SeasonDivision, PlayerTeam, Player
+from api.srlm.app.rosters import season_intervals
 from api.srlm.app.api.auth.utils import app_auth
 
 # create a new logger for this module
@@ -28,27 +28,50 @@ bp.register_blueprint(teams, url_prefix='/teams')
 
 
 @teams.route('', methods=['GET'])
-@cache.cached(unless=force_refresh)
-@arguments(PaginationArgs())
+@cached(tags=['team', 'player'])
+@arguments(CursorPaginationArgs())
+@arguments(TeamFieldsArgs())
 @response(TeamCollection())
 @authenticate(app_auth)
 @other_responses(unauthorized)
-def get_teams(pagination):
-    """Get the collection of all teams"""
+def get_teams(pagination, fields_args):
+    """Get the collection of all teams
+    `fields` limits the rendered fields as in Get details of a team"""
     page = pagination['page']
     per_page = pagination['per_page']
-    return Team.to_collection_dict(sa.select(Team), page, per_page, 'api.teams.get_teams')
+    return Team.to_collection_dict(sa.select(Team), page, per_page, 'api.teams.get_teams',
+                                   after=pagination.get('after'), total=pagination['total'],
+                                   fields=fields_args['fields'])
+
+
+@teams.route('/batch', methods=['GET'])
+@cached(tags=['team', 'team:{ids}', 'player'])
+@arguments(BatchArgs())
+@arguments(TeamFieldsArgs())
+@response(TeamBatch())
+@authenticate(app_auth)
+@other_responses(unauthorized | bad_request)
+def get_teams_batch(args, fields_args):
+    """Get many teams by id in one call
+    Pass up to 100 comma separated ids, e.g. `?ids=1,2,3`. Teams are keyed by id, ids that don't exist are listed in
+    missing. `fields` limits the rendered fields as in Get details of a team"""
+    return Team.to_batch_dict(args['ids'], fields=fields_args['fields'])
 
 
 @teams.route('/<int:team_id>', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=['team:{team_id}'])
+@arguments(TeamFieldsArgs())
 @response(TeamSchema())
 @authenticate(app_auth)
 @other_responses(unauthorized | not_found)
-def get_team(team_id):
-    """Get details of a team"""
-    team = ensure_exists(Team, id=team_id)
-    return team.to_dict()
+def get_team(fields_args, team_id):
+    """Get details of a team
+    Pass comma separated names in `fields` to render only those fields (plus the self link), e.g. `?fields=id,name`.
+    The queries behind fields that aren't requested are skipped
+    """
+    fields = fields_args['fields']
+    team = ensure_exists(Team, id=team_id, options=Team.sparse_options(fields))
+    return team.to_sparse_dict(fields)
 
 
 @teams.route('', methods=['POST'])
@@ -76,6 +99,7 @@ def add_team():
 
     db.session.add(team)
     db.session.commit()
+    invalidate(*entity_tags('team'))
 
     return responses.create_success(f'Team {team.name} created', 'api.teams.get_team', team_id=team.id)
 
@@ -99,12 +123,13 @@ def update_team(team_id):
     cleaned_data = clean_data(data, valid_fields)
     team.from_dict(cleaned_data)
     db.session.commit()
+    invalidate(*entity_tags('team', team.id))
 
     return responses.request_success(f'Team {team.name} updated', 'api.teams.get_team', team_id=team.id)
 
 
 @teams.route('/<int:team_id>/players', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=['team:{team_id}', 'player'])
 @arguments(CurrentFilterSchema())
 @response(TeamPlayers())
 @authenticate(app_auth)
@@ -120,7 +145,7 @@ def get_team_players(search_filter, team_id):
 
 
 @teams.route('/<int:team_id>/players/season/<int:season_division_id>', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=['team:{team_id}', 'player', 'season'])
 @response(TeamSeasonPlayers())
 @authenticate(app_auth)
 @other_responses(unauthorized | not_found)
@@ -131,25 +156,22 @@ def get_team_players_in_season(team_id, season_division_id):
     # get season_division
     season_division = ensure_exists(SeasonDivision, id=season_division_id)
 
-    # query the teams playerlist for players active during the season
-    # uses (player_start_date is earlier than season_end) and (player_end_date is later than season_start)
-    season_start = datetime.combine(season_division.season.start_date, datetime.min.time()).replace(tzinfo=timezone.utc)
-    season_end = datetime.combine(season_division.season.end_date, datetime.min.time()).replace(tzinfo=timezone.utc)
+    # players on the team at any point during the season, from the cached season roster intervals
+    members = season_intervals(season_division.season_id).members(team.id)
+    player_names = dict(db.session.execute(
+        sa.select(Player.id, Player.player_name).where(Player.id.in_([member[0] for member in members]))).all())
 
     players = {}
-    for player_assoc in team.player_association:
-        player_start_date = player_assoc.start_date.replace(tzinfo=timezone.utc)
-        player_end_date = player_assoc.end_date.replace(tzinfo=timezone.utc) if player_assoc.end_date is not None else None
-        if player_start_date < season_end and (player_end_date is None or player_end_date > season_start):
-            player = {
-                'name': player_assoc.player.player_name,
-                'start_date': player_assoc.start_date,
-                'end_date': player_assoc.end_date,
-                '_links': {
-                    'self': url_for('api.players.get_player', player_id=player_assoc.player.id)
-                }
+    for player_id, start_date, end_date in members:
+        player = {
+            'name': player_names[player_id],
+            'start_date': start_date,
+            'end_date': end_date,
+            '_links': {
+                'self': url_for('api.players.get_player', player_id=player_id)
             }
-            players[player_assoc.player.id] = player
+        }
+        players[player_id] = player
 
     response_json = {
         'season_division': f'{season_division.get_readable_name()} ({season_division.season.league.acronym})',
@@ -166,7 +188,7 @@ def get_team_players_in_season(team_id, season_division_id):
 
 
 @teams.route('/<int:team_id>/seasons', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=['team:{team_id}', 'season', 'division', 'league'])
 @response(TeamSeasons())
 @authenticate(app_auth)
 @other_responses(unauthorized | not_found)
@@ -208,6 +230,8 @@ def register_team_season(team_id):
     # register team
     team.season_divisions.append(season_division)
     db.session.commit()
+    # team counts of season divisions and the seasons_played of teams are in the collections too
+    invalidate(*entity_tags('team', team.id), *entity_tags('season_division', season_division.id))
 
     return responses.request_success(f'Team {team.name} registered to {season_division.get_readable_name()}',
                                      'api.season_division.get_season_division', season_division_id=season_division.id)
@@ -232,18 +256,20 @@ def deregister_team_season(team_id, season_division_id):
 
     team.season_divisions.remove(season_division)
     db.session.commit()
+    # team counts of season divisions and the seasons_played of teams are in the collections too
+    invalidate(*entity_tags('team', team.id), *entity_tags('season_division', season_division.id))
 
     return responses.request_success(f'Team {team.name} de-registered from {season_division.get_readable_name()}',
                                      'api.season_division.get_season_division', season_division_id=season_division.id)
 
 
 @teams.route('/<int:team_id>/awards', methods=['GET'])
-@cache.cached(unless=force_refresh)
+@cached(tags=['team:{team_id}'])
 def get_team_awards(team_id):  # TODO
     pass
 
 
 @teams.route('/<int:team_id>/awards', methods=['POST'])
-@cache.cached(unless=force_refresh)
+@cached()
 def give_team_award(team_id):  # TODO
     pass
@@ -1,13 +1,15 @@
 """Endpoints for managing Discord linking"""
-from apifairy import body, response, authenticate, other_responses
+from apifairy import body, authenticate, other_responses
 from flask import request, Blueprint
 from api.srlm.app import db
 from api.srlm.app.api.users import users_bp
-from api.srlm.app.api.auth.utils import user_auth, get_bearer_token, dual_auth, app_auth
+from api.srlm.app.api.auth.utils import user_auth, get_bearer_token, dual_auth, app_auth, check_user_token
 from api.srlm.app.api.utils import responses
+from api.srlm.app.api.utils.cache import invalidate
 from api.srlm.app.api.utils.errors import ResourceNotFound, UserAuthError, BadRequest
 from api.srlm.app.api.utils.functions import ensure_exists, force_fields
 from api.srlm.app.fairy.errors import unauthorized, not_found, bad_request
+from api.srlm.app.serializers import response
 from api.srlm.app.fairy.schemas import DiscordSchema, LinkSuccessSchema, UpdateDiscordSchema
 from api.srlm.app.models import User, Discord
 
@@ -26,7 +28,7 @@ def get_user_discord(user_id):
     user = ensure_exists(User, id=user_id)
 
     authenticated = False
-    if user is User.check_token(user_token):
+    if user is check_user_token(user_token):
         authenticated = True
 
     if user.discord is None:
@@ -65,6 +67,7 @@ def create_user_discord(user_id):
 
     db.session.add(discord_db)
     db.session.commit()
+    invalidate('user')
 
     return responses.create_success('Discord account linked', 'api.users.discord.get_user_discord', user_id=user_id)
 
@@ -121,5 +124,6 @@ def delete_user_discord(user_id):
 
     db.session.query(Discord).filter(Discord.user_id == user.id).delete()
     db.session.commit()
+    invalidate('user')
 
     return responses.request_success('Discord account unlinked', 'api.users.get_user', user_id=user_id)
@@ -1,22 +1,32 @@
 """Endpoints for managing user permissions"""
-from apifairy import body, response, authenticate, other_responses
+from apifairy import body, authenticate, other_responses
 from flask import url_for, request, Blueprint
 from api.srlm.app import db
 from api.srlm.app.api.users import users_bp
 from api.srlm.app.api.auth.utils import app_auth
 from api.srlm.app.api.utils import responses
+from api.srlm.app.api.utils.cache import invalidate
 from api.srlm.app.api.utils.errors import BadRequest, ResourceNotFound
 from api.srlm.app.api.utils.functions import ensure_exists, force_fields
 from api.srlm.app.fairy.errors import unauthorized, not_found, bad_request
+from api.srlm.app.serializers import response
 from api.srlm.app.fairy.schemas import UserPermissionsCollection, UserPermissionsSchema, LinkSuccessSchema, \
     UpdateUserPermissionsSchema, RevokeUserPermission
 from api.srlm.app.models import User, Permission, UserPermissions
+from api.srlm.app.permission_sets import parse_modifiers
 
 
 permissions = Blueprint('permissions', __name__)
 users_bp.register_blueprint(permissions)
 
 
+def check_modifiers(modifiers):
+    try:
+        parse_modifiers(modifiers)
+    except ValueError as e:
+        raise BadRequest(str(e))
+
+
 @permissions.route('/<int:user_id>/permissions', methods=['GET'])
 @response(UserPermissionsCollection())
 @authenticate(app_auth)
@@ -62,10 +72,13 @@ def add_user_permissions(user_id):
 
     if 'modifiers' in data:
         modifiers = data['modifiers']
+        check_modifiers(modifiers)
         user_perm.additional_modifiers = modifiers
 
     db.session.add(user_perm)
+    user.permissions_changed()
     db.session.commit()
+    invalidate('user')
 
     return responses.create_success(f'Permission {user_perm.permssion.key} added to user {user_perm.user.username}', 'api.users.permissions.get_user_permissions', user_id=user_id)
 
@@ -91,7 +104,9 @@ def update_user_permissions(user_id):
     modifiers = data['modifiers']
     if data['modifiers'] == "":
         modifiers = None
+    check_modifiers(modifiers)
     user_perm.additional_modifiers = modifiers
+    user.permissions_changed()
     db.session.commit()
 
     return responses.request_success(f'Permission {user_perm.permssion.key} updated for user {user_perm.user.username}', 'api.users.permissions.get_user_permissions', user_id=user_id)
@@ -116,6 +131,8 @@ def revoke_user_permissions(user_id):
         raise ResourceNotFound(f"User {user.username} does not have the '{permission.key}' permission")
 
     db.session.query(UserPermissions).filter_by(user_id=user.id, permission_id=permission.id).delete()
+    user.permissions_changed()
     db.session.commit()
+    invalidate('user')
 
     return responses.request_success(f'Permission {permission.key} revoked from user {user.username}', 'api.users.permissions.get_user_permissions', user_id=user_id)
@@ -1,18 +1,19 @@
 """Main endpoints relating to Users"""
 import sqlalchemy as sa
-from apifairy import arguments, response, authenticate, other_responses, body
+from apifairy import arguments, authenticate, other_responses, body
 from flask import request, url_for
-from api.srlm.app import db, cache
+from api.srlm.app import db
 from api.srlm.app.api.users import users_bp as users
 from api.srlm.app.api.utils import responses
-from api.srlm.app.api.utils.cache import force_refresh
+from api.srlm.app.api.utils.cache import cached, invalidate
 from api.srlm.app.api.utils.functions import force_fields, force_unique, clean_data, ensure_exists
 from api.srlm.app.fairy.errors import unauthorized, not_found, bad_request
-from api.srlm.app.fairy.schemas import PaginationArgs, TokenSchema, PasswordResetSchema, ChangePasswordSchema, \
+from api.srlm.app.serializers import response
+from api.srlm.app.fairy.schemas import CursorPaginationArgs, TokenSchema, PasswordResetSchema, ChangePasswordSchema, \
     UserSchema, UserCollection, LinkSuccessSchema, UpdateUserSchema
 from api.srlm.app.models import User
 from api.srlm.app.api.utils.errors import UserAuthError, BadRequest, error_response
-from api.srlm.app.api.auth.utils import get_bearer_token, app_auth, dual_auth
+from api.srlm.app.api.auth.utils import get_bearer_token, app_auth, dual_auth, check_user_token
 
 # create a new logger for this module
 from api.srlm.logger import get_logger
@@ -27,7 +28,7 @@ def get_user(user_id):
     """Get a users details"""
     user = ensure_exists(User, id=user_id)
     user_token = get_bearer_token(request.headers)['user']
-    current_user = User.check_token(user_token)
+    current_user = check_user_token(user_token)
 
     include_email = False
 
@@ -38,8 +39,8 @@ def get_user(user_id):
 
 
 @users.route('', methods=['GET'])
-@cache.cached(unless=force_refresh)
-@arguments(PaginationArgs())
+@cached(tags=['user', 'player'])
+@arguments(CursorPaginationArgs())
 @response(UserCollection())
 @authenticate(app_auth)
 @other_responses(unauthorized)
@@ -47,7 +48,8 @@ def get_users(pagination):
     """Get the collection of all users"""
     page = pagination['page']
     per_page = pagination['per_page']
-    return User.to_collection_dict(sa.select(User), page, per_page, 'api.users.get_users')
+    return User.to_collection_dict(sa.select(User), page, per_page, 'api.users.get_users',
+                                   after=pagination.get('after'), total=pagination['total'])
 
 
 @users.route('', methods=['POST'])
@@ -71,6 +73,7 @@ def add_user():
 
     db.session.add(user)
     db.session.commit()
+    invalidate('user')
 
     return responses.create_success(f'User {user.username} added', 'api.users.get_user', user_id=user.id)
 
@@ -94,6 +97,7 @@ def update_user(user_id):
 
     user.from_dict(clean_data(data, valid_fields))
     db.session.commit()
+    invalidate('user')
     return responses.request_success(f'User {user.username} updated', 'api.users.get_user', user_id=user.id)
 
 
@@ -1,12 +1,14 @@
 """Endpoint for linking a users steam account"""
-from apifairy import body, response, authenticate, other_responses
+from apifairy import body, authenticate, other_responses
 from flask import request, Blueprint
 from api.srlm.app import db
 from api.srlm.app.api.auth.utils import app_auth
 from api.srlm.app.api.users import users_bp
 from api.srlm.app.api.utils import responses
+from api.srlm.app.api.utils.cache import invalidate, entity_tags
 from api.srlm.app.api.utils.functions import ensure_exists, force_fields
 from api.srlm.app.fairy.errors import unauthorized, not_found, bad_request
+from api.srlm.app.serializers import response
 from api.srlm.app.fairy.schemas import LinkSuccessSchema, LinkSteamSchema
 from api.srlm.app.models import User, Player
 from api.srlm.app.spapi.slapid import get_slap_id
@@ -46,6 +48,7 @@ def link_user_steam(user_id):
 
         user.player = player
         db.session.commit()
+        invalidate('user', *entity_tags('player', player.id))
 
         return responses.request_success(f'Player {player.player_name} succesfully linked to user {user.username}', 'api.players.get_player', player_id=player.id)
 
@@ -1,13 +1,14 @@
 """Endpoints for managing Twitch linking"""
-from apifairy import response, authenticate, other_responses, body
+from apifairy import authenticate, other_responses, body
 from flask import request, Blueprint
 from api.srlm.app import db
 from api.srlm.app.api.users import users_bp
-from api.srlm.app.api.auth.utils import get_bearer_token, dual_auth, app_auth
+from api.srlm.app.api.auth.utils import get_bearer_token, dual_auth, app_auth, check_user_token
 from api.srlm.app.api.utils import responses
 from api.srlm.app.api.utils.errors import ResourceNotFound, UserAuthError, BadRequest
 from api.srlm.app.api.utils.functions import ensure_exists, force_fields, clean_data
 from api.srlm.app.fairy.errors import unauthorized, not_found, bad_request, forbidden
+from api.srlm.app.serializers import response
 from api.srlm.app.fairy.schemas import LinkSuccessSchema, TwitchSchema, UpdateTwitchSchema
 from api.srlm.app.models import User, Twitch
 
@@ -26,7 +27,7 @@ def get_user_twitch(user_id):
     user = ensure_exists(User, id=user_id)
 
     authenticated = False
-    if user is User.check_token(user_token):
+    if user is check_user_token(user_token):
         authenticated = True
 
     if user.twitch is None:
@@ -1,4 +1,19 @@
-from flask import request
+import hashlib
+import math
+import random
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from urllib.parse import urlencode
+from uuid import uuid4
+from flask import request, current_app, make_response
+from api.srlm.app import cache, limiter
+from api.srlm.app.config import Config
+
+# query args that control the cache itself and never change the response
+IGNORED_ARGS = ['cached']
+# set on the WSGI environ by the cache warmer, clients can't send environ keys so this can't be spoofed
+WARM_ENVIRON_KEY = 'srlm.cache_warm'
 
 
 def force_refresh(*args, **kwargs):
@@ -10,3 +25,268 @@ def force_refresh(*args, **kwargs):
         override = True
 
     return override
+
+
+@limiter.request_filter
+def warming():
+    """True for requests made by the cache warmer. These compute and cache responses that are missing or about to expire
+    (see needs_warming) and are not rate limited"""
+    return request.environ.get(WARM_ENVIRON_KEY, False)
+
+
+def normalized_args():
+    """Query args as a canonical string - sorted by name and value, with true/false spelled in lower case"""
+    args = []
+    for key in sorted(request.args):
+        if key in IGNORED_ARGS:
+            continue
+        for value in sorted(request.args.getlist(key)):
+            args.append((key, value.lower() if value.lower() in ('true', 'false') else value))
+    return urlencode(args)
+
+
+def auth_scope(scope):
+    """Hashed identity of the caller for scoped cache keys. 'app' varies by app token, 'user' by app and user token"""
+    # imported here as the auth blueprint imports this module
+    from api.srlm.app.api.auth.utils import get_bearer_token
+    if 'Authorization' not in request.headers:
+        return 'anonymous'
+    tokens = get_bearer_token(request.headers)
+    token = tokens['app'] if scope == 'app' else tokens['app'] + tokens['user']
+    return hashlib.sha256(token.encode()).hexdigest()[:16]
+
+
+def tag_versions(tags):
+    """Current version stamp of each tag, tags that have never been invalidated are given one"""
+    keys = [f'tag/{tag}' for tag in tags]
+    versions = dict(zip(tags, cache.get_many(*keys)))
+    for tag, version in versions.items():
+        if version is None:
+            versions[tag] = new_version()
+            # add() so a version set by another worker in the meantime wins
+            if not cache.add(f'tag/{tag}', versions[tag], timeout=0):
+                versions[tag] = cache.get(f'tag/{tag}') or versions[tag]
+    return versions
+
+
+def new_version():
+    """Tag version - when it was created (for Last-Modified) and a random part so a version is never reused, even after
+    the cache is flushed"""
+    return f'{int(time.time() * 1000):x}.{uuid4().hex[:8]}'
+
+
+def version_time(version):
+    """When a tag version was created, None for versions without a time"""
+    stamp, separator, _ = version.partition('.')
+    if not separator:
+        return None
+    return datetime.fromtimestamp(int(stamp, 16) / 1000, timezone.utc)
+
+
+def entity_tags(kind, *ids):
+    """Tags to invalidate when entities change - the kind tag (for collections) and one tag per id"""
+    return [kind] + [f'{kind}:{entity_id}' for entity_id in ids if entity_id is not None]
+
+
+def format_tags(tags, kwargs):
+    """Formats tags with the view args. A tag with an {ids} field (batch lookups) becomes one tag per id in the ids
+    query arg, e.g. 'match:{ids}' with ?ids=1,2 depends on match:1 and match:2"""
+    formatted = []
+    for tag in tags:
+        if '{ids}' in tag:
+            ids = {int(part) for part in request.args.get('ids', '').split(',') if part.strip().isdigit()}
+            formatted += [tag.format(ids=entity_id, **kwargs) for entity_id in sorted(ids)]
+        else:
+            formatted.append(tag.format(**kwargs))
+    return formatted
+
+
+def invalidate(*tags):
+    """Invalidates every cached response that depends on any of the given tags"""
+    tags = set(tags)
+    if tags:
+        cache.set_many({f'tag/{tag}': new_version() for tag in tags}, timeout=0)
+
+
+def cache_key(scope=None, tags=None):
+    """Builds a make_cache_key function that includes the normalized query args and, if a scope of 'app' or 'user'
+    is given, the caller's tokens. Tags are formatted with the view args (e.g. 'team:{team_id}', see format_tags) and
+    their current versions are part of the key, so invalidating a tag makes every response that depends on it a cache miss"""
+    if scope not in (None, 'app', 'user'):
+        raise ValueError("scope should be either None, 'app' or 'user'")
+
+    def make_cache_key(*args, **kwargs):
+        key = f'view{request.path}'
+        query = normalized_args()
+        if query:
+            key += '?' + hashlib.md5(query.encode()).hexdigest()
+        if scope:
+            key += f'|{scope}:{auth_scope(scope)}'
+        if tags:
+            versions = tag_versions(format_tags(tags, kwargs))
+            key += '#' + hashlib.md5('|'.join(versions[tag] for tag in sorted(versions)).encode()).hexdigest()
+        return key
+
+    return make_cache_key
+
+
+def lock_key(key):
+    return f'lock/{key}'
+
+
+def refresh_early(delta, expires, beta, now):
+    """Probabilistic early refresh - the closer a response is to expiring and the longer it took to compute, the more
+    likely a request is picked to recompute it. With beta=0 responses are only recomputed after they expire"""
+    if not beta:
+        return False
+    return now - delta * beta * math.log(1.0 - random.random()) >= expires
+
+
+def compute_and_store(key, compute, timeout, stale):
+    """Computes a response and caches it with the time it took to compute and when it expires.
+    The cache entry is kept for an extra `stale` seconds so it can be served while it is recomputed"""
+    start = time.time()
+    rv = compute()
+    delta = time.time() - start
+    if timeout:
+        cache.set(key, (rv, delta, start + delta + timeout), timeout=timeout + stale)
+    else:
+        cache.set(key, (rv, delta, math.inf), timeout=0)
+    return rv
+
+
+def recompute(key, compute, timeout, stale):
+    """Recomputes a response holding the lock for it. Returns None if another worker already holds the lock"""
+    lock = lock_key(key)
+    if not cache.add(lock, new_version(), timeout=current_app.config['CACHE_LOCK_TIMEOUT']):
+        return None
+    try:
+        return compute_and_store(key, compute, timeout, stale)
+    finally:
+        cache.delete(lock)
+
+
+def wait_for(key):
+    """Waits for the worker holding the lock to cache the response. Returns None if it doesn't in time"""
+    deadline = time.time() + current_app.config['CACHE_LOCK_WAIT']
+    while time.time() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+        if not cache.has(lock_key(key)):
+            return None
+    return None
+
+
+def needs_warming(key, entry=None):
+    """True if the cache warmer should compute the response for a cache key - it isn't cached, or it was cached with
+    its expiry (single_flight entries) and expires before the next warming run. Responses still cached are left alone,
+    they are invalidated by writes anyway"""
+    if entry is None:
+        return not cache.has(key)
+    return entry[2] - time.time() < current_app.config['CACHE_WARM_INTERVAL']
+
+
+def single_flight(key, compute, timeout, lock, stale, early_refresh):
+    """Serves a cached response, making sure only one worker recomputes it when it is missing, expired or picked for
+    an early refresh. The other workers serve the stale response or, if there is none, wait for the new one"""
+    entry = cache.get(key)
+    if entry is not None:
+        rv, delta, expires = entry
+        if not refresh_early(delta, expires, early_refresh, time.time()) and time.time() < expires:
+            return rv
+        fresh = recompute(key, compute, timeout, stale)
+        return rv if fresh is None else fresh
+
+    if lock:
+        rv = recompute(key, compute, timeout, stale)
+        if rv is not None:
+            return rv
+        rv = wait_for(key)
+        if rv is not None:
+            return rv
+    # no lock, or the worker holding it is taking too long
+    return compute_and_store(key, compute, timeout, stale)
+
+
+def cached(timeout=None, scope=None, tags=None, lock=False, stale=0, early_refresh=0):
+    """Caches a GET endpoint. Responses are keyed by path and query args, so filtered and paginated variants are
+    cached separately. Use scope='app' or scope='user' for responses that differ between callers.
+    Responses with tags are invalidated by writes, so they are kept for CACHE_TAGGED_TIMEOUT instead of the default.
+
+    Expensive endpoints can be protected from stampedes when their response is missing or expires:
+     - lock: only one worker computes a missing response, the others wait up to CACHE_LOCK_WAIT seconds for it
+     - stale: seconds an expired response is still served while one worker recomputes it
+     - early_refresh: how eagerly a single request recomputes the response before it expires (1 is a good default),
+       weighted by how long the response took to compute"""
+    if timeout is None and tags:
+        timeout = Config.CACHE_TAGGED_TIMEOUT
+    make_cache_key = cache_key(scope, tags)
+    if not (lock or stale or early_refresh):
+        def forced_update(*args, **kwargs):
+            return warming() and needs_warming(make_cache_key(*args, **kwargs))
+
+        cache_decorator = cache.cached(timeout=timeout, unless=force_refresh, forced_update=forced_update,
+                                       make_cache_key=make_cache_key)
+        return lambda f: authenticated(conditional(cache_decorator(f), make_cache_key, tags))
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if force_refresh():
+                return f(*args, **kwargs)
+            key = make_cache_key(*args, **kwargs)
+            cache_timeout = current_app.config['CACHE_DEFAULT_TIMEOUT'] if timeout is None else timeout
+            if warming():
+                entry = cache.get(key)
+                if entry is not None and not needs_warming(key, entry):
+                    return entry[0]
+                return compute_and_store(key, lambda: f(*args, **kwargs), cache_timeout, stale)
+            return single_flight(key, lambda: f(*args, **kwargs), cache_timeout, lock, stale, early_refresh)
+        return authenticated(conditional(decorated_function, make_cache_key, tags))
+    return decorator
+
+
+def not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def conditional(f, make_cache_key, tags):
+    """Adds an ETag and Last-Modified to tagged responses and answers If-None-Match/If-Modified-Since with a 304.
+    The ETag is a hash of the cache key, which contains the tag versions, so it changes whenever a tag the response
+    depends on is invalidated. A 304 doesn't call the view, so nothing is queried, rendered or serialized"""
+    if not tags:
+        return f
+
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if warming() or force_refresh():
+            return f(*args, **kwargs)
+        etag = hashlib.md5(make_cache_key(*args, **kwargs).encode()).hexdigest()
+        times = [version_time(version) for version in tag_versions(format_tags(tags, kwargs)).values()]
+        last_modified = max((modified for modified in times if modified is not None), default=None)
+
+        if not_modified(etag, last_modified):
+            response = current_app.response_class(status=304)
+        else:
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        return response
+    return decorated_function
+
+
+def authenticated(f):
+    """Checks the app token before the cache is used, cached responses never reach the view's own @authenticate.
+    Verified tokens are cached per request so the view's check doesn't hit the database again"""
+    # imported here as the auth blueprint imports this module
+    from api.srlm.app.api.auth.utils import app_auth
+    return app_auth.login_required(f)
@@ -5,15 +5,15 @@ from api.srlm.app import db
 from api.srlm.app.api.utils.errors import BadRequest, ResourceNotFound
 
 
-def ensure_exists(model, return_none=False, join_method='and', **kwargs):
+def ensure_exists(model, return_none=False, join_method='and', options=(), **kwargs):
     query = None
     if join_method == 'and':
         fail_message = f'{model.__name__} with {kwargs}'
-        query = db.session.query(model).filter_by(**kwargs).first()
+        query = db.session.query(model).options(*options).filter_by(**kwargs).first()
     elif join_method == 'or':
         fail_message = f"{model.__name__} identified by '{next(iter(kwargs.values()))}'"
         for key in kwargs:
-            query = db.session.query(model).filter_by(**{key: kwargs[key]}).first()
+            query = db.session.query(model).options(*options).filter_by(**{key: kwargs[key]}).first()
             if query:
                 break
     else:
@@ -24,6 +24,9 @@ celery_broker = f"redis://{redis_host}:{redis_port}/0"
 celery_backend = "db+" + base_db_url + "celery"
 
 cache_backend = f"redis://{redis_host}:{redis_port}/1"
+cache_warm_interval = int(os.getenv('CACHE_WARM_INTERVAL', 600))
+# the in-process cache tier is opt-in - it runs an invalidation listener thread in every worker and celery process
+cache_local_size = int(os.getenv('CACHE_LOCAL_SIZE', 0))
 limiter_backend = f"redis://{redis_host}:{redis_port}/2"
 
 
@@ -43,17 +46,42 @@ class Config:
     ADMINS = mailing_list
     CELERY = {
         'broker_url': celery_broker,
-        'result_backend': celery_backend
+        'result_backend': celery_backend,
+        'include': ['api.srlm.app.warming'],
+        'beat_schedule': {
+            'warm-cache': {
+                'task': 'api.srlm.app.warming.warm_cache',
+                'schedule': cache_warm_interval
+            }
+        }
     }
     APIFAIRY_TITLE = 'Slapshot: Rebound - League Manager API'
     APIFAIRY_VERSION = '0.7 - dev'
-    CACHE_TYPE = 'RedisCache'
+    CACHE_TYPE = 'api.srlm.app.local_cache.LocalRedisCache' if cache_local_size > 0 else 'RedisCache'
     CACHE_DEFAULT_TIMEOUT = 300
     CACHE_REDIS_URL = cache_backend
     CACHE_SOURCE_CHECK = True
+    CACHE_TAGGED_TIMEOUT = int(os.getenv('CACHE_TAGGED_TIMEOUT', 21600))
+    CACHE_LOCAL_SIZE = cache_local_size
+    CACHE_LOCAL_TIMEOUT = int(os.getenv('CACHE_LOCAL_TIMEOUT', 30))
+    CACHE_LOCAL_CHANNEL = 'cache-invalidate'
+    CACHE_LOCK_TIMEOUT = int(os.getenv('CACHE_LOCK_TIMEOUT', 30))
+    CACHE_LOCK_WAIT = int(os.getenv('CACHE_LOCK_WAIT', 5))
+    CACHE_WARM_APP = os.getenv('CACHE_WARM_APP', 'cache-warmer')
+    CACHE_WARM_INTERVAL = cache_warm_interval
+    AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', 60))
+    FAST_SERIALIZATION = os.getenv('FAST_SERIALIZATION') is not None
     RATELIMIT_APPLICATION = '50 per minute'
     RATELIMIT_STORAGE_URI = limiter_backend
     RATELIMIT_STRATEGY = 'fixed-window'
     RATELIMIT_HEADERS_ENABLED = True
+    LOBBY_SUPERVISOR_SCAN_INTERVAL = int(os.getenv('LOBBY_SUPERVISOR_SCAN_INTERVAL', 15))
+    LOBBY_MONITOR_CHECK_INTERVAL = int(os.getenv('LOBBY_MONITOR_CHECK_INTERVAL', 10))
+    LOBBY_MONITOR_MAX_TIME = int(os.getenv('LOBBY_MONITOR_MAX_TIME', 60))
+    STANDINGS_POINTS_WIN = int(os.getenv('STANDINGS_POINTS_WIN', 2))
+    STANDINGS_POINTS_OT_WIN = int(os.getenv('STANDINGS_POINTS_OT_WIN', 2))
+    STANDINGS_POINTS_OT_LOSS = int(os.getenv('STANDINGS_POINTS_OT_LOSS', 1))
+    STANDINGS_POINTS_DRAW = int(os.getenv('STANDINGS_POINTS_DRAW', 1))
+    STANDINGS_POINTS_LOSS = int(os.getenv('STANDINGS_POINTS_LOSS', 0))
 
 
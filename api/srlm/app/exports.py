@@ -0,0 +1,53 @@
+"""Streaming exports of large datasets.
+Rows are read through a server-side cursor (yield_per, which streams the results instead of buffering them) and
+written out as newline-delimited JSON or CSV a batch at a time while the response is sent, so memory stays flat however
+many rows are exported. Exports select plain columns, so no instances pile up in the session's identity map"""
+import csv
+import io
+import json
+from datetime import date, datetime
+from flask import Response, stream_with_context
+from api.srlm.app import db
+
+# rows fetched from the cursor, and written to the response, at a time
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+
+def export_value(value):
+    """Dates and times as ISO 8601, like the rest of the API"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def ndjson_chunks(result):
+    for rows in result.mappings().partitions():
+        yield ''.join(json.dumps({key: export_value(value) for key, value in row.items()}) + '\n' for row in rows)
+
+
+def csv_chunks(result):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(result.keys())
+    for rows in result.partitions():
+        writer.writerows([export_value(value) for value in row] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # the header of an empty export
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream_export(statement, export_format, filename):
+    """Response streaming the rows of a select as ndjson or csv. The query runs before the response is returned, so
+    errors in it are still normal error responses"""
+    result = db.session.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+    chunks = csv_chunks(result) if export_format == 'csv' else ndjson_chunks(result)
+    return Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[export_format],
+                    headers={'Content-Disposition': f'attachment; filename={filename}.{export_format}'})
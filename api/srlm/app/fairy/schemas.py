@@ -1,5 +1,7 @@
 """Provides marshmallow schemas for documentation support"""
+from marshmallow import ValidationError, validate
 from api.srlm.app import ma
+from api.srlm.app.pagination import decode_cursor
 from api.srlm.app.models import Permission, Match, Team, MatchResult, MatchReview, PlayerMatchData, MatchData, Discord, \
     Twitch, UserPermissions, User, Division, League, Season, SeasonDivision, Player, FreeAgent, Matchtype
 
@@ -25,6 +27,25 @@ class PaginationArgs(ma.Schema):
     per_page = ma.Int(missing=10)
     total_pages = ma.Int(dump_only=True)
     total_items = ma.Int(dump_only=True)
+    next_cursor = ma.Str(dump_only=True)
+
+
+class Cursor(ma.String):
+    """Opaque keyset pagination cursor, loaded as the position it encodes"""
+    def _deserialize(self, value, attr, data, **kwargs):
+        value = super()._deserialize(value, attr, data, **kwargs)
+        try:
+            return decode_cursor(value)
+        except ValueError as e:
+            raise ValidationError(str(e))
+
+
+class CursorPaginationArgs(PaginationArgs):
+    """Defines pagination args for collections that can also be paged by cursor.
+    Pass `after` (empty for the first page, then the previous page's next_cursor) to page by cursor - every page costs
+    the same as the first. The total is only counted in cursor mode when `total=true`"""
+    after = Cursor()
+    total = ma.Bool(missing=False)
 
 
 class PaginationLinks(Links):
@@ -39,6 +60,69 @@ class Collection(ma.Schema):
     _links = ma.Nested(PaginationLinks())
 
 
+# most ids a batch lookup can ask for
+MAX_BATCH_IDS = 100
+
+
+class IdList(ma.Field):
+    """Comma separated ids, e.g. `1,2,3`, loaded as a list of ints"""
+    def _deserialize(self, value, attr, data, **kwargs):
+        try:
+            return [int(part) for part in str(value).split(',') if part.strip()]
+        except ValueError:
+            raise ValidationError('Ids must be comma separated integers, e.g. 1,2,3')
+
+
+class Expand(ma.Field):
+    """Comma separated names of related resources of the model to embed, e.g. `home_team,away_team`"""
+    def __init__(self, model, **kwargs):
+        self.model = model
+        super().__init__(**kwargs)
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        names = list(dict.fromkeys(part.strip() for part in str(value).split(',') if part.strip()))
+        valid = self.model.expansions()
+        invalid = [name for name in names if name not in valid]
+        if invalid:
+            raise ValidationError(f"Can't expand {', '.join(invalid)} - valid values are {', '.join(valid)}")
+        return names
+
+
+class Fields(ma.Field):
+    """Comma separated names of the fields of the schema to render, e.g. `id,player_name`. Empty renders every field"""
+    def __init__(self, schema, **kwargs):
+        self.schema = schema
+        super().__init__(**kwargs)
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        names = list(dict.fromkeys(part.strip() for part in str(value).split(',') if part.strip()))
+        valid = [name for name in self.schema().dump_fields if not name.startswith('_')]
+        invalid = [name for name in names if name not in valid]
+        if invalid:
+            raise ValidationError(f"Unknown fields {', '.join(invalid)} - valid values are {', '.join(valid)}")
+        return names or None
+
+
+class MatchExpandArgs(ma.Schema):
+    """Defines the related resources that can be embedded in matches"""
+    expand = Expand(Match, missing=list)
+
+
+class PlayerExpandArgs(ma.Schema):
+    """Defines the related resources that can be embedded in players"""
+    expand = Expand(Player, missing=list)
+
+
+class BatchArgs(ma.Schema):
+    """Defines the ids of a batch lookup"""
+    ids = IdList(required=True, validate=validate.Length(min=1, max=MAX_BATCH_IDS))
+
+
+class Batch(ma.Schema):
+    """Defines the structure of batch lookups - found items keyed by id and the ids that don't exist"""
+    missing = ma.List(ma.Int())
+
+
 class CurrentFilterSchema(ma.Schema):
     """Defines filter arg for current"""
     current = ma.Bool()
@@ -56,6 +140,13 @@ class StatsFilterSchema(ma.Schema):
     team = ma.Int()
 
 
+class ExportArgs(ma.Schema):
+    """Defines args of data exports - ndjson (one JSON object per line) or csv, and whether only accepted periods are
+    exported"""
+    format = ma.Str(validate=validate.OneOf(['ndjson', 'csv']), missing='ndjson')
+    accepted = ma.Bool(missing=True)
+
+
 class BasicAuthSchema(ma.Schema):
     """Defines the basic user auth login"""
     username = ma.Str(required=True)
@@ -201,6 +292,16 @@ class TeamCollection(Collection):
     items = ma.List(ma.Nested(TeamSchema()))
 
 
+class TeamFieldsArgs(ma.Schema):
+    """Defines the sparse fieldset of teams"""
+    fields = Fields(TeamSchema, missing=None)
+
+
+class TeamBatch(Batch):
+    """Defines a batch of teams keyed by id"""
+    items = ma.Dict(keys=ma.Int(), values=ma.Nested(TeamSchema()))
+
+
 class MatchResultSchema(ma.SQLAlchemySchema):
     """Defines the structure of MatchResult requests"""
     class Meta:
@@ -270,6 +371,12 @@ class ViewMatchSchema(ma.SQLAlchemySchema):
     current_lobby = ma.Nested(CurrentLobby())
     results = ma.Nested(MatchResultSchema())
     _links = ma.Nested(MatchLinks())
+    _embedded = ma.Nested('MatchEmbedded', dump_only=True)
+
+
+class MatchBatch(Batch):
+    """Defines a batch of Matches keyed by id"""
+    items = ma.Dict(keys=ma.Int(), values=ma.Nested(ViewMatchSchema()))
 
 
 class SimpleMatchSchema(ma.SQLAlchemySchema):
@@ -293,6 +400,7 @@ class SimpleMatchSchema(ma.SQLAlchemySchema):
     scheduled_time = ma.DateTime()
     current_lobby = ma.Nested(CurrentLobby())
     _links = ma.Nested(SimpleMatchLinks())
+    _embedded = ma.Nested('MatchEmbedded', dump_only=True)
 
 
 class NewMatchSchema(ma.SQLAlchemySchema):
@@ -412,6 +520,22 @@ class MatchStatsSchema(ma.Schema):
     periods = ma.List(ma.Nested(MatchPlayerDataSchema()))
 
 
+class MatchScheduleSchema(ma.Schema):
+    """Defines the structure of a match schedule"""
+    scheduled_time = ma.DateTime()
+    home_team_accepted = ma.Bool()
+    away_team_accepted = ma.Bool()
+
+
+class MatchEmbedded(ma.Schema):
+    """Defines the related resources that can be embedded in a match with expand"""
+    home_team = ma.Nested(TeamSchema())
+    away_team = ma.Nested(TeamSchema())
+    results = ma.Nested(MatchResultSchema(), allow_none=True)
+    schedule = ma.Nested(MatchScheduleSchema(), allow_none=True)
+    stats = ma.List(ma.Nested(MatchPlayerDataSchema()))
+
+
 class MatchReviewSchema(MatchStatsSchema):
     """Defines structure of MatchReview requests"""
     flags = ma.List(ma.Nested(MatchFlag()), required=True)
@@ -501,7 +625,7 @@ class UpdateUserSchema(ma.SQLAlchemySchema):
     email = ma.auto_field()
 
 
-class UserCollection(ma.Schema):
+class UserCollection(Collection):
     """Defines the structure of the users collection"""
     items = ma.List(ma.Nested(UserSchema()))
 
@@ -660,6 +784,7 @@ class SeasonDivisionSchema(ma.SQLAlchemySchema):
         rookies = ma.URL()
         matches = ma.URL()
         finals = ma.URL()
+        standings = ma.URL()
 
     season_id = ma.auto_field(required=True, load_only=True)
     division_id = ma.auto_field(required=True, load_only=True)
@@ -702,6 +827,17 @@ class PlayerSchema(ma.SQLAlchemySchema):
     free_agent_seasons = ma.Int(dump_only=True)
     awards = ma.Int(dump_only=True)
     _links = ma.Nested(PlayerLinks(), dump_only=True)
+    _embedded = ma.Nested('PlayerEmbedded', dump_only=True)
+
+
+class PlayerFieldsArgs(ma.Schema):
+    """Defines the sparse fieldset of players"""
+    fields = Fields(PlayerSchema, missing=None)
+
+
+class PlayerEmbedded(ma.Schema):
+    """Defines the related resources that can be embedded in a player with expand"""
+    current_team = ma.Nested(TeamSchema(), allow_none=True)
 
 
 class EditPlayerSchema(PlayerSchema):
@@ -714,6 +850,11 @@ class PlayerCollection(Collection):
     items = ma.List(ma.Nested(PlayerSchema()))
 
 
+class PlayerBatch(Batch):
+    """Defines a batch of Players keyed by id"""
+    items = ma.Dict(keys=ma.Int(), values=ma.Nested(PlayerSchema()))
+
+
 class SimplePlayerSchema(ma.SQLAlchemySchema):
     """Defines a simplified version of the PlayerSchema"""
     class Meta:
@@ -779,6 +920,28 @@ class SeasonDivisionFreeAgents(SimpleSeasonDivision):
     free_agents = ma.List(ma.Nested(FreeAgentSchema()))
 
 
+class StandingSchema(ma.Schema):
+    """Defines a single row of the standings"""
+    position = ma.Int()
+    team = ma.Nested(SimpleTeamSchema())
+    played = ma.Int()
+    wins = ma.Int()
+    losses = ma.Int()
+    draws = ma.Int()
+    ot_wins = ma.Int()
+    ot_losses = ma.Int()
+    goals_for = ma.Int()
+    goals_against = ma.Int()
+    goal_difference = ma.Int()
+    points = ma.Int()
+    streak = ma.Str()
+
+
+class SeasonDivisionStandings(SimpleSeasonDivision):
+    """Defines the response for the standings of a SeasonDivision"""
+    standings = ma.List(ma.Nested(StandingSchema()))
+
+
 class SeasonDivisionMatches(SimpleSeasonDivision):
     """Defines the response for the list of matches in a SeasonDivision"""
     matches = ma.List(ma.Nested(SimpleMatchSchema()))
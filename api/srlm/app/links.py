@@ -0,0 +1,110 @@
+"""Precompiled links for serializers.
+url_for resolves the app, the url adapter, the endpoint's rules and url defaults on every call, and encodes query args
+with werkzeug's generic url_encode - which dominates rendering large pages of to_dict output with several _links each.
+The url map is compiled once at startup into the rules of each endpoint and the arguments they need, so building a
+link is a dict lookup and the rule's own compiled builder. Anything this doesn't cover (external urls, anchors, url
+defaults, rules with defaults, no request) falls back to url_for, so the links are always the same as url_for's"""
+import time
+from urllib.parse import quote_plus
+from flask import url_for
+# the request context itself, instead of the request/current_app proxies which cost more than building the link
+from flask.globals import _cv_request
+
+# characters werkzeug's url_encode leaves unquoted in query args, besides letters, digits and -._~
+QUERY_SAFE = "$!'()*,;"
+
+
+def encode_query(items):
+    """Query string of (key, value) pairs quoted like werkzeug's url_encode, None for values it handles differently"""
+    parts = []
+    for key, value in items:
+        if key.startswith('_') or not isinstance(value, (str, int, float)):
+            return None
+        parts.append(f'{quote_plus(key, safe=QUERY_SAFE)}={quote_plus(str(value), safe=QUERY_SAFE)}')
+    return '&'.join(parts)
+
+
+class LinkBuilder:
+    def __init__(self, app):
+        # {endpoint: [(rule, arguments)]} in the order url_for tries them, None if url_for has to build the endpoint
+        self.rules = {}
+        # url defaults can change the values of any endpoint, and host matching or sorted query args change the urls -
+        # leave everything to url_for
+        self.enabled = not (any(app.url_default_functions.values()) or app.url_map.host_matching or
+                            app.url_map.sort_parameters)
+        # url_for tries the rules that accept GET first
+        rules = sorted(app.url_map.iter_rules(), key=lambda rule: 'GET' not in (rule.methods or ('GET',)))
+        for rule in rules:
+            if rule.defaults or rule.subdomain or rule.build_only:
+                self.rules[rule.endpoint] = None
+            elif self.rules.get(rule.endpoint, []) is not None:
+                self.rules.setdefault(rule.endpoint, []).append((rule, frozenset(rule.arguments)))
+
+    def build(self, adapter, endpoint, values):
+        """Relative url of the endpoint as the request's url adapter builds it, or None if it has to be left to
+        url_for"""
+        rules = self.rules.get(endpoint)
+        if not rules:
+            return None
+        values = {key: value for key, value in values.items() if value is not None}
+        for rule, arguments in rules:
+            if arguments <= values.keys():
+                break
+        else:
+            return None
+        built = rule.build(values, append_unknown=False)
+        # url_for builds an external url if the request is for another subdomain/server name
+        if built is None or built[0] != adapter.subdomain:
+            return None
+        url = f"{adapter.script_name.rstrip('/')}/{built[1].lstrip('/')}"
+        query = [(key, value) for key, value in values.items() if key not in arguments]
+        if query:
+            query_string = encode_query(query)
+            if query_string is None:
+                return None
+            if query_string:
+                url += '?' + query_string
+        return url
+
+
+def init_links(app):
+    """Compiles the links of every registered endpoint, call after the blueprints are registered"""
+    app.extensions['link_builder'] = LinkBuilder(app)
+
+
+def link_for(endpoint, **values):
+    """Drop in replacement for url_for when building _links"""
+    ctx = _cv_request.get(None)
+    if ctx is not None and ctx.url_adapter is not None:
+        builder = ctx.app.extensions.get('link_builder')
+        if builder is not None and builder.enabled:
+            url = builder.build(ctx.url_adapter, endpoint, values)
+            if url is not None:
+                return url
+    return url_for(endpoint, **values)
+
+
+def benchmark(app, items=500, repeat=5):
+    """Seconds to build the _links of a page of `items` players with url_for and with link_for (best of `repeat`)"""
+    def page(build):
+        for player_id in range(1, items + 1):
+            build('api.players.get_player', player_id=player_id)
+            build('api.users.get_user', user_id=player_id)
+            build('api.season_division.get_season_division', season_division_id=player_id)
+            build('api.teams.get_team', team_id=player_id)
+            build('api.players.get_player_teams', player_id=player_id)
+            build('api.players.get_player_free_agent', player_id=player_id)
+            build('api.players.get_player_awards', player_id=player_id)
+            build('api.teams.get_team_players', team_id=player_id, current=True)
+
+    timings = {}
+    with app.test_request_context():
+        for name, build in [('url_for', url_for), ('link_for', link_for)]:
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                page(build)
+                seconds = time.perf_counter() - start
+                best = seconds if best is None else min(best, seconds)
+            timings[name] = best
+    return timings
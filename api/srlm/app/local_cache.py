@@ -0,0 +1,281 @@
+"""Two tier cache backend - a bounded in-process LRU in front of Redis.
+Hot keys (cached responses, tag versions) are served from local memory without a Redis round trip. Every write or
+delete is published on a Redis channel and evicted from the local tier of every other worker, so the local copies stay
+coherent. Local entries also expire after CACHE_LOCAL_TIMEOUT seconds in case a message is missed.
+Each process runs one listener per channel for all of its backends (celery tasks create a new app, and so a new backend,
+on every run). Backends are held weakly, and the listener stops once none of them are left.
+
+The tier is opt-in: it is used when CACHE_LOCAL_SIZE is above 0, otherwise the app uses the plain RedisCache.
+Mutable values are kept pickled and unpickled on every local hit. Cached responses are Response objects that the
+request pipeline changes (ETag, Last-Modified and rate limit headers are set on them), so every hit needs its own
+copy. A local hit still saves the Redis round trip and transfer, but not the unpickling"""
+import json
+import os
+import pickle
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from uuid import uuid4
+from flask_caching.backends.rediscache import RedisCache
+from api.srlm.logger import get_logger
+
+log = get_logger(__name__)
+
+# values of these types can't be changed by the caller, so they are kept locally as is. Anything else is pickled so
+# each hit gets its own copy
+IMMUTABLE_TYPES = (str, bytes, int, float, bool, type(None))
+# seconds a listener waits for a message before checking whether any of its backends are still alive
+LISTEN_TIMEOUT = 1
+
+# {(pid, channel): InvalidationListener} of the running listeners
+_listeners = {}
+_listeners_lock = threading.Lock()
+
+
+class InvalidationListener:
+    """Subscribes to an invalidation channel and evicts the published keys from the local tier of every live backend
+    in the process, except the one that published them"""
+    def __init__(self, client, channel):
+        self.client = client
+        self.channel = channel
+        self.pid = os.getpid()
+        self.backends = weakref.WeakSet()
+
+    @classmethod
+    def register(cls, backend):
+        """Adds a backend to the listener of its channel in this process, starting the listener if there is none"""
+        key = (os.getpid(), backend.channel)
+        with _listeners_lock:
+            listener = _listeners.get(key)
+            if listener is None:
+                listener = _listeners[key] = cls(backend._read_client, backend.channel)
+                # subscribed before returning, so no write published after the first read is missed
+                try:
+                    pubsub = listener.subscribe()
+                except Exception as e:
+                    log.warning(f'Could not subscribe to cache invalidations: {e}')
+                    pubsub = None
+                thread = threading.Thread(target=listener.run, args=(pubsub,), name='cache-invalidation', daemon=True)
+                thread.start()
+            listener.backends.add(backend)
+
+    def active(self):
+        """True while any of the backends are alive, otherwise unregisters the listener so the next backend starts a
+        new one"""
+        with _listeners_lock:
+            if self.backends:
+                return True
+            if _listeners.get((self.pid, self.channel)) is self:
+                del _listeners[(self.pid, self.channel)]
+            return False
+
+    def subscribe(self):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        return pubsub
+
+    def run(self, pubsub):
+        while self.active():
+            try:
+                if pubsub is None:
+                    pubsub = self.subscribe()
+                message = pubsub.get_message(timeout=LISTEN_TIMEOUT)
+                if message is not None:
+                    self.handle(message)
+            except Exception as e:
+                # messages may have been missed while disconnected
+                log.warning(f'Cache invalidation listener disconnected: {e}')
+                self.close(pubsub)
+                pubsub = None
+                self.evict(None)
+                time.sleep(1)
+        self.close(pubsub)
+
+    @staticmethod
+    def close(pubsub):
+        if pubsub is None:
+            return
+        try:
+            pubsub.close()
+        except Exception:
+            pass
+
+    def handle(self, message):
+        if message.get('type') != 'message':
+            return
+        data = json.loads(message['data'])
+        self.evict(data['keys'], sender=data['sender'])
+
+    def evict(self, keys, sender=None):
+        for backend in list(self.backends):
+            if backend.sender != sender:
+                backend._evict_local(keys)
+
+
+class LocalRedisCache(RedisCache):
+    def __init__(self, *args, local_size=0, local_timeout=30, channel='cache-invalidate', **kwargs):
+        super().__init__(*args, **kwargs)
+        self.local_size = local_size
+        self.local_timeout = local_timeout
+        self.channel = channel
+        self.sender = uuid4().hex
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        # bumped on every eviction so a value read from redis during an eviction is not kept locally
+        self._generation = 0
+        self._pid = None
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        kwargs.update(
+            local_size=config.get('CACHE_LOCAL_SIZE', 0),
+            local_timeout=config.get('CACHE_LOCAL_TIMEOUT', 30),
+            channel=config.get('CACHE_LOCAL_CHANNEL', 'cache-invalidate')
+        )
+        return super().factory(app, config, args, kwargs)
+
+    @property
+    def local_enabled(self):
+        return self.local_size > 0 and self.local_timeout > 0
+
+    def _ensure_listener(self):
+        """Registers with the invalidation listener of this process. Forked workers register again with an empty local
+        tier"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._local.clear()
+            self._pid = os.getpid()
+        InvalidationListener.register(self)
+
+    def _evict_local(self, keys):
+        """Removes keys from the local tier, or everything if keys is None"""
+        with self._lock:
+            self._generation += 1
+            if keys is None:
+                self._local.clear()
+            else:
+                for key in keys:
+                    self._local.pop(key, None)
+
+    def _publish(self, keys):
+        """Evicts keys locally and tells the other workers to do the same. keys=None clears every local tier"""
+        if not self.local_enabled:
+            return
+        self._evict_local(keys)
+        try:
+            self._write_client.publish(self.channel, json.dumps({'sender': self.sender, 'keys': keys}))
+        except Exception as e:
+            log.warning(f'Could not publish cache invalidation: {e}')
+
+    def _get_local(self, key):
+        """Returns (found, value) from the local tier"""
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return False, None
+            expires, pickled, value = entry
+            if expires < time.monotonic():
+                del self._local[key]
+                return False, None
+            self._local.move_to_end(key)
+        return True, pickle.loads(value) if pickled else value
+
+    def _set_local(self, key, value, generation):
+        # None is a cache miss, there is nothing to keep
+        if value is None:
+            return
+        pickled = not isinstance(value, IMMUTABLE_TYPES)
+        entry = (time.monotonic() + self.local_timeout, pickled, pickle.dumps(value) if pickled else value)
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._local[key] = entry
+            self._local.move_to_end(key)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def get(self, key):
+        if not self.local_enabled:
+            return super().get(key)
+        self._ensure_listener()
+        found, value = self._get_local(key)
+        if found:
+            return value
+        generation = self._generation
+        value = super().get(key)
+        self._set_local(key, value, generation)
+        return value
+
+    def get_many(self, *keys):
+        if not self.local_enabled:
+            return super().get_many(*keys)
+        self._ensure_listener()
+        values = {}
+        missing = []
+        for key in keys:
+            found, value = self._get_local(key)
+            if found:
+                values[key] = value
+            else:
+                missing.append(key)
+        if missing:
+            generation = self._generation
+            for key, value in zip(missing, super().get_many(*missing)):
+                values[key] = value
+                self._set_local(key, value, generation)
+        return [values[key] for key in keys]
+
+    def has(self, key):
+        if self.local_enabled and self._get_local(key)[0]:
+            return True
+        return super().has(key)
+
+    def set(self, key, value, timeout=None):
+        result = super().set(key, value, timeout=timeout)
+        self._publish([key])
+        return result
+
+    def add(self, key, value, timeout=None):
+        created = super().add(key, value, timeout=timeout)
+        if created:
+            self._publish([key])
+        return created
+
+    def set_many(self, mapping, timeout=None):
+        result = super().set_many(mapping, timeout=timeout)
+        self._publish(list(mapping))
+        return result
+
+    def delete(self, key):
+        result = super().delete(key)
+        self._publish([key])
+        return result
+
+    def delete_many(self, *keys):
+        result = super().delete_many(*keys)
+        self._publish(list(keys))
+        return result
+
+    def unlink(self, *keys):
+        result = super().unlink(*keys)
+        self._publish(list(keys))
+        return result
+
+    def inc(self, key, delta=1):
+        result = super().inc(key, delta=delta)
+        self._publish([key])
+        return result
+
+    def dec(self, key, delta=1):
+        result = super().dec(key, delta=delta)
+        self._publish([key])
+        return result
+
+    def clear(self):
+        result = super().clear()
+        self._publish(None)
+        return result
@@ -3,24 +3,136 @@ Where all the models for the main league_manager database are defined
 These models are used by both Alembic to create and migrate the database using Flask-Migrate and to interface with the
 database using SQLAlchemy
 """
+import functools
 import jwt
 import secrets
+from collections import namedtuple
 from time import time
 from datetime import datetime, timedelta, timezone
 import sqlalchemy as sa
 from sqlalchemy.ext.associationproxy import association_proxy
+from sqlalchemy.orm import joinedload, selectinload, Load
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask import current_app, url_for
+from flask import current_app
 from flask_login import UserMixin
 from api.srlm.app import db, login
+from api.srlm.app.token_cache import forget_token
+from api.srlm.app.permission_sets import PermissionSet
+from api.srlm.app.pagination import encode_cursor, cached_total
+from api.srlm.app.links import link_for
+
+# a related resource that can be embedded with ?expand= - loader options for the query, an optional prepare(items) that
+# batch loads anything else the whole page needs, and serialize(instance)
+Expansion = namedtuple('Expansion', ['options', 'prepare', 'serialize'])
 
 
 class PaginatedAPIMixin(object):
     @staticmethod
-    def to_collection_dict(query, page, per_page, endpoint, **kwargs):
+    def expansions():
+        """Related resources that can be embedded with ?expand=, as {name: Expansion}"""
+        return {}
+
+    @classmethod
+    def expansion_options(cls, expand):
+        """Loader options for the expanded resources"""
+        expansions = cls.expansions()
+        return [option for name in expand or () for option in expansions[name].options]
+
+    @classmethod
+    def prepare_expansions(cls, items, expand):
+        expansions = cls.expansions()
+        for name in expand or ():
+            if expansions[name].prepare is not None and items:
+                expansions[name].prepare(items)
+
+    def embed(self, data, expand):
+        """Adds the expanded resources to serialized data under _embedded"""
+        if expand:
+            expansions = self.expansions()
+            data['_embedded'] = {name: expansions[name].serialize(self) for name in expand}
+        return data
+
+    def to_expanded_dict(self, expand, fields=None):
+        """to_dict with the expanded resources embedded. Load the instance with sparse_options/expansion_options"""
+        return self.serialize_all([self], expand, fields)[0]
+
+    @staticmethod
+    def collection_options():
+        """Loader options applied when a page of this model is serialized, so to_dict doesn't lazy load per row"""
+        return []
+
+    @staticmethod
+    def field_options():
+        """Loader options needed by each field of to_dict, for models that support sparse fieldsets (?fields=)"""
+        return {}
+
+    @classmethod
+    def sparse_options(cls, fields):
+        """Loader options for only the requested fields, collection_options if every field is rendered"""
+        if fields is None:
+            return cls.collection_options()
+        field_options = cls.field_options()
+        return [option for name in fields for option in field_options.get(name, ())]
+
+    # fields of to_dict that prepare_collection batch loads for, it is skipped if none of them are requested
+    prepared_fields = frozenset()
+
+    @staticmethod
+    def prepare_collection(items):
+        """Hook for batch loading anything to_dict needs that can't be expressed as a loader option"""
+        pass
+
+    @classmethod
+    def prepare_fields(cls, items, fields):
+        if fields is None or cls.prepared_fields.intersection(fields):
+            cls.prepare_collection(items)
+
+    @staticmethod
+    def render(values, links, fields=None):
+        """Builds a to_dict response from {name: function} values and links, calling only the functions of the
+        requested fields (all of them without a fieldset). The self link is always rendered"""
+        data = {name: value() for name, value in values.items() if fields is None or name in fields}
+        data['_links'] = {name: link() for name, link in links.items()
+                          if fields is None or name == 'self' or name in fields}
+        return data
+
+    def to_sparse_dict(self, fields=None):
+        """to_dict limited to the requested fields, models that support fieldsets take them in to_dict"""
+        return self.to_dict() if fields is None else self.to_dict(fields)
+
+    @classmethod
+    def serialize_all(cls, items, expand=None, fields=None):
+        """Batch loads what the items need and serializes them"""
+        cls.prepare_fields(items, fields)
+        cls.prepare_expansions(items, expand)
+        return [item.embed(item.to_sparse_dict(fields), expand) for item in items]
+
+    @staticmethod
+    def view_args(expand=None, fields=None):
+        """Query args that keep the expansions and fieldset in page links"""
+        args = {}
+        if expand:
+            args['expand'] = ','.join(expand)
+        if fields:
+            args['fields'] = ','.join(fields)
+        return args
+
+    @classmethod
+    def to_collection_dict(cls, query, page, per_page, endpoint, loader_options=None, after=None, total=False,
+                           expand=None, fields=None, **kwargs):
+        """Serializes a page of the query. Pages by number, or by cursor if `after` (a decoded cursor) is given.
+        Related resources named in `expand` are embedded in every item, `fields` limits the rendered fields"""
+        # endpoints can override the default loader options if they serialize differently
+        options = cls.sparse_options(fields) if loader_options is None else loader_options
+        options = options + cls.expansion_options(expand)
+        if options:
+            query = query.options(*options)
+        if after is not None:
+            return cls.to_cursor_dict(query, after, per_page, endpoint, total, expand, fields, **kwargs)
+        kwargs.update(cls.view_args(expand, fields))
         resources = db.paginate(query, page=page, per_page=per_page, error_out=False)
         data = {
-            'items': [item.to_dict() for item in resources.items],
+            'items': cls.serialize_all(resources.items, expand, fields),
             '_meta': {
                 'page': page,
                 'per_page': per_page,
@@ -28,13 +140,62 @@ class PaginatedAPIMixin(object):
                 'total_items': resources.total
             },
             '_links': {
-                'self': url_for(endpoint, page=page, per_page=per_page, **kwargs),
-                'next': url_for(endpoint, page=page + 1, per_page=per_page, **kwargs) if resources.has_next else None,
-                'prev': url_for(endpoint, page=page - 1, per_page=per_page, **kwargs) if resources.has_prev else None
+                'self': link_for(endpoint, page=page, per_page=per_page, **kwargs),
+                'next': link_for(endpoint, page=page + 1, per_page=per_page, **kwargs) if resources.has_next else None,
+                'prev': link_for(endpoint, page=page - 1, per_page=per_page, **kwargs) if resources.has_prev else None
             }
         }
         return data
 
+    @classmethod
+    def to_batch_dict(cls, ids, expand=None, fields=None):
+        """Serializes the instances with the given ids keyed by id, loaded with one query (plus the prepare_collection
+        batch loads). Ids that don't exist are listed in missing instead of failing the whole batch"""
+        key = sa.inspect(cls).primary_key[0]
+        ids = list(dict.fromkeys(ids))
+        query = sa.select(cls).where(key.in_(ids)).options(*cls.sparse_options(fields),
+                                                           *cls.expansion_options(expand))
+        items = db.session.scalars(query).unique().all()
+
+        found = dict(zip([getattr(item, key.key) for item in items], cls.serialize_all(items, expand, fields)))
+        return {
+            'items': {item_id: found[item_id] for item_id in ids if item_id in found},
+            'missing': [item_id for item_id in ids if item_id not in found]
+        }
+
+    @classmethod
+    def to_cursor_dict(cls, query, after, per_page, endpoint, total=False, expand=None, fields=None, **kwargs):
+        """Keyset paginated page ordered by primary key - filters on the key after the cursor instead of an OFFSET,
+        and only counts the total (cached) if asked to"""
+        key = sa.inspect(cls).primary_key[0]
+        collection = query.order_by(None)
+        page_query = collection.where(key > after['id']) if 'id' in after else collection
+        page_query = page_query.order_by(key).limit(per_page + 1)
+        items = db.session.scalars(page_query).all() if isinstance(page_query, sa.Select) else page_query.all()
+
+        has_next = len(items) > per_page
+        items = items[:per_page]
+        next_cursor = encode_cursor(getattr(items[-1], key.key)) if has_next else None
+        kwargs.update(cls.view_args(expand, fields))
+
+        data = {
+            'items': cls.serialize_all(items, expand, fields),
+            '_meta': {
+                'per_page': per_page,
+                'next_cursor': next_cursor
+            },
+            '_links': {
+                'self': link_for(endpoint, after=encode_cursor(after['id']) if 'id' in after else '',
+                                per_page=per_page, **kwargs),
+                'next': link_for(endpoint, after=next_cursor, per_page=per_page, **kwargs) if has_next else None,
+                'prev': None
+            }
+        }
+        if total:
+            data['_meta']['total_items'] = cached_total(
+                collection if isinstance(collection, sa.Select) else collection.statement)
+        return data
+
 
 class User(PaginatedAPIMixin, UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -56,6 +217,15 @@ class User(PaginatedAPIMixin, UserMixin, db.Model):
     def __repr__(self):
         return f'<User {self.username} | ID: {self.id}>'
 
+    @staticmethod
+    def collection_options():
+        return [
+            selectinload(User.player),
+            selectinload(User.discord),
+            selectinload(User.permission_assoc).joinedload(UserPermissions.permission),
+            Load(User).undefer_group('counts')
+        ]
+
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
 
@@ -77,11 +247,33 @@ class User(PaginatedAPIMixin, UserMixin, db.Model):
             return
         return load_user(user_id)
 
+    def permission_set(self):
+        """Compiled PermissionSet of the user, built from the loaded permissions or a single query"""
+        if '_permission_set' not in self.__dict__:
+            if 'permission_assoc' in self.__dict__:
+                rows = [(user_perm.permission.key, user_perm.additional_modifiers) for user_perm in self.permission_assoc]
+            else:
+                rows = db.session.execute(
+                    sa.select(Permission.key, UserPermissions.additional_modifiers).join(
+                        UserPermissions, UserPermissions.permission_id == Permission.id
+                    ).where(UserPermissions.user_id == self.id)
+                ).all()
+            self._permission_set = PermissionSet.compile(rows)
+        return self._permission_set
+
+    def permissions_changed(self):
+        """Drops the compiled permissions, here and in the token cache. Call after granting, changing or revoking"""
+        self.__dict__.pop('_permission_set', None)
+        forget_token(User, self.token)
+
+    def token_cache_data(self):
+        return {'permissions': self.permission_set()}
+
+    def load_token_cache_data(self, data):
+        self._permission_set = data['permissions']
+
     def permissions_list(self):
-        perms_list = []
-        for permission in self.permissions:
-            perms_list.append(permission.key)
-        return perms_list
+        return self.permission_set().keys()
 
     def to_dict(self, include_email=False):
         data = {
@@ -90,14 +282,14 @@ class User(PaginatedAPIMixin, UserMixin, db.Model):
             'player': self.player.id if self.player is not None else None,
             'discord': self.discord.id if self.discord is not None else None,
             'permissions': self.permissions_list(),
-            'matches_streamed': len(self.streamed_matches),
+            'matches_streamed': self.streamed_matches_count,
             'reset_pass': self.reset_pass,
             '_links': {
-                'self': url_for('api.users.get_user', user_id=self.id),
-                'player': url_for('api.players.get_player', player_id=self.player.id) if self.player is not None else None,
-                'discord': url_for('api.users.discord.get_user_discord', user_id=self.id) if self.discord is not None else None,
-                'permissions': url_for('api.users.permissions.get_user_permissions', user_id=self.id),
-                'matches_streamed': url_for('api.users.get_user_matches_streamed', user_id=self.id),
+                'self': link_for('api.users.get_user', user_id=self.id),
+                'player': link_for('api.players.get_player', player_id=self.player.id) if self.player is not None else None,
+                'discord': link_for('api.users.discord.get_user_discord', user_id=self.id) if self.discord is not None else None,
+                'permissions': link_for('api.users.permissions.get_user_permissions', user_id=self.id),
+                'matches_streamed': link_for('api.users.get_user_matches_streamed', user_id=self.id),
             }
         }
         if include_email:
@@ -111,17 +303,15 @@ class User(PaginatedAPIMixin, UserMixin, db.Model):
         if new_user and 'password' in data:
             self.set_password(data['password'])
 
-    def has_permission(self, key):
-        for permission in self.permissions:
-            if permission.key == key:
-                return True
-        else:
-            return False
+    def has_permission(self, key, **scope):
+        """Checks the compiled permissions, optionally for a scope - e.g. has_permission('manager', team=3)"""
+        return self.permission_set().has(key, **scope)
 
     def get_token(self, expires_in=1209600):
         now = datetime.now(timezone.utc)
         if self.token and self.token_expiration.replace(tzinfo=timezone.utc) > now + timedelta(seconds=86400):
             return self.token
+        forget_token(User, self.token)
         self.token = secrets.token_hex(16)
         self.token_expiration = now + timedelta(seconds=expires_in)
         db.session.add(self)
@@ -129,6 +319,7 @@ class User(PaginatedAPIMixin, UserMixin, db.Model):
 
     def revoke_token(self):
         self.token_expiration = datetime.utcnow() - timedelta(seconds=1)
+        forget_token(User, self.token)
 
     @staticmethod
     def check_token(token):
@@ -149,14 +340,18 @@ class Permission(PaginatedAPIMixin, db.Model):
     def __repr__(self):
         return f'<Perm {self.key} | {self.description}>'
 
+    @staticmethod
+    def collection_options():
+        return [Load(Permission).undefer_group('counts')]
+
     def to_dict(self):
         data = {
             'id': self.id,
             'key': self.key,
             'description': self.description,
-            'users_count': len(self.users),
+            'users_count': self.users_count,
             '_links': {
-                'self': url_for('api.auth.permissions.get_permission', perm_id_or_key=self.id)
+                'self': link_for('api.auth.permissions.get_permission', perm_id_or_key=self.id)
             }
         }
         return data
@@ -188,8 +383,8 @@ class UserPermissions(db.Model):
             'description': self.permission.description,
             'additional_modifiers': self.additional_modifiers,
             '_links': {
-                'self': url_for('api.auth.permissions.get_permission', perm_id_or_key=self.permission.id),
-                'user': url_for('api.users.get_user', user_id=self.user_id),
+                'self': link_for('api.auth.permissions.get_permission', perm_id_or_key=self.permission.id),
+                'user': link_for('api.users.get_user', user_id=self.user_id),
             }
         }
         return data
@@ -214,8 +409,8 @@ class Discord(db.Model):
             'discord_id': self.discord_id,
             'token_expiration': self.token_expiration,
             '_links': {
-                'self': url_for('api.users.discord.get_user_discord', user_id=self.user_id),
-                'user': url_for('api.users.get_user', user_id=self.user_id)
+                'self': link_for('api.users.discord.get_user_discord', user_id=self.user_id),
+                'user': link_for('api.users.get_user', user_id=self.user_id)
             }
         }
         if authenticated:
@@ -251,8 +446,8 @@ class Twitch(db.Model):
             'twitch_id': self.twitch_id,
             'token_expiration': self.token_expiration,
             '_links': {
-                'self': url_for('api.users.twitch.get_user_twitch', user_id=self.user_id),
-                'user': url_for('api.users.get_user', user_id=self.user_id)
+                'self': link_for('api.users.twitch.get_user_twitch', user_id=self.user_id),
+                'user': link_for('api.users.get_user', user_id=self.user_id)
             }
         }
         if authenticated:
@@ -292,52 +487,94 @@ class Player(PaginatedAPIMixin, db.Model):
     def __repr__(self):
         return f'<Player {self.player_name} ({self.user.username if self.user else None})>'
 
-    def to_dict(self):
-        now = datetime.now(timezone.utc)
-        current_team_q = self.team_association.filter(sa.and_(PlayerTeam.start_date < now, PlayerTeam.end_date == None))
-        current_team = current_team_q.first()
-        unique_teams = []
-        for team in self.teams:
-            if team.id not in unique_teams:
-                unique_teams.append(team.id)
-        data = {
-            'id': self.id,
-            'player_name': self.player_name,
-            'user': self.user.username if self.user else None,
-            'slap_id': self.slap_id,
-            'rookie': self.rookie,
-            'first_season': self.first_season.get_readable_name(),
-            'next_name_change': self.next_name_change,
-            'current_team': current_team.team.name if current_team else None,
-            'teams': len(unique_teams),
-            'free_agent_seasons': self.season_association.count(),
-            'awards': len(self.awards_association),
-            '_links': {
-                'self': url_for('api.players.get_player', player_id=self.id),
-                'user': url_for('api.users.get_user', user_id=self.user_id) if self.user else None,
-                'first_season': url_for('api.season_division.get_season_division', season_division_id=self.first_season_id),
-                'current_team': url_for('api.teams.get_team', team_id=current_team.team.id) if current_team else None,
-                'teams': url_for('api.players.get_player_teams', player_id=self.id),
-                'free_agent_seasons': url_for('api.players.get_player_free_agent', player_id=self.id),
-                'awards': url_for('api.players.get_player_awards', player_id=self.id)
-            }
+    @staticmethod
+    def collection_options():
+        return [
+            joinedload(Player.user),
+            joinedload(Player.first_season).joinedload(SeasonDivision.season),
+            joinedload(Player.first_season).joinedload(SeasonDivision.division),
+            Load(Player).undefer_group('counts')
+        ]
+
+    @staticmethod
+    def field_options():
+        first_season = [joinedload(Player.first_season).joinedload(SeasonDivision.season),
+                        joinedload(Player.first_season).joinedload(SeasonDivision.division)]
+        counts = [Load(Player).undefer_group('counts')]
+        return {'user': [joinedload(Player.user)], 'first_season': first_season, 'teams': counts,
+                'free_agent_seasons': counts, 'awards': counts}
+
+    prepared_fields = frozenset(['current_team'])
+
+    @staticmethod
+    def expansions():
+        return {
+            'current_team': Expansion([], Player.prepare_current_team_expansion,
+                                      lambda player: player.current_team().team.to_dict() if player.current_team()
+                                      else None)
         }
 
-        return data
+    @staticmethod
+    def prepare_current_team_expansion(players):
+        # the current teams aren't resolved yet if the fieldset doesn't include current_team
+        if '_current_team' not in players[0].__dict__:
+            Player.prepare_collection(players)
+        Team.prepare_embedded([player.current_team().team for player in players if player.current_team()])
+
+    @staticmethod
+    def prepare_collection(players):
+        """Resolves the current team of every player with one query"""
+        current_teams = {}
+        if players:
+            query = db.session.query(PlayerTeam).options(joinedload(PlayerTeam.team)).filter(
+                PlayerTeam.player_id.in_([player.id for player in players]),
+                PlayerTeam.active_at(datetime.utcnow())
+            ).order_by(sa.desc(PlayerTeam.start_date))
+            for player_team in query:
+                current_teams.setdefault(player_team.player_id, player_team)
+        for player in players:
+            player._current_team = current_teams.get(player.id)
+
+    def to_dict(self, fields=None):
+        # resolved at most once, and only if current_team is rendered
+        current_team = functools.cache(self.current_team)
+        values = {
+            'id': lambda: self.id,
+            'player_name': lambda: self.player_name,
+            'user': lambda: self.user.username if self.user else None,
+            'slap_id': lambda: self.slap_id,
+            'rookie': lambda: self.rookie,
+            'first_season': lambda: self.first_season.get_readable_name(),
+            'next_name_change': lambda: self.next_name_change,
+            'current_team': lambda: current_team().team.name if current_team() else None,
+            'teams': lambda: self.teams_count,
+            'free_agent_seasons': lambda: self.free_agent_seasons_count,
+            'awards': lambda: self.awards_count
+        }
+        links = {
+            'self': lambda: link_for('api.players.get_player', player_id=self.id),
+            'user': lambda: link_for('api.users.get_user', user_id=self.user_id) if self.user else None,
+            'first_season': lambda: link_for('api.season_division.get_season_division',
+                                            season_division_id=self.first_season_id),
+            'current_team': lambda: link_for('api.teams.get_team', team_id=current_team().team.id)
+            if current_team() else None,
+            'teams': lambda: link_for('api.players.get_player_teams', player_id=self.id),
+            'free_agent_seasons': lambda: link_for('api.players.get_player_free_agent', player_id=self.id),
+            'awards': lambda: link_for('api.players.get_player_awards', player_id=self.id)
+        }
+        return self.render(values, links, fields)
 
     def to_simple_dict(self):
-        now = datetime.now(timezone.utc)
-        current_team_q = self.team_association.filter(sa.and_(PlayerTeam.start_date < now, PlayerTeam.end_date == None))
-        current_team = current_team_q.first()
+        current_team = self.current_team()
         data = {
             'player_name': self.player_name,
             'user': self.user.username if self.user else None,
             'slap_id': self.slap_id,
             'current_team': current_team.team.name if current_team else None,
             '_links': {
-                'self': url_for('api.players.get_player', player_id=self.id),
-                'user': url_for('api.users.get_user', user_id=self.user_id) if self.user else None,
-                'current_team': url_for('api.teams.get_team', team_id=current_team.team.id) if current_team else None
+                'self': link_for('api.players.get_player', player_id=self.id),
+                'user': link_for('api.users.get_user', user_id=self.user_id) if self.user else None,
+                'current_team': link_for('api.teams.get_team', team_id=current_team.team.id) if current_team else None
             }
         }
 
@@ -349,9 +586,11 @@ class Player(PaginatedAPIMixin, db.Model):
                 setattr(self, field, data[field])
 
     def current_team(self):
-        now = datetime.now(timezone.utc)
-        current_team_q = self.team_association.filter(sa.and_(PlayerTeam.start_date < now, PlayerTeam.end_date == None))
-        return current_team_q.first()
+        # already resolved for the whole page by prepare_collection
+        if '_current_team' in self.__dict__:
+            return self._current_team
+        return self.team_association.filter(PlayerTeam.active_at(datetime.utcnow())).order_by(
+            sa.desc(PlayerTeam.start_date)).first()
 
 
 # this is a helper table for recording which teams played in which season and in which division
@@ -381,30 +620,64 @@ class Team(PaginatedAPIMixin, db.Model):
     def __repr__(self):
         return f'<Team {self.name} ({self.acronym})>'
 
-    def to_dict(self):
-        now = datetime.now(timezone.utc)
-        active_players = self.player_association.filter(
-            sa.and_(PlayerTeam.start_date < now, PlayerTeam.end_date == None))
-        data = {
-            'id': self.id,
-            'name': self.name,
-            'acronym': self.acronym,
-            'founded_date': self.founded_date,
-            'color': self.color,
-            'logo': True if self.logo else False,
-            'active_players': active_players.count(),
-            'seasons_played': len(self.season_divisions),
-            'awards': len(self.awards_association),
-            '_links': {
-                'self': url_for('api.teams.get_team', team_id=self.id),
-                'logo': self.logo,
-                'active_players': url_for('api.teams.get_team_players', team_id=self.id, current=True),
-                'seasons_played': url_for('api.teams.get_team_seasons', team_id=self.id),
-                'awards': url_for('api.teams.get_team_awards', team_id=self.id)
-            }
-        }
+    @staticmethod
+    def collection_options():
+        return [Load(Team).undefer_group('counts')]
 
-        return data
+    @staticmethod
+    def field_options():
+        counts = [Load(Team).undefer_group('counts')]
+        return {'seasons_played': counts, 'awards': counts}
+
+    prepared_fields = frozenset(['active_players'])
+
+    @staticmethod
+    def prepare_collection(teams):
+        """Counts the active players of every team with one grouped query"""
+        active_players = {}
+        if teams:
+            active_players = dict(db.session.query(PlayerTeam.team_id, sa.func.count(PlayerTeam.id)).filter(
+                PlayerTeam.team_id.in_([team.id for team in teams]),
+                PlayerTeam.active_at(datetime.utcnow())
+            ).group_by(PlayerTeam.team_id).all())
+        for team in teams:
+            team._active_players = active_players.get(team.id, 0)
+
+    @staticmethod
+    def prepare_embedded(teams):
+        """Loads the counts and active players of teams embedded in other resources, with two queries"""
+        team_ids = {team.id for team in teams}
+        if team_ids:
+            db.session.scalars(sa.select(Team).where(Team.id.in_(team_ids)).options(
+                Load(Team).undefer_group('counts'))).all()
+        Team.prepare_collection(list(teams))
+
+    def active_players_count(self):
+        # already counted for the whole page by prepare_collection
+        if '_active_players' in self.__dict__:
+            return self._active_players
+        return self.player_association.filter(PlayerTeam.active_at(datetime.utcnow())).count()
+
+    def to_dict(self, fields=None):
+        values = {
+            'id': lambda: self.id,
+            'name': lambda: self.name,
+            'acronym': lambda: self.acronym,
+            'founded_date': lambda: self.founded_date,
+            'color': lambda: self.color,
+            'logo': lambda: True if self.logo else False,
+            'active_players': self.active_players_count,
+            'seasons_played': lambda: self.seasons_count,
+            'awards': lambda: self.awards_count
+        }
+        links = {
+            'self': lambda: link_for('api.teams.get_team', team_id=self.id),
+            'logo': lambda: self.logo,
+            'active_players': lambda: link_for('api.teams.get_team_players', team_id=self.id, current=True),
+            'seasons_played': lambda: link_for('api.teams.get_team_seasons', team_id=self.id),
+            'awards': lambda: link_for('api.teams.get_team_awards', team_id=self.id)
+        }
+        return self.render(values, links, fields)
 
     def to_simple_dict(self):
         data = {
@@ -412,7 +685,7 @@ class Team(PaginatedAPIMixin, db.Model):
             'acronym': self.acronym,
             'color': self.color,
             '_links': {
-                'self': url_for('api.teams.get_team', team_id=self.id)
+                'self': link_for('api.teams.get_team', team_id=self.id)
             }
         }
         return data
@@ -425,6 +698,11 @@ class Team(PaginatedAPIMixin, db.Model):
 
 # this is a helper table for recording which players were a part of which team and when (aka 'roster')
 class PlayerTeam(db.Model):
+    __table_args__ = (
+        db.Index('ix_player_team_player_dates', 'player_id', 'start_date', 'end_date'),
+        db.Index('ix_player_team_team_dates', 'team_id', 'start_date', 'end_date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     player_id = db.Column(db.Integer, db.ForeignKey('player.id'))
     team_id = db.Column(db.Integer, db.ForeignKey('team.id'))
@@ -437,6 +715,16 @@ class PlayerTeam(db.Model):
     def __repr__(self):
         return f'<PlayerTeam {self.player.player_name} | {self.team.name}>'
 
+    @staticmethod
+    def active_at(at):
+        """Filter for roster entries active at the given time"""
+        return sa.and_(PlayerTeam.start_date < at, sa.or_(PlayerTeam.end_date == None, PlayerTeam.end_date > at))
+
+    @staticmethod
+    def active_between(start, end):
+        """Filter for roster entries that overlap the given date range"""
+        return sa.and_(PlayerTeam.start_date < end, sa.or_(PlayerTeam.end_date == None, PlayerTeam.end_date > start))
+
     def player_to_dict(self):
         data = {
             'id': self.player.id,
@@ -448,7 +736,7 @@ class PlayerTeam(db.Model):
                 }
             ],
             '_links': {
-                'self': url_for('api.players.get_player', player_id=self.player.id)
+                'self': link_for('api.players.get_player', player_id=self.player.id)
             }
         }
         return data
@@ -465,7 +753,7 @@ class PlayerTeam(db.Model):
                 }
             ],
             '_links': {
-                'self': url_for('api.teams.get_team', team_id=self.team.id)
+                'self': link_for('api.teams.get_team', team_id=self.team.id)
             }
         }
         return data
@@ -475,16 +763,14 @@ class PlayerTeam(db.Model):
         team = db.session.get(Team, team_id)
         players = []
         if current:
-            for player_assoc in team.player_association:
-                now = datetime.now(timezone.utc)
-                if player_assoc.start_date.replace(tzinfo=timezone.utc) < now and (
-                        player_assoc.end_date is None or player_assoc.end_date.replace(tzinfo=timezone.utc) > now):
-                    players.append(player_assoc.player_to_dict())
+            for player_assoc in team.player_association.options(joinedload(PlayerTeam.player)).filter(
+                    PlayerTeam.active_at(datetime.utcnow())):
+                players.append(player_assoc.player_to_dict())
 
         else:
-            for player_assoc in team.player_association:
+            for player_assoc in team.player_association.options(joinedload(PlayerTeam.player)):
                 index = next((i for i, player, in enumerate(players) if player['id'] == player_assoc.player.id), None)
-                if index:
+                if index is not None:
                     dates = {
                         'start': player_assoc.start_date,
                         'end': player_assoc.end_date
@@ -500,8 +786,8 @@ class PlayerTeam(db.Model):
             'color': team.color,
             'players': players,
             '_links': {
-                'self': url_for('api.teams.get_team_players', team_id=team.id, current=current),
-                'team': url_for('api.teams.get_team', team_id=team.id)
+                'self': link_for('api.teams.get_team_players', team_id=team.id, current=current),
+                'team': link_for('api.teams.get_team', team_id=team.id)
             }
         }
         return response
@@ -511,24 +797,21 @@ class PlayerTeam(db.Model):
         player = db.session.get(Player, player_id)
         if current:
             response = None
-            for team_assoc in player.team_association:
-                now = datetime.now(timezone.utc)
-                if team_assoc.start_date.replace(tzinfo=timezone.utc) < now and (
-                        team_assoc.end_date is None or team_assoc.end_date.replace(tzinfo=timezone.utc) > now):
-                    response = {
-                        'player': player.player_name,
-                        'current_team': team_assoc.team_to_dict(),
-                        '_links': {
-                            'self': url_for('api.players.get_player_teams', player_id=player.id, current=True),
-                            'player': url_for('api.players.get_player', player_id=player.id)
-                        }
+            team_assoc = player.current_team()
+            if team_assoc:
+                response = {
+                    'player': player.player_name,
+                    'current_team': team_assoc.team_to_dict(),
+                    '_links': {
+                        'self': link_for('api.players.get_player_teams', player_id=player.id, current=True),
+                        'player': link_for('api.players.get_player', player_id=player.id)
                     }
-                    break
+                }
             return response
 
         else:
             teams = {}
-            for team_assoc in player.team_association:
+            for team_assoc in player.team_association.options(joinedload(PlayerTeam.team)):
                 if team_assoc.team.id not in teams:
                     teams[team_assoc.team.id] = team_assoc.team_to_dict()
                 else:
@@ -542,8 +825,8 @@ class PlayerTeam(db.Model):
                 'player': player.player_name,
                 'teams': teams,
                 '_links': {
-                    'self': url_for('api.players.get_player_teams', player_id=player.id),
-                    'player': url_for('api.players.get_player', player_id=player.id)
+                    'self': link_for('api.players.get_player_teams', player_id=player.id),
+                    'player': link_for('api.players.get_player', player_id=player.id)
                 }
             }
             return response
@@ -569,7 +852,7 @@ class FreeAgent(db.Model):
                 'start_date': self.start_date,
                 'end_date': self.end_date,
                 '_links': {
-                    'player': url_for('api.players.get_player', player_id=self.player_id)
+                    'player': link_for('api.players.get_player', player_id=self.player_id)
                 }
             }
         else:
@@ -585,7 +868,10 @@ class FreeAgent(db.Model):
     @staticmethod
     def get_free_agent_seasons(player_id):
         player = db.session.get(Player, player_id)
-        season_query = db.session.query(FreeAgent).filter_by(player_id=player_id).order_by(
+        season_query = db.session.query(FreeAgent).options(
+            joinedload(FreeAgent.season_division).joinedload(SeasonDivision.season).joinedload(Season.league),
+            joinedload(FreeAgent.season_division).joinedload(SeasonDivision.division)
+        ).filter_by(player_id=player_id).order_by(
             sa.desc(FreeAgent.season_division_id))
 
         if season_query.count() == 0:
@@ -599,8 +885,8 @@ class FreeAgent(db.Model):
             'player': player.player_name,
             'free_agent_seasons': seasons,
             '_links': {
-                'self': url_for('api.players.get_player_free_agent', player_id=player.id),
-                'player': url_for('api.players.get_player', player_id=player.id)
+                'self': link_for('api.players.get_player_free_agent', player_id=player.id),
+                'player': link_for('api.players.get_player', player_id=player.id)
             }
         }
         return response
@@ -610,7 +896,8 @@ class FreeAgent(db.Model):
         # get season/division
         season_division = db.session.get(SeasonDivision, season_division_id)
         # query free agents
-        player_query = db.session.query(FreeAgent).filter_by(season_division_id=season_division.id)
+        player_query = db.session.query(FreeAgent).options(joinedload(FreeAgent.player)).filter_by(
+            season_division_id=season_division.id)
         # return none if no players
         if player_query.count() == 0:
             return None
@@ -626,9 +913,9 @@ class FreeAgent(db.Model):
             'league': season_division.season.league.acronym,
             'free_agents': players,
             '_links': {
-                'self': url_for('api.season_division.get_free_agents_in_season_division', season_division_id=season_division.id),
-                'season_division': url_for('api.season_division.get_season_division', season_division_id=season_division.id),
-                'league': url_for('api.leagues.get_league', league_id_or_acronym=season_division.season.league.id)
+                'self': link_for('api.season_division.get_free_agents_in_season_division', season_division_id=season_division.id),
+                'season_division': link_for('api.season_division.get_season_division', season_division_id=season_division.id),
+                'league': link_for('api.leagues.get_league', league_id_or_acronym=season_division.season.league.id)
             }
         }
         return response
@@ -647,17 +934,21 @@ class League(PaginatedAPIMixin, db.Model):
     def __repr__(self):
         return f'<League {self.name} | {self.acronym}>'
 
+    @staticmethod
+    def collection_options():
+        return [Load(League).undefer_group('counts')]
+
     def to_dict(self):
         data = {
             'id': self.id,
             'name': self.name,
             'acronym': self.acronym,
-            'seasons_count': self.seasons.count(),
-            'divisions_count': self.divisions.count(),
+            'seasons_count': self.seasons_count,
+            'divisions_count': self.divisions_count,
             '_links': {
-                'self': url_for('api.leagues.get_league', league_id_or_acronym=self.id),
-                'seasons': url_for('api.leagues.get_league_seasons', league_id_or_acronym=self.id),
-                'divisions': url_for('api.leagues.get_league_divisions', league_id_or_acronym=self.id)
+                'self': link_for('api.leagues.get_league', league_id_or_acronym=self.id),
+                'seasons': link_for('api.leagues.get_league_seasons', league_id_or_acronym=self.id),
+                'divisions': link_for('api.leagues.get_league_divisions', league_id_or_acronym=self.id)
             }
         }
         return data
@@ -687,6 +978,10 @@ class Season(PaginatedAPIMixin, db.Model):
     def __repr__(self):
         return f'<Season {self.name} | {self.league.acronym}>'
 
+    @staticmethod
+    def collection_options():
+        return [joinedload(Season.league), joinedload(Season.match_type), Load(Season).undefer_group('counts')]
+
     def to_dict(self):
         data = {
             'id': self.id,
@@ -698,12 +993,12 @@ class Season(PaginatedAPIMixin, db.Model):
             'finals_start': self.finals_start,
             'finals_end': self.finals_end,
             'match_type': self.match_type.name,
-            'divisions_count': self.division_association.count(),
+            'divisions_count': self.divisions_count,
             '_links': {
-                'self': url_for('api.seasons.get_season', season_id=self.id),
-                'league': url_for('api.leagues.get_league', league_id_or_acronym=self.league_id),
-                'match_type': url_for('api.match.get_match_type', match_type_id=self.match_type_id),
-                'divisions': url_for('api.seasons.get_divisions_in_season', season_id=self.id)
+                'self': link_for('api.seasons.get_season', season_id=self.id),
+                'league': link_for('api.leagues.get_league', league_id_or_acronym=self.league_id),
+                'match_type': link_for('api.match.get_match_type', match_type_id=self.match_type_id),
+                'divisions': link_for('api.seasons.get_divisions_in_season', season_id=self.id)
             }
         }
         return data
@@ -729,6 +1024,10 @@ class Division(PaginatedAPIMixin, db.Model):
     def __repr__(self):
         return f'<Division {self.name} | {self.acronym} | {self.league.acronym}>'
 
+    @staticmethod
+    def collection_options():
+        return [joinedload(Division.league), Load(Division).undefer_group('counts')]
+
     def to_dict(self):
         data = {
             'id': self.id,
@@ -736,11 +1035,11 @@ class Division(PaginatedAPIMixin, db.Model):
             'acronym': self.acronym,
             'league': self.league.acronym,
             'description': self.description,
-            'seasons_count': self.season_association.count(),
+            'seasons_count': self.seasons_count,
             '_links': {
-                'self': url_for('api.divisions.get_division', division_id=self.id),
-                'league': url_for('api.leagues.get_league', league_id_or_acronym=self.league_id),
-                'seasons': url_for('api.divisions.get_seasons_of_division', division_id=self.id)
+                'self': link_for('api.divisions.get_division', division_id=self.id),
+                'league': link_for('api.leagues.get_league', league_id_or_acronym=self.league_id),
+                'seasons': link_for('api.divisions.get_seasons_of_division', division_id=self.id)
             }
         }
         return data
@@ -770,6 +1069,11 @@ class SeasonDivision(PaginatedAPIMixin, db.Model):
     def __repr__(self):
         return f'<SeasonDivision | {self.season.name} | Division: {self.division.name} | {self.season.league.acronym}>'
 
+    @staticmethod
+    def collection_options():
+        return [joinedload(SeasonDivision.season).joinedload(Season.league), joinedload(SeasonDivision.division),
+                Load(SeasonDivision).undefer_group('counts')]
+
     def get_readable_name(self):
         return self.season.name + ' ' + self.division.name
 
@@ -782,21 +1086,22 @@ class SeasonDivision(PaginatedAPIMixin, db.Model):
             'season': self.season.name,
             'division': self.division.name,
             'league': self.season.league.acronym,
-            'teams_count': len(self.teams),
-            'free_agents_count': len(self.free_agents),
-            'rookies_count': len(self.rookies),
-            'matches_count': len(self.matches),
-            'finals_count': len(self.finals),
+            'teams_count': self.teams_count,
+            'free_agents_count': self.free_agents_count,
+            'rookies_count': self.rookies_count,
+            'matches_count': self.matches_count,
+            'finals_count': self.finals_count,
             '_links': {
-                'self': url_for('api.season_division.get_season_division', season_division_id=self.id),
-                'league': url_for('api.leagues.get_league', league_id_or_acronym=self.season.league_id),
-                'season': url_for('api.seasons.get_season', season_id=self.season_id),
-                'division': url_for('api.divisions.get_division', division_id=self.division_id),
-                'teams': url_for('api.season_division.get_teams_in_season_division', season_division_id=self.id),
-                'free_agents': url_for('api.season_division.get_free_agents_in_season_division', season_division_id=self.id),
-                'rookies': url_for('api.season_division.get_rookies_in_season_division', season_division_id=self.id),
-                'matches': url_for('api.season_division.get_matches_in_season_division', season_division_id=self.id),
-                'finals': url_for('api.season_division.get_finals_in_season_division', season_division_id=self.id)
+                'self': link_for('api.season_division.get_season_division', season_division_id=self.id),
+                'league': link_for('api.leagues.get_league', league_id_or_acronym=self.season.league_id),
+                'season': link_for('api.seasons.get_season', season_id=self.season_id),
+                'division': link_for('api.divisions.get_division', division_id=self.division_id),
+                'teams': link_for('api.season_division.get_teams_in_season_division', season_division_id=self.id),
+                'free_agents': link_for('api.season_division.get_free_agents_in_season_division', season_division_id=self.id),
+                'rookies': link_for('api.season_division.get_rookies_in_season_division', season_division_id=self.id),
+                'matches': link_for('api.season_division.get_matches_in_season_division', season_division_id=self.id),
+                'finals': link_for('api.season_division.get_finals_in_season_division', season_division_id=self.id),
+                'standings': link_for('api.season_division.get_season_division_standings', season_division_id=self.id)
             }
         }
         return data
@@ -808,10 +1113,10 @@ class SeasonDivision(PaginatedAPIMixin, db.Model):
             'division': self.division.name,
             'league': self.season.league.acronym,
             '_links': {
-                'self': url_for('api.season_division.get_season_division', season_division_id=self.id),
-                'season': url_for('api.seasons.get_season', season_id=self.season.id),
-                'division': url_for('api.divisions.get_division', division_id=self.division.id),
-                'league': url_for('api.leagues.get_league', league_id_or_acronym=self.season.league.id)
+                'self': link_for('api.season_division.get_season_division', season_division_id=self.id),
+                'season': link_for('api.seasons.get_season', season_id=self.season.id),
+                'division': link_for('api.divisions.get_division', division_id=self.division.id),
+                'league': link_for('api.leagues.get_league', league_id_or_acronym=self.season.league.id)
             }
         }
         return data
@@ -825,9 +1130,9 @@ class SeasonDivision(PaginatedAPIMixin, db.Model):
         response = season_division.to_simple_dict()
         response['teams'] = teams
         links = {
-            'self': url_for('api.season_division.get_teams_in_season_division', season_division_id=season_division.id),
-            'season_division': url_for('api.season_division.get_season_division', season_division_id=season_division.id),
-            'league': url_for('api.leagues.get_league', league_id_or_acronym=season_division.season.league.id)
+            'self': link_for('api.season_division.get_teams_in_season_division', season_division_id=season_division.id),
+            'season_division': link_for('api.season_division.get_season_division', season_division_id=season_division.id),
+            'league': link_for('api.leagues.get_league', league_id_or_acronym=season_division.season.league.id)
         }
         response['_links'] = links
         return response
@@ -836,51 +1141,83 @@ class SeasonDivision(PaginatedAPIMixin, db.Model):
     def get_seasons_dict(team_id):
         team = db.session.get(Team, team_id)
         seasons = []
-        for season in team.season_divisions:
+        for season in team.season_divisions.options(*SeasonDivision.collection_options()):
             seasons.append(season.to_simple_dict())
         response = team.to_simple_dict()
         response['season_divisions'] = seasons
         links = {
-            'self': url_for('api.teams.get_team_seasons', team_id=team.id),
-            'team': url_for('api.teams.get_team', team_id=team.id)
+            'self': link_for('api.teams.get_team_seasons', team_id=team.id),
+            'team': link_for('api.teams.get_team', team_id=team.id)
         }
         response['_links'] = links
         return response
 
     def get_rookies_dict(self):
-        rookies = []
-        for rookie in self.rookies:
-            rookies.append(rookie.to_simple_dict())
+        rookies = db.session.query(Player).options(joinedload(Player.user)).filter_by(first_season_id=self.id).all()
+        Player.prepare_collection(rookies)
+        rookies = [rookie.to_simple_dict() for rookie in rookies]
 
         response = self.to_simple_dict()
         response['rookies'] = rookies
         links = {
-            'self': url_for('api.season_division.get_rookies_in_season_division', season_division_id=self.id),
-            'season_division': url_for('api.season_division.get_season_division', season_division_id=self.id),
-            'league': url_for('api.leagues.get_league', league_id_or_acronym=self.season.league.id)
+            'self': link_for('api.season_division.get_rookies_in_season_division', season_division_id=self.id),
+            'season_division': link_for('api.season_division.get_season_division', season_division_id=self.id),
+            'league': link_for('api.leagues.get_league', league_id_or_acronym=self.season.league.id)
+        }
+        response['_links'] = links
+        return response
+
+    def get_standings_dict(self):
+        # teams that have not played yet are listed with an empty record
+        rows = db.session.query(Team, Standing).join(
+            season_division_team, season_division_team.c.team_id == Team.id
+        ).outerjoin(
+            Standing, sa.and_(Standing.team_id == Team.id, Standing.season_division_id == self.id)
+        ).filter(season_division_team.c.season_division_id == self.id)
+
+        standings = []
+        for team, standing in rows:
+            standing = standing or Standing(team=team, played=0, wins=0, losses=0, draws=0, ot_wins=0, ot_losses=0,
+                                            goals_for=0, goals_against=0, points=0)
+            standings.append(standing.to_dict())
+        standings.sort(key=lambda row: (-row['points'], -(row['wins'] + row['ot_wins']), -row['goal_difference'],
+                                        -row['goals_for'], row['team']['name']))
+        for position, row in enumerate(standings, start=1):
+            row['position'] = position
+
+        response = self.to_simple_dict()
+        response['standings'] = standings
+        links = {
+            'self': link_for('api.season_division.get_season_division_standings', season_division_id=self.id),
+            'season_division': link_for('api.season_division.get_season_division', season_division_id=self.id),
+            'league': link_for('api.leagues.get_league', league_id_or_acronym=self.season.league.id)
         }
         response['_links'] = links
         return response
 
-    def get_matches_dict(self, unplayed=False):
-        matches = []
-        for match in self.matches:
-            if match.results is None or not unplayed:
-                matches.append(match.to_simple_dict())
+    def get_matches_dict(self, unplayed=False, expand=None):
+        query = db.session.query(Match).options(*Match.collection_options(), *Match.expansion_options(expand)).filter_by(
+            season_division_id=self.id)
+        if unplayed:
+            query = query.filter(~Match.results.has())
+        matches = query.all()
+        Match.prepare_collection(matches)
+        Match.prepare_expansions(matches, expand)
+        matches = [match.embed(match.to_simple_dict(), expand) for match in matches]
 
         response = self.to_simple_dict()
         response['matches'] = matches
         links = {
-            'self': url_for('api.season_division.get_rookies_in_season_division', season_division_id=self.id),
-            'season_division': url_for('api.season_division.get_season_division', season_division_id=self.id),
-            'league': url_for('api.leagues.get_league', league_id_or_acronym=self.season.league.id)
+            'self': link_for('api.season_division.get_rookies_in_season_division', season_division_id=self.id),
+            'season_division': link_for('api.season_division.get_season_division', season_division_id=self.id),
+            'league': link_for('api.leagues.get_league', league_id_or_acronym=self.season.league.id)
         }
         response['_links'] = links
         return response
 
 
 # info of a match between two registered league teams
-class Match(db.Model):
+class Match(PaginatedAPIMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     season_division_id = db.Column(db.Integer, db.ForeignKey('season_division.id'))
     home_team_id = db.Column(db.Integer, db.ForeignKey('team.id'))
@@ -906,8 +1243,75 @@ class Match(db.Model):
             if field in data:
                 setattr(self, field, data[field])
 
+    @staticmethod
+    def collection_options():
+        return [
+            joinedload(Match.season_division).joinedload(SeasonDivision.season),
+            joinedload(Match.season_division).joinedload(SeasonDivision.division),
+            joinedload(Match.home_team),
+            joinedload(Match.away_team),
+            joinedload(Match.schedule),
+            joinedload(Match.results).joinedload(MatchResult.winner),
+            joinedload(Match.results).joinedload(MatchResult.loser),
+            selectinload(Match.streamer).selectinload(User.twitch)
+        ]
+
+    @staticmethod
+    def expansions():
+        return {
+            'home_team': Expansion([], lambda matches: Team.prepare_embedded([match.home_team for match in matches]),
+                                   lambda match: match.home_team.to_dict()),
+            'away_team': Expansion([], lambda matches: Team.prepare_embedded([match.away_team for match in matches]),
+                                   lambda match: match.away_team.to_dict()),
+            'results': Expansion([], None, lambda match: match.results.to_dict() if match.results else None),
+            'schedule': Expansion([], None, lambda match: match.schedule.to_dict() if match.schedule else None),
+            'stats': Expansion([], Match.prepare_accepted_periods, lambda match: match.accepted_periods())
+        }
+
+    @staticmethod
+    def get_accepted_periods(match_ids):
+        """Returns {match id: [accepted periods with their player data]} for many matches, with two queries"""
+        periods = {match_id: [] for match_id in match_ids}
+        period_query = db.session.query(MatchData, Lobby.match_id).join(Lobby, MatchData.lobby_id == Lobby.id).filter(
+            Lobby.match_id.in_(list(periods)), MatchData.accepted == True).order_by(sa.asc(MatchData.current_period))
+        rows = period_query.all()
+        player_data = MatchData.get_player_data([period.id for period, _ in rows])
+        for period, match_id in rows:
+            period_data = period.to_dict()
+            period_data['player_data'] = [player.to_dict() for player in player_data[period.id]]
+            periods[match_id].append(period_data)
+        return periods
+
+    @staticmethod
+    def prepare_accepted_periods(matches):
+        periods = Match.get_accepted_periods([match.id for match in matches])
+        for match in matches:
+            match._accepted_periods = periods[match.id]
+
+    def accepted_periods(self):
+        # already resolved for the whole page by prepare_accepted_periods
+        if '_accepted_periods' in self.__dict__:
+            return self._accepted_periods
+        return Match.get_accepted_periods([self.id])[self.id]
+
+    @staticmethod
+    def prepare_collection(matches):
+        """Resolves the active lobby of every match with one query"""
+        current_lobbies = {}
+        if matches:
+            query = db.session.query(Lobby).filter(Lobby.match_id.in_([match.id for match in matches]),
+                                                   Lobby.active == True)
+            for lobby in query:
+                current_lobbies.setdefault(lobby.match_id, lobby)
+        for match in matches:
+            match._current_lobby = current_lobbies.get(match.id)
+
     def current_lobby(self):
-        current_lobby = self.lobbies.filter_by(active=True).first()
+        # already resolved for the whole page by prepare_collection
+        if '_current_lobby' in self.__dict__:
+            current_lobby = self._current_lobby
+        else:
+            current_lobby = self.lobbies.filter_by(active=True).first()
         return {'id': current_lobby.id, 'password': current_lobby.password} if current_lobby else None
 
     def to_dict(self):
@@ -925,11 +1329,11 @@ class Match(db.Model):
             'current_lobby': self.current_lobby(),
             'results': self.results.to_dict() if self.results else None,
             '_links': {
-                'self': url_for('api.match.get_match', match_id=self.id),
-                'season_division': url_for('api.season_division.get_season_division', season_division_id=self.season_division_id),
-                'home_team': url_for('api.teams.get_team', team_id=self.home_team_id),
-                'away_team': url_for('api.teams.get_team', team_id=self.away_team_id),
-                'streamer': url_for('api.users.twitch.get_user_twitch', user_id=self.streamer_id) if self.streamer else None
+                'self': link_for('api.match.get_match', match_id=self.id),
+                'season_division': link_for('api.season_division.get_season_division', season_division_id=self.season_division_id),
+                'home_team': link_for('api.teams.get_team', team_id=self.home_team_id),
+                'away_team': link_for('api.teams.get_team', team_id=self.away_team_id),
+                'streamer': link_for('api.users.twitch.get_user_twitch', user_id=self.streamer_id) if self.streamer else None
             }
         }
         return data
@@ -946,9 +1350,9 @@ class Match(db.Model):
             'scheduled_time': self.schedule.scheduled_time,
             'current_lobby': self.current_lobby(),
             '_links': {
-                'self': url_for('api.match.get_match', match_id=self.id),
-                'home_team': url_for('api.teams.get_team', team_id=self.home_team_id),
-                'away_team': url_for('api.teams.get_team', team_id=self.away_team_id),
+                'self': link_for('api.match.get_match', match_id=self.id),
+                'home_team': link_for('api.teams.get_team', team_id=self.home_team_id),
+                'away_team': link_for('api.teams.get_team', team_id=self.away_team_id),
             }
         }
         return data
@@ -990,12 +1394,52 @@ class MatchResult(db.Model):
             'forfeit': self.forfeit,
             'vod': self.vod,
             '_links': {
-                'self': url_for('api.match.get_match', match_id=self.id)
+                'self': link_for('api.match.get_match', match_id=self.id)
             }
         }
         return data
 
 
+# league table row of a team in a season/division, kept up to date as match results are recorded
+class Standing(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('season_division_id', 'team_id', name='uq_standing_season_division_team'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    season_division_id = db.Column(db.Integer, db.ForeignKey('season_division.id'), nullable=False)
+    team_id = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=False)
+    played = db.Column(db.Integer, nullable=False, default=0)
+    wins = db.Column(db.Integer, nullable=False, default=0)
+    losses = db.Column(db.Integer, nullable=False, default=0)
+    draws = db.Column(db.Integer, nullable=False, default=0)
+    ot_wins = db.Column(db.Integer, nullable=False, default=0)
+    ot_losses = db.Column(db.Integer, nullable=False, default=0)
+    goals_for = db.Column(db.Integer, nullable=False, default=0)
+    goals_against = db.Column(db.Integer, nullable=False, default=0)
+    points = db.Column(db.Integer, nullable=False, default=0)
+    streak = db.Column(db.String(8))  # e.g. W3, L1, D2
+
+    team = db.relationship('Team')
+
+    def to_dict(self):
+        data = {
+            'team': self.team.to_simple_dict(),
+            'played': self.played,
+            'wins': self.wins,
+            'losses': self.losses,
+            'draws': self.draws,
+            'ot_wins': self.ot_wins,
+            'ot_losses': self.ot_losses,
+            'goals_for': self.goals_for,
+            'goals_against': self.goals_against,
+            'goal_difference': self.goals_for - self.goals_against,
+            'points': self.points,
+            'streak': self.streak
+        }
+        return data
+
+
 # presets for creating lobbies using different match types
 class Matchtype(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -1021,7 +1465,7 @@ class Matchtype(db.Model):
             'game_mode': self.game_mode,
             'num_players': self.num_players,
             '_links': {
-                'self': url_for('api.match.get_match_type', match_type_id=self.id)
+                'self': link_for('api.match.get_match_type', match_type_id=self.id)
             }
         }
         return data
@@ -1040,6 +1484,7 @@ class Lobby(db.Model):
     active = db.Column(db.Boolean, nullable=False, default=True)
     password = db.Column(db.String(64), nullable=False)
     task_id = db.Column(db.String(64))
+    monitor_start = db.Column(db.DateTime)
 
     match = db.relationship('Match', back_populates='lobbies')
     match_data = db.relationship('MatchData', back_populates='lobby', lazy='dynamic')
@@ -1075,6 +1520,33 @@ class MatchData(db.Model):
             if field in data:
                 setattr(self, field, data[field])
 
+    @staticmethod
+    def get_player_data(period_ids):
+        """Returns {period id: [PlayerMatchData]} for many periods with one query"""
+        player_data = {period_id: [] for period_id in period_ids}
+        query = db.session.query(PlayerMatchData).options(
+            joinedload(PlayerMatchData.player), joinedload(PlayerMatchData.team)
+        ).filter(PlayerMatchData.match_id.in_(list(player_data)))
+        for player in query:
+            player_data[player.match_id].append(player)
+        return player_data
+
+    @staticmethod
+    def export_select(season_division_ids, accepted=True):
+        """Flat rows of the periods played in matches of the season divisions (an id list or select), for exports"""
+        statement = sa.select(
+            MatchData.id.label('period_id'), Match.id.label('match_id'), Match.season_division_id, MatchData.lobby_id,
+            MatchData.match_id.label('game_id'), MatchData.processed, MatchData.accepted, MatchData.source,
+            MatchData.region, MatchData.gamemode, MatchData.created, MatchData.arena, Match.home_team_id,
+            Match.away_team_id, MatchData.home_score, MatchData.away_score, MatchData.winner, MatchData.current_period,
+            MatchData.periods_enabled, MatchData.custom_mercy_rule, MatchData.end_reason
+        ).join(Lobby, MatchData.lobby_id == Lobby.id).join(Match, Lobby.match_id == Match.id).where(
+            Match.season_division_id.in_(season_division_ids)
+        ).order_by(MatchData.id)
+        if accepted:
+            statement = statement.where(MatchData.accepted == True)
+        return statement
+
     def to_dict(self):
         data = {
             'id': self.id,
@@ -1133,6 +1605,31 @@ class PlayerMatchData(db.Model):
             if field in data:
                 setattr(self, field, data[field])
 
+    @staticmethod
+    def export_select(season_division_ids, accepted=True):
+        """Flat rows of every players stats in each period of matches of the season divisions (an id list or select),
+        for exports"""
+        stats = [PlayerMatchData.goals, PlayerMatchData.shots, PlayerMatchData.assists, PlayerMatchData.saves,
+                 PlayerMatchData.primary_assists, PlayerMatchData.secondary_assists, PlayerMatchData.passes,
+                 PlayerMatchData.blocks, PlayerMatchData.takeaways, PlayerMatchData.turnovers,
+                 PlayerMatchData.possession_time_sec, PlayerMatchData.game_winning_goals, PlayerMatchData.overtime_goals,
+                 PlayerMatchData.post_hits, PlayerMatchData.faceoffs_won, PlayerMatchData.faceoffs_lost,
+                 PlayerMatchData.score]
+        statement = sa.select(
+            PlayerMatchData.id, PlayerMatchData.match_id.label('period_id'), Match.id.label('match_id'),
+            Match.season_division_id, MatchData.accepted, PlayerMatchData.player_id, Player.player_name,
+            PlayerMatchData.team_id, Team.name.label('team_name'), *stats
+        ).join(MatchData, PlayerMatchData.match_id == MatchData.id).join(
+            Lobby, MatchData.lobby_id == Lobby.id
+        ).join(Match, Lobby.match_id == Match.id).outerjoin(
+            Player, PlayerMatchData.player_id == Player.id
+        ).outerjoin(Team, PlayerMatchData.team_id == Team.id).where(
+            Match.season_division_id.in_(season_division_ids)
+        ).order_by(PlayerMatchData.id)
+        if accepted:
+            statement = statement.where(MatchData.accepted == True)
+        return statement
+
     def to_dict(self):
         data = {
             'id': self.match_id,
@@ -1155,13 +1652,47 @@ class PlayerMatchData(db.Model):
             'faceoffs_lost': self.faceoffs_lost,
             'score': self.score,
             '_links': {
-                'player': url_for('api.players.get_player', player_id=self.player_id),
-                'team': url_for('api.teams.get_team', team_id=self.team_id)
+                'player': link_for('api.players.get_player', player_id=self.player_id),
+                'team': link_for('api.teams.get_team', team_id=self.team_id)
             }
         }
         return data
 
 
+# running totals of accepted PlayerMatchData, one row per player per team per season/division
+class PlayerSeasonStats(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('player_id', 'season_division_id', 'team_id', name='uq_player_season_stats'),
+    )
+
+    stat_fields = ['goals', 'shots', 'assists', 'saves', 'primary_assists', 'secondary_assists', 'passes', 'blocks',
+                   'takeaways', 'turnovers', 'possession_time_sec', 'game_winning_goals', 'overtime_goals',
+                   'post_hits', 'faceoffs_won', 'faceoffs_lost', 'score']
+
+    id = db.Column(db.Integer, primary_key=True)
+    player_id = db.Column(db.Integer, db.ForeignKey('player.id'), nullable=False)
+    season_division_id = db.Column(db.Integer, db.ForeignKey('season_division.id'), nullable=False, index=True)
+    team_id = db.Column(db.Integer, db.ForeignKey('team.id'), nullable=False)
+    periods = db.Column(db.Integer, nullable=False, default=0)
+    goals = db.Column(db.Integer, nullable=False, default=0)
+    shots = db.Column(db.Integer, nullable=False, default=0)
+    assists = db.Column(db.Integer, nullable=False, default=0)
+    saves = db.Column(db.Integer, nullable=False, default=0)
+    primary_assists = db.Column(db.Integer, nullable=False, default=0)
+    secondary_assists = db.Column(db.Integer, nullable=False, default=0)
+    passes = db.Column(db.Integer, nullable=False, default=0)
+    blocks = db.Column(db.Integer, nullable=False, default=0)
+    takeaways = db.Column(db.Integer, nullable=False, default=0)
+    turnovers = db.Column(db.Integer, nullable=False, default=0)
+    possession_time_sec = db.Column(db.Integer, nullable=False, default=0)
+    game_winning_goals = db.Column(db.Integer, nullable=False, default=0)
+    overtime_goals = db.Column(db.Integer, nullable=False, default=0)
+    post_hits = db.Column(db.Integer, nullable=False, default=0)
+    faceoffs_won = db.Column(db.Integer, nullable=False, default=0)
+    faceoffs_lost = db.Column(db.Integer, nullable=False, default=0)
+    score = db.Column(db.Integer, nullable=False, default=0)
+
+
 class Final(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     season_division_id = db.Column(db.Integer, db.ForeignKey('season_division.id'))
@@ -1234,6 +1765,14 @@ class MatchSchedule(db.Model):
 
     match = db.relationship('Match', back_populates='schedule')
 
+    def to_dict(self):
+        data = {
+            'scheduled_time': self.scheduled_time,
+            'home_team_accepted': self.home_team_accepted,
+            'away_team_accepted': self.away_team_accepted
+        }
+        return data
+
 
 class MatchAvailability(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -1314,6 +1853,33 @@ class MatchReview(db.Model):
         return data
 
 
+def count_property(column, *where, distinct=False):
+    """Correlated COUNT subquery mapped as a deferred column. All counts of a model are in the 'counts' group, so they
+    load together with one query on first access, or with the parent row when undefer_group('counts') is used"""
+    count = sa.func.count(sa.distinct(column)) if distinct else sa.func.count(column)
+    return db.column_property(sa.select(count).where(*where).scalar_subquery(), deferred=True, group='counts')
+
+
+# relationship counts used by the serializers, defined here so the subqueries can reference every model
+User.streamed_matches_count = count_property(Match.id, Match.streamer_id == User.id)
+Permission.users_count = count_property(UserPermissions.id, UserPermissions.permission_id == Permission.id)
+Player.teams_count = count_property(PlayerTeam.team_id, PlayerTeam.player_id == Player.id, distinct=True)
+Player.free_agent_seasons_count = count_property(FreeAgent.id, FreeAgent.player_id == Player.id)
+Player.awards_count = count_property(PlayerAward.id, PlayerAward.player_id == Player.id)
+Team.seasons_count = count_property(season_division_team.c.season_division_id, season_division_team.c.team_id == Team.id)
+Team.awards_count = count_property(TeamAward.id, TeamAward.team_id == Team.id)
+League.seasons_count = count_property(Season.id, Season.league_id == League.id)
+League.divisions_count = count_property(Division.id, Division.league_id == League.id)
+Season.divisions_count = count_property(SeasonDivision.id, SeasonDivision.season_id == Season.id)
+Division.seasons_count = count_property(SeasonDivision.id, SeasonDivision.division_id == Division.id)
+SeasonDivision.teams_count = count_property(season_division_team.c.team_id,
+                                            season_division_team.c.season_division_id == SeasonDivision.id)
+SeasonDivision.free_agents_count = count_property(FreeAgent.id, FreeAgent.season_division_id == SeasonDivision.id)
+SeasonDivision.rookies_count = count_property(Player.id, Player.first_season_id == SeasonDivision.id)
+SeasonDivision.matches_count = count_property(Match.id, Match.season_division_id == SeasonDivision.id)
+SeasonDivision.finals_count = count_property(Final.id, Final.season_division_id == SeasonDivision.id)
+
+
 @login.user_loader
 def load_user(user_id):
     return db.session.get(User, int(user_id))
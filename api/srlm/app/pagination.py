@@ -0,0 +1,40 @@
+"""Keyset (cursor) pagination helpers.
+Cursor pages filter on the primary key after the last item of the previous page instead of using OFFSET, so every
+page costs the same as the first. Cursors are opaque to clients - urlsafe base64 of the last key"""
+import base64
+import hashlib
+import json
+import sqlalchemy as sa
+from api.srlm.app import db, cache
+
+# how long the total count of a cursor paginated collection is cached
+TOTAL_TIMEOUT = 300
+
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(json.dumps({'id': last_id}).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Returns the position encoded in a cursor ({} for the start of the collection). Raises ValueError if invalid"""
+    if not token:
+        return {}
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(data, dict) or not isinstance(data.get('id'), int):
+        raise ValueError('Invalid cursor')
+    return data
+
+
+def cached_total(statement):
+    """Total rows of a select, cached for TOTAL_TIMEOUT seconds so cursor pages don't count the table every time"""
+    statement = statement.order_by(None)
+    compiled = statement.compile()
+    key = f'collection_total/{hashlib.md5(f"{compiled}{sorted(compiled.params.items())}".encode()).hexdigest()}'
+    total = cache.get(key)
+    if total is None:
+        total = db.session.scalar(sa.select(sa.func.count()).select_from(statement.subquery()))
+        cache.set(key, total, timeout=TOTAL_TIMEOUT)
+    return total
@@ -0,0 +1,75 @@
+"""Compiled permission sets.
+A users permissions are compiled once into a dict of permission key to the scopes it was granted for, parsed from the
+UserPermissions.additional_modifiers string. Checks are then set lookups, and the compiled set is cached with the
+users verified token so authorization doesn't query the database.
+
+Modifiers are comma separated `kind:value` scopes, e.g. `league:1, team:12`. A permission without modifiers is
+granted everywhere. Modifiers written before scopes existed were free text that didn't restrict the permission, so any
+that don't parse are still an unscoped grant"""
+import re
+from api.srlm.logger import get_logger
+
+log = get_logger(__name__)
+
+MODIFIER_PATTERN = re.compile(r'^\s*([a-z_]+)\s*:\s*([\w-]+)\s*$', re.IGNORECASE)
+
+
+def parse_modifiers(modifiers):
+    """Parses an additional_modifiers string into a frozenset of (kind, value) scopes.
+    Raises ValueError if any scope is not in the `kind:value` format"""
+    scopes = set()
+    if not modifiers:
+        return frozenset()
+    for part in re.split(r'[,;]', modifiers):
+        if not part.strip():
+            continue
+        match = MODIFIER_PATTERN.match(part)
+        if match is None:
+            raise ValueError(f"Invalid permission modifier '{part.strip()}' - use kind:value, e.g. league:1")
+        kind, value = match.group(1).lower(), match.group(2)
+        scopes.add((kind, int(value) if value.isdigit() else value.lower()))
+    return frozenset(scopes)
+
+
+class PermissionSet:
+    """Permissions of a user as {key: frozenset of (kind, value) scopes}, an empty set is an unscoped grant"""
+    def __init__(self, grants=None):
+        self.grants = grants or {}
+
+    @classmethod
+    def compile(cls, rows):
+        """Builds the set from (permission key, additional_modifiers) rows. Unparseable (legacy) modifiers are an
+        unscoped grant"""
+        grants = {}
+        for key, modifiers in rows:
+            try:
+                scopes = parse_modifiers(modifiers)
+            except ValueError:
+                log.warning(f"Permission '{key}' has modifiers that aren't kind:value scopes ('{modifiers}') - "
+                            f"granted unscoped")
+                scopes = frozenset()
+            if key in grants and (not grants[key] or not scopes):
+                grants[key] = frozenset()
+            else:
+                grants[key] = grants.get(key, frozenset()) | scopes
+        return cls(grants)
+
+    def has(self, key, **scope):
+        """True if the permission is granted for any of the given scopes, e.g. has('league_coordinator', league=1).
+        Without a scope any grant of the permission counts"""
+        scopes = self.grants.get(key)
+        if scopes is None:
+            return False
+        if not scope or not scopes:
+            return True
+        return any((kind, value) in scopes for kind, value in scope.items())
+
+    def scopes(self, key, kind):
+        """Values of one kind of scope the permission is granted for, e.g. the league ids of a league coordinator"""
+        return {value for scope_kind, value in self.grants.get(key, ()) if scope_kind == kind}
+
+    def keys(self):
+        return sorted(self.grants)
+
+    def __contains__(self, key):
+        return key in self.grants
@@ -0,0 +1,121 @@
+"""Functions for resolving which team a player was on at a point in time or during a date range.
+Lookups are done for many players/teams at once using the composite indexes on the PlayerTeam table"""
+from bisect import bisect_right
+from datetime import datetime, time, timezone
+import sqlalchemy as sa
+from api.srlm.app import db, cache
+from api.srlm.app.models import PlayerTeam, Season
+
+# how long the season intervals stay cached, roster changes invalidate them anyway
+SEASON_INTERVALS_TIMEOUT = 3600
+
+
+def to_utc(value):
+    """Converts dates and aware datetimes to the naive UTC datetimes stored in the database"""
+    if value is None:
+        return None
+    if not isinstance(value, datetime):
+        return datetime.combine(value, time.min)
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def teams_at(player_ids, at=None):
+    """Returns {player_id: PlayerTeam} for the roster entry of each player active at the given time (default now).
+    Players without a team at that time are left out"""
+    at = to_utc(at) or datetime.utcnow()
+    query = db.session.query(PlayerTeam).filter(
+        PlayerTeam.player_id.in_(list(player_ids)),
+        PlayerTeam.active_at(at)
+    ).order_by(sa.desc(PlayerTeam.start_date))
+
+    teams = {}
+    for player_team in query:
+        teams.setdefault(player_team.player_id, player_team)
+    return teams
+
+
+def rosters_at(team_ids, at=None):
+    """Returns {team_id: [PlayerTeam]} for the players on each team at the given time (default now)"""
+    at = to_utc(at) or datetime.utcnow()
+    query = db.session.query(PlayerTeam).filter(PlayerTeam.team_id.in_(list(team_ids)), PlayerTeam.active_at(at))
+
+    rosters = {team_id: [] for team_id in team_ids}
+    for player_team in query:
+        rosters[player_team.team_id].append(player_team)
+    return rosters
+
+
+def rosters_between(team_ids, start, end):
+    """Returns {team_id: [PlayerTeam]} for the players on each team at any point in the given date range"""
+    query = db.session.query(PlayerTeam).filter(
+        PlayerTeam.team_id.in_(list(team_ids)),
+        PlayerTeam.active_between(to_utc(start), to_utc(end))
+    )
+
+    rosters = {team_id: [] for team_id in team_ids}
+    for player_team in query:
+        rosters[player_team.team_id].append(player_team)
+    return rosters
+
+
+class SeasonIntervals:
+    """Every roster entry that overlaps a season, stored as sorted (start, end, team_id) intervals per player"""
+    def __init__(self, season_id, rows):
+        self.season_id = season_id
+        self.players = {}
+        self.teams = {}
+        for player_id, team_id, start, end in sorted(rows, key=lambda row: (row[0], row[2])):
+            self.players.setdefault(player_id, []).append((start, end, team_id))
+            self.teams.setdefault(team_id, []).append((player_id, start, end))
+        self.starts = {player_id: [interval[0] for interval in intervals]
+                       for player_id, intervals in self.players.items()}
+
+    def team_at(self, player_id, at):
+        """Team id of the player at the given time, or None"""
+        at = to_utc(at)
+        intervals = self.players.get(player_id, [])
+        # walk back from the last interval starting before `at` - entries can overlap if a player was moved
+        for start, end, team_id in reversed(intervals[:bisect_right(self.starts.get(player_id, []), at)]):
+            if start < at and (end is None or end > at):
+                return team_id
+        return None
+
+    def teams_at(self, player_ids, at):
+        """Returns {player_id: team_id} for the given players at the given time"""
+        teams = {}
+        for player_id in player_ids:
+            team_id = self.team_at(player_id, at)
+            if team_id is not None:
+                teams[player_id] = team_id
+        return teams
+
+    def members(self, team_id):
+        """List of (player_id, start, end) for every roster entry of the team during the season"""
+        return self.teams.get(team_id, [])
+
+
+@cache.memoize(timeout=SEASON_INTERVALS_TIMEOUT)
+def season_intervals(season_id):
+    """Builds (and caches) the roster intervals for a season. Seasons without dates cover all roster history"""
+    season = db.session.get(Season, season_id)
+    filters = [PlayerTeam.start_date != None]
+    if season.end_date:
+        filters.append(PlayerTeam.start_date < to_utc(season.end_date))
+    if season.start_date:
+        filters.append(sa.or_(PlayerTeam.end_date == None, PlayerTeam.end_date > to_utc(season.start_date)))
+
+    rows = db.session.execute(
+        sa.select(PlayerTeam.player_id, PlayerTeam.team_id, PlayerTeam.start_date, PlayerTeam.end_date).where(*filters)
+    ).all()
+    return SeasonIntervals(season_id, [tuple(row) for row in rows])
+
+
+def invalidate_season_intervals(season_id=None):
+    """Clears the cached season intervals - call after any change to the PlayerTeam table or season dates.
+    Clears every season unless a season_id is given"""
+    if season_id is None:
+        cache.delete_memoized(season_intervals)
+    else:
+        cache.delete_memoized(season_intervals, season_id)
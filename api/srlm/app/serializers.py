@@ -0,0 +1,182 @@
+"""Compiled response serializers.
+Marshmallow dumps every field through Field.serialize, its accessor and get_value, which dominates the CPU time of
+large responses such as pages of players or matches with their _links. With FAST_SERIALIZATION on, each response
+schema is compiled once into a function of (key, attribute, converter) per field, where the converters of the common
+fields (strings, ints, bools, lists, dicts and nested schemas) are plain python, and any other field uses its own
+_serialize - so the output is always the same as schema.dump. Schemas this can't reproduce exactly (dump hooks, dump
+defaults, dotted attributes, custom accessors) are left to marshmallow"""
+import time
+from collections import OrderedDict
+from functools import partial
+import apifairy
+from flask import current_app, jsonify as flask_jsonify
+from marshmallow import fields, missing, Schema as BaseSchema
+from marshmallow.decorators import PRE_DUMP, POST_DUMP
+from marshmallow.utils import ensure_text_type
+
+
+def get_value(obj, attr):
+    """Same lookup as marshmallow's get_value for undotted attributes - obj[attr], then the attribute"""
+    if not hasattr(obj, '__getitem__'):
+        return getattr(obj, attr, missing)
+    try:
+        return obj[attr]
+    except (KeyError, IndexError, TypeError, AttributeError):
+        return getattr(obj, attr, missing)
+
+
+def serialize_string(value, attr, obj):
+    if value is None or type(value) is str:
+        return value
+    return ensure_text_type(value)
+
+
+def serialize_int(value, attr, obj):
+    if value is None or type(value) is int:
+        return value
+    return int(value)
+
+
+def field_converter(field):
+    """Function of (value, attr, obj) giving the same result as field._serialize"""
+    serialize = type(field)._serialize
+    if serialize is fields.String._serialize:
+        return serialize_string
+    if serialize is fields.Number._serialize and field.num_type is int and not field.as_string:
+        return serialize_int
+    if serialize is fields.Boolean._serialize:
+        def serialize_bool(value, attr, obj):
+            if value is None or value is True or value is False:
+                return value
+            return field._serialize(value, attr, obj)
+        return serialize_bool
+    if serialize is fields.Nested._serialize:
+        return nested_converter(field)
+    if serialize is fields.List._serialize:
+        inner = field_converter(field.inner)
+
+        def serialize_list(value, attr, obj):
+            if value is None:
+                return None
+            return [inner(each, attr, obj) for each in value]
+        return serialize_list
+    if serialize is fields.Mapping._serialize and field.mapping_type is dict:
+        return mapping_converter(field)
+    return field._serialize
+
+
+def nested_converter(field):
+    """Nested schemas are compiled when first serialized, so schemas can nest themselves"""
+    compiled = []
+
+    def serialize_nested(value, attr, obj):
+        if value is None:
+            return None
+        if not compiled:
+            schema = field.schema
+            compiled.append((serializer(schema), schema.many or field.many))
+        dump, many = compiled[0]
+        return dump(value, many)
+    return serialize_nested
+
+
+def mapping_converter(field):
+    key_converter = field_converter(field.key_field) if field.key_field is not None else None
+    value_converter = field_converter(field.value_field) if field.value_field is not None else None
+
+    def serialize_mapping(value, attr, obj):
+        if value is None:
+            return None
+        if key_converter is None and value_converter is None:
+            return dict(value)
+        result = {}
+        for key, item in value.items():
+            if key_converter is not None:
+                key = key_converter(key, None, None)
+            result[key] = value_converter(item, None, None) if value_converter is not None else item
+        return result
+    return serialize_mapping
+
+
+def compilable(schema):
+    """True if the compiled serializer gives exactly what schema.dump does"""
+    if schema._has_processors(PRE_DUMP) or schema._has_processors(POST_DUMP):
+        return False
+    # ordered (SQLAlchemy) schemas dump to OrderedDicts - the compiled dict keeps the same order
+    if schema.dict_class not in (dict, OrderedDict):
+        return False
+    if type(schema).get_attribute is not BaseSchema.get_attribute:
+        return False
+    for name, field in schema.dump_fields.items():
+        attr = field.attribute or name
+        if '.' in attr or field.dump_default is not missing or not field._CHECK_ATTRIBUTE:
+            return False
+        if type(field).get_value is not fields.Field.get_value or type(field).serialize is not fields.Field.serialize:
+            return False
+    return True
+
+
+def compile_schema(schema):
+    """Function of (obj, many) with the same output as schema.dump(obj, many=many)"""
+    if not compilable(schema):
+        return lambda obj, many: schema.dump(obj, many=many)
+
+    plan = tuple((field.data_key if field.data_key is not None else name, field.attribute or name,
+                  field_converter(field)) for name, field in schema.dump_fields.items())
+
+    def dump_one(obj):
+        data = {}
+        for key, attr, convert in plan:
+            value = get_value(obj, attr)
+            if value is not missing:
+                data[key] = convert(value, attr, obj)
+        return data
+
+    def dump(obj, many):
+        if many and obj is not None:
+            return [dump_one(item) for item in obj]
+        return dump_one(obj)
+    return dump
+
+
+def serializer(schema):
+    """The compiled serializer of a schema instance, compiled on first use"""
+    dump = schema.__dict__.get('_compiled_dump')
+    if dump is None:
+        dump = schema._compiled_dump = compile_schema(schema)
+    return dump
+
+
+def jsonify(schema, obj, many=None, *args, **kwargs):
+    """schema.jsonify, using the compiled serializer when FAST_SERIALIZATION is on"""
+    if many is None:
+        many = schema.many
+    if current_app.config['FAST_SERIALIZATION']:
+        data = serializer(schema)(obj, many)
+    else:
+        data = schema.dump(obj, many=many)
+    return flask_jsonify(data, *args, **kwargs)
+
+
+def response(schema, status_code=200, description=None, headers=None):
+    """apifairy's response decorator, serializing the response with the compiled serializer when enabled"""
+    if isinstance(schema, type):
+        schema = schema()
+    schema.jsonify = partial(jsonify, schema)
+    return apifairy.response(schema, status_code=status_code, description=description, headers=headers)
+
+
+def benchmark(schema, data, repeat=5):
+    """Seconds of CPU time to dump `data` with marshmallow and with the compiled serializer (best of `repeat`), and
+    whether both gave the same output"""
+    dump = compile_schema(schema)
+    timings = {}
+    for name, serialize in [('marshmallow', lambda: schema.dump(data)), ('compiled', lambda: dump(data, schema.many))]:
+        best = None
+        for _ in range(repeat):
+            start = time.process_time()
+            serialize()
+            seconds = time.process_time() - start
+            best = seconds if best is None else min(best, seconds)
+        timings[name] = best
+    return timings, schema.dump(data) == dump(data, schema.many)
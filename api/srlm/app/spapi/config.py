@@ -1,6 +1,8 @@
 """Provides easy access to the API by creating methods that inject the authorization headers"""
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 class SlapAPI:
@@ -8,11 +10,49 @@ class SlapAPI:
     api_key = os.getenv('SLAP_API_KEY')
     headers = {"Authorization": f"Bearer {api_key}"}
 
+    # (connect, read) timeouts in seconds
+    timeout = (float(os.getenv('SLAP_API_CONNECT_TIMEOUT', 3.05)), float(os.getenv('SLAP_API_READ_TIMEOUT', 10)))
+    pool_connections = int(os.getenv('SLAP_API_POOL_CONNECTIONS', 4))
+    pool_maxsize = int(os.getenv('SLAP_API_POOL_MAXSIZE', 32))
+    max_retries = int(os.getenv('SLAP_API_MAX_RETRIES', 3))
+    backoff_factor = float(os.getenv('SLAP_API_BACKOFF_FACTOR', 0.5))
+    backoff_jitter = float(os.getenv('SLAP_API_BACKOFF_JITTER', 0.5))
+
+    def __init__(self):
+        self._session = None
+        self._pid = None
+
+    @property
+    def session(self):
+        # one keep-alive session per process - celery forks workers after import, so a session created in the parent
+        # would have its pooled sockets shared between children
+        if self._session is None or self._pid != os.getpid():
+            self._session = self.make_session()
+            self._pid = os.getpid()
+        return self._session
+
+    def make_session(self):
+        # only idempotent methods are retried (POST is excluded by default) so a lobby is never created twice
+        retry = Retry(
+            total=self.max_retries,
+            backoff_factor=self.backoff_factor,
+            backoff_jitter=self.backoff_jitter,
+            status_forcelist=[500, 502, 503, 504],
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize,
+                              max_retries=retry)
+        session = requests.Session()
+        session.headers.update(self.headers)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
     def post(self, endpoint, json):
-        return requests.post(f'{self.api_url}{endpoint}', json=json, headers=self.headers)
+        return self.session.post(f'{self.api_url}{endpoint}', json=json, timeout=self.timeout)
 
     def get(self, endpoint):
-        return requests.get(f'{self.api_url}{endpoint}', headers=self.headers)
+        return self.session.get(f'{self.api_url}{endpoint}', timeout=self.timeout)
 
     def delete(self, endpoint):
-        return requests.delete(f'{self.api_url}{endpoint}', headers=self.headers)
+        return self.session.delete(f'{self.api_url}{endpoint}', timeout=self.timeout)
@@ -1,10 +1,16 @@
 """This module provides methods that manage in-game lobbies and retrieve/process the game stats"""
 import datetime
 import random
+import sqlalchemy as sa
+from sqlalchemy.orm import joinedload
 from celery import shared_task
-from celery.contrib.abortable import AbortableTask
+from celery.utils import uuid
 from api.srlm.app import db, create_app
-from api.srlm.app.models import Lobby, MatchData, Player, PlayerMatchData
+from api.srlm.app.api.utils.cache import invalidate, entity_tags
+from api.srlm.app.models import Lobby, MatchData, Player, PlayerMatchData, FreeAgent
+from api.srlm.app.rosters import teams_at
+from api.srlm.app.standings import record_result
+from api.srlm.app.stats import add_player_stats
 from api.srlm.app.spapi.lobby import create_lobby
 from celery.utils.log import get_task_logger
 
@@ -49,139 +55,24 @@ def generate_lobby(match, current_period=1, initial_stats=None, initial_score=No
     slap_lobby_id = create_lobby(lobby_settings)
 
     # create a lobby object in the database and store the lobby_id, match_id, password
+    # the lobby supervisor picks up active lobbies and starts monitoring them once monitor_start has passed
+    # task_id is used as the abort signal for the monitor (see task_manager.tasks.cancel_task)
     lobby = Lobby()
     lobby.lobby_id = slap_lobby_id
     lobby.match = match
     lobby.password = password
+    lobby.task_id = uuid()
+    lobby.monitor_start = datetime.datetime.utcnow() + datetime.timedelta(seconds=delay)
 
     db.session.add(lobby)
     db.session.commit()
-
-    # start monitoring the lobby using a lobby monitor task
-    monitor_task = lobby_monitor.apply_async(args=[lobby.id], countdown=delay)
-
-    # Store task_id in the database
-    lobby.task_id = monitor_task.id
-    db.session.commit()
+    # the match and season's match list show the active lobby
+    invalidate(f'match:{match.id}', f'season_division:{match.season_division_id}')
 
     # return the lobby
     return lobby
 
 
-@shared_task(bind=True, base=AbortableTask)
-def lobby_monitor(self, lobby_id):
-    app, celery = create_app()
-    with app.app_context():
-        import time
-        import sqlalchemy as sa
-        from api.srlm.app.models import Lobby
-        from api.srlm.app.spapi.lobby import get_lobby, delete_lobby
-
-        # get lobby info from db
-        lobby = db.session.query(Lobby).filter_by(id=lobby_id).first()
-        match_type = lobby.match.season_division.season.match_type
-        log.info(f'Lobby {lobby.id} details pulled from database')
-
-        max_time = 60  # max time for process in minutes
-        i = 0  # counts loop increments
-        check_interval = 10  # how often to check for abort signal in seconds
-        finished = False  # loop controller
-        end_reason = None  # used for return message and skip condition in loop
-        retrieve_stats_task = None  # results from retrieve_stats_task
-
-        # how often the monitor will check on the lobby via an API request
-        # is based on match length (aka period length - default is 5 minutes)
-        monitor_interval = match_type.match_length
-
-        log.info(
-            f'Initialized monitor ||| Max time: {max_time} minutes, Abort check interval: {check_interval} seconds,'
-            f' API Request Interval: {monitor_interval} seconds ({monitor_interval / 60} minutes)')
-
-        while not finished:
-            if (i * check_interval) >= (max_time * 60):
-                # checks if max time has elapsed
-                end_reason = 'Aborted - Max time elapsed'
-                finished = True
-            elif self.is_aborted():
-                # checks if has been aborted
-                end_reason = 'Aborted - Received abort request'
-                finished = True
-
-            # counts the loops, used for math
-            i += 1
-
-            # checks if a match result has been parsed from the API
-            if retrieve_stats_task:
-                # check if it was successful
-                if retrieve_stats_task.state == 'SUCCESS':
-                    period_data = db.session.query(MatchData).filter_by(
-                        lobby_id=lobby.id,
-                        periods_enabled=match_type.periods,
-                        gamemode=match_type.game_mode
-                    ).order_by(sa.asc(MatchData.current_period))
-                    periods_valid = []
-                    current_period = 1
-                    for period in period_data:
-                        if period.current_period == current_period:
-                            player_count = db.session.query(PlayerMatchData).filter_by(
-                                match_id=period.id
-                            ).count()
-                            if player_count == match_type.num_players:
-                                periods_valid.append(current_period)
-                                current_period += 1
-
-                    if (periods_valid == [1, 2, 3] and match_type.periods) or (
-                            periods_valid == [1] and not match_type.periods):
-                        # looks like the match was completed with the correct number of periods and players
-                        validate_stats.delay(lobby.match.id)
-                        end_reason = 'Match results recorded'
-                        finished = True
-                        log.info('Match data retrieved successfully, requesting validation of data')
-                    else:
-                        retrieve_stats_task = None
-                        # retrieved stats incomplete, need to wait for a new result
-
-            # math to determine if API request should be made - skipped if task has been told to abort this loop
-            if i % round(monitor_interval / check_interval) == 0 and not end_reason:
-                # make API request
-                log.info('Making API request')
-                lobby_resp = get_lobby(lobby.lobby_id)
-                if lobby_resp.status_code == 200:
-                    lobby_info = lobby_resp.json()
-                    log.info(f"Period: {lobby_info['current_period']} | In-Game: {lobby_info['in_game']}")
-                    if (lobby_info['periods_enabled'] and lobby_info['current_period'] > 3) or (
-                            not lobby_info['periods_enabled'] and lobby_info['current_period'] > 1):
-                        # looks like match is completed - tell another worker to get the match results
-                        log.info('Detected possible match completion, requesting match data')
-                        retrieve_stats_task = get_match_data.delay(lobby.id)
-
-            time.sleep(check_interval)
-
-        # control loop exited, time to clean up
-        log.info(f'Monitor closing. Reason: {end_reason}')
-
-        # destroy the lobby in-game
-        delete = delete_lobby(lobby.lobby_id)
-        log.info(f'Delete lobby request sent: Status code {delete}')
-
-        # mark lobby as inactive in database
-        if delete == 200:
-            lobby.active = False
-            db.session.commit()
-            log.info('Lobby marked as inactive')
-
-        # check if get_match_data was run and found correct number of periods
-        # if no good signal received, tell a get_match_data worker to get the match stats
-        if end_reason != 'Match results recorded':
-            log.info('Lobby closing without completed match data - making final match data request')
-            get_match_data.delay(lobby.id)
-
-        return {
-            'end_reason': f'Lobby closed: {end_reason}',
-            'lobby_deleted': delete
-        }
-
-
 @shared_task
 def get_match_data(lobby_id):
     app, celery = create_app()
@@ -204,25 +95,39 @@ def get_match_data(lobby_id):
         log.info('Requested match stats from API')
 
         # save each period into match_data and player_match_data
+        # every period of the lobby is written in a single transaction
         if match_response.status_code == 200:
-            for match in match_response.json():
-                log.info('Match data found')
-                # attempts to parse match data and store in DB - returns match_data.id or False
-                log.info('Parsing match stats')
-                log.info(lobby.id)
-                result = parse_match_stats(match, teams, lobby)
+            matches = match_response.json()
+            log.info(f'Match data found - parsing stats for {len(matches)} periods')
+            added, new_players = parse_match_stats(matches, teams, lobby)
+            db.session.commit()
+            log.info(f'Lobby {lobby.id}: stored {len(added)} new periods')
+            # players created from the lobby appear in the player collections and the season's rookies
+            if new_players:
+                invalidate(*entity_tags('player'), f'season_division:{lobby.match.season_division_id}')
 
         return lobby.match.id
 
 
-def parse_match_stats(match, teams, lobby):
-    already_added = db.session.query(MatchData).filter_by(match_id=match['id']).first()
-    log.info(lobby.id)
-
-    match_id = already_added.id if already_added else False
-
-    if match['game_stats'] and not already_added:
-        data = {
+def parse_match_stats(matches, teams, lobby):
+    """Stages the new periods of a lobby and their player stats using bulk inserts.
+    Nothing is committed here, the caller commits once. Returns the ids of the MatchData rows added and the slap_ids
+    of the players created for them"""
+    iter_fields = ['goals', 'shots', 'saves', 'assists', 'primary_assists', 'secondary_assists', 'passes',
+                   'score', 'blocks', 'takeaways', 'turnovers', 'game_winning_goals', 'post_hits',
+                   'faceoffs_won', 'faceoffs_lost', 'possession_time_sec']
+
+    # skip periods without stats and periods that have already been stored
+    matches = [match for match in matches if match['game_stats']]
+    already_added = db.session.scalars(
+        sa.select(MatchData.match_id).where(MatchData.match_id.in_([match['id'] for match in matches]))).all()
+    matches = [match for match in matches if match['id'] not in already_added]
+    if not matches:
+        return [], []
+
+    period_rows = []
+    for match in matches:
+        period_rows.append({
             'lobby_id': lobby.id,
             'processed': False,
             'match_id': match['id'],
@@ -238,45 +143,60 @@ def parse_match_stats(match, teams, lobby):
             'periods_enabled': bool(match['game_stats']['periods_enabled']),
             'custom_mercy_rule': match['game_stats']['custom_mercy_rule'],
             'source': 'SlapAPI'
-        }
-        match_db = MatchData()
-        match_db.from_dict(data)
-        db.session.add(match_db)
-        db.session.commit()
+        })
+    db.session.execute(sa.insert(MatchData), period_rows)
 
-        for player_data in match['game_stats']['players']:
-            # get player from slap id
-            # if doesnt exist in db, create
-            player = db.session.query(Player).filter_by(slap_id=player_data['game_user_id']).first()
-            if not player:
-                player = Player()
-                player.slap_id = player_data['game_user_id']
-                player.player_name = player_data['username']
-                player.first_season_id = lobby.match.season_division_id
-                db.session.add(player)
-                db.session.commit()
-
-            iter_fields = ['goals', 'shots', 'saves', 'assists', 'primary_assists', 'secondary_assists', 'passes',
-                           'score', 'blocks', 'takeaways', 'turnovers', 'game_winning_goals', 'post_hits',
-                           'faceoffs_won', 'faceoffs_lost', 'possession_time_sec']
+    # map the API match ids to the new MatchData ids
+    period_ids = dict(db.session.execute(
+        sa.select(MatchData.match_id, MatchData.id).where(MatchData.match_id.in_([match['id'] for match in matches]))
+    ).all())
+
+    player_ids, new_players = resolve_players(matches, lobby)
 
+    player_rows = []
+    for match in matches:
+        for player_data in match['game_stats']['players']:
             data = {
-                'match_id': match_db.id,
-                'player_id': player.id,
+                'match_id': period_ids[match['id']],
+                'player_id': player_ids[player_data['game_user_id']],
                 'team_id': teams[player_data['team']].id
             }
             for field in iter_fields:
-                if field in player_data['stats']:
-                    data[field] = int(player_data['stats'][field])
+                data[field] = int(player_data['stats'][field]) if field in player_data['stats'] else 0
+            player_rows.append(data)
+
+    if player_rows:
+        db.session.execute(sa.insert(PlayerMatchData), player_rows)
+
+    return list(period_ids.values()), new_players
 
-            player_match_data = PlayerMatchData()
-            player_match_data.from_dict(data)
-            db.session.add(player_match_data)
-            db.session.commit()
 
-        match_id = match_db.id if match_db.id else False
+def resolve_players(matches, lobby):
+    """Maps every slap_id in the lobby's periods to a player id, creating any players that don't exist yet.
+    Uses one query to find existing players and one bulk insert for the missing ones.
+    Returns the {slap_id: player id} map and the slap_ids of the players created"""
+    usernames = {}
+    for match in matches:
+        for player_data in match['game_stats']['players']:
+            usernames[player_data['game_user_id']] = player_data['username']
+
+    def query_ids():
+        return dict(db.session.execute(
+            sa.select(Player.slap_id, Player.id).where(Player.slap_id.in_(list(usernames)))
+        ).all())
+
+    player_ids = query_ids()
+    missing = [slap_id for slap_id in usernames if slap_id not in player_ids]
+    if missing:
+        db.session.execute(sa.insert(Player), [{
+            'slap_id': slap_id,
+            'player_name': usernames[slap_id],
+            'rookie': True,
+            'first_season_id': lobby.match.season_division_id
+        } for slap_id in missing])
+        player_ids = query_ids()
 
-    return match_id
+    return player_ids, missing
 
 
 @shared_task
@@ -319,23 +239,37 @@ def validate_stats(match_id):
         }
 
         # check num lobbies
-        num_lobbies = match.lobbies.count()
-        lobby_ids = []
-        for lobby in match.lobbies:
-            lobby_ids.append(lobby.id)
+        lobby_ids = db.session.scalars(sa.select(Lobby.id).where(Lobby.match_id == match.id)).all()
+        num_lobbies = len(lobby_ids)
         if num_lobbies == 0:
             return f'No lobbies found for match {match.id}'
         if num_lobbies > 1:
             db.session.add(MatchReview(reason='Multiple lobbies created for match', **defaults))
 
-        periods = db.session.query(MatchData).filter(MatchData.lobby_id.in_(lobby_ids)).order_by(
-            sa.asc(MatchData.created))
-        period_ids = []
+        # everything needed for validation is loaded up front, the checks below are done in memory
+        periods = db.session.scalars(sa.select(MatchData).where(MatchData.lobby_id.in_(lobby_ids)).order_by(
+            sa.asc(MatchData.created))).all()
+        period_ids = [period.id for period in periods]
+
+        players_data = db.session.scalars(sa.select(PlayerMatchData).options(
+            joinedload(PlayerMatchData.player)).where(PlayerMatchData.match_id.in_(period_ids))).all()
+        player_ids = {player_data.player_id for player_data in players_data}
+
+        # current team of each player
+        current_teams = {player_id: player_team.team_id for player_id, player_team in teams_at(player_ids).items()}
+
+        free_agents = set(db.session.scalars(sa.select(FreeAgent.player_id).where(
+            FreeAgent.player_id.in_(player_ids),
+            FreeAgent.season_division_id == match.season_division_id
+        )))
+
+        players_per_period = {}
+        for player_data in players_data:
+            players_per_period[player_data.match_id] = players_per_period.get(player_data.match_id, 0) + 1
 
         period_order = []
         for period in periods:
             period_order.append(period.current_period)
-            period_ids.append(period.id)
             # check lobby settings
             period_settings = {
                 'periods': period.periods_enabled,
@@ -350,36 +284,34 @@ def validate_stats(match_id):
                 db.session.add(
                     MatchReview(reason=f'Game settings for period {period.current_period} were incorrect.', **defaults))
 
-            if period.player_data_assoc.count() != match_type.num_players:
+            if players_per_period.get(period.id, 0) != match_type.num_players:
                 db.session.add(
                     MatchReview(reason=f'Period {period.current_period} had incorrect number of players.', **defaults))
 
         # check num periods
-        if periods.count() != correct_periods:
+        if len(periods) != correct_periods:
             db.session.add(
-                MatchReview(reason=f'{periods.count()} periods were recorded, should be {correct_periods}', **defaults))
+                MatchReview(reason=f'{len(periods)} periods were recorded, should be {correct_periods}', **defaults))
         # check periods played in order
         elif period_order != correct_period_order:
             db.session.add(MatchReview(reason='Periods were not played in correct order', **defaults))
 
         # check player count
-        players_data = db.session.query(PlayerMatchData).filter(PlayerMatchData.match_id.in_(period_ids))
-        if round(players_data.count() / periods.count()) != match_type.num_players:
+        if periods and round(len(players_data) / len(periods)) != match_type.num_players:
             db.session.add(
-                MatchReview(reason=f'Invalid number of players. Had {round(players_data.count() / periods.count())}, '
+                MatchReview(reason=f'Invalid number of players. Had {round(len(players_data) / len(periods))}, '
                                    f'should be {match_type.num_players}', **defaults))
 
         # check players/teams
         players_wrong_team = []
+        team_ids = [team.id for team in teams.values()]
         # check all players are registered to a team in the match or are free agents in the current season
         for player_data in players_data:
             # check player has a current team
-            player_current_team = player_data.player.current_team()
+            player_current_team = current_teams.get(player_data.player_id)
             if not player_current_team:
                 # check if player is a free agent
-                player_free_agent = player_data.player.season_association.filter_by(
-                    season_division_id=match.season_division.id).first()
-                if not player_free_agent:
+                if player_data.player_id not in free_agents:
                     db.session.add(MatchReview(
                         reason=f'Player {player_data.player.player_name} is not a free agent in the current season/division',
                         **defaults))
@@ -387,14 +319,14 @@ def validate_stats(match_id):
                     # free agents added to wrong team
                     players_wrong_team.append(('FA', player_data.team_id))
             # check if players current team is part of the match
-            elif player_current_team.team not in teams.values():
+            elif player_current_team not in team_ids:
                 db.session.add(MatchReview(
                     reason=f"Player {player_data.player.player_name} is not a member of either team in the match",
                     **defaults))
 
             # check if player is on correct team
-            elif player_current_team.team.id != player_data.team_id:
-                players_wrong_team.append((player_current_team.team.id, player_data.team_id))
+            elif player_current_team != player_data.team_id:
+                players_wrong_team.append((player_current_team, player_data.team_id))
 
         # check over players on wrong team -
         # if ALL players are playing with correct teams but just on wrong side (i.e. they chose AWAY instead of HOME)
@@ -418,33 +350,39 @@ def validate_stats(match_id):
             flip_team_id = {valid_teams[0]: valid_teams[1], valid_teams[1]: valid_teams[0]}
             for player_data in players_data:
                 player_data.team_id = flip_team_id[player_data.team_id]
-                db.session.add(player_data)
 
             flip_team_label = {'away': 'home', 'home': 'away'}
             for period in periods:
                 period.winner = flip_team_label[period.winner]
                 period.home_score, period.away_score = period.away_score, period.home_score
-                db.session.add(period)
-
-            db.session.commit()
         else:
             # raise player on incorrect team flags
+            # players without a current team are free agents or have already been flagged above
+            period_numbers = {period.id: period.current_period for period in periods}
             for player_data in players_data:
-                if player_data.player.current_team().team.id != player_data.team_id:
+                player_current_team = current_teams.get(player_data.player_id)
+                if player_current_team and player_current_team != player_data.team_id:
                     db.session.add(MatchReview(
-                        reason=f"Player {player_data.player.player_name} played period {player_data.match.current_period}"
-                               f" for the wrong team",
+                        reason=f"Player {player_data.player.player_name} played period "
+                               f"{period_numbers[player_data.match_id]} for the wrong team",
                         **defaults))
-        db.session.commit()
+        db.session.flush()
 
         # if good, mark periods as accepted
         flags = db.session.query(MatchReview).filter_by(match_id=match.id).count()
+        newly_accepted = set()
         for period in periods:
             period.processed = True
-            if flags == 0:
+            if flags == 0 and not period.accepted:
                 period.accepted = True
-            db.session.add(period)
-            db.session.commit()
+                newly_accepted.add(period.id)
+
+        # add the newly accepted periods to the players season totals in the same transaction
+        accepted_data = [player_data for player_data in players_data if player_data.match_id in newly_accepted]
+        add_player_stats(match.season_division_id, accepted_data)
+        db.session.commit()
+        invalidate(f'match:{match.id}', f'season_division:{match.season_division_id}',
+                   *{f'player:{player_data.player_id}' for player_data in accepted_data})
 
         if flags == 0:
             process_match_result.delay(match.id)
@@ -457,7 +395,7 @@ def process_match_result(match_id):
         import sqlalchemy as sa
         from datetime import datetime, timezone, timedelta
         from api.srlm.app import db
-        from api.srlm.app.models import Match, MatchResult, MatchData
+        from api.srlm.app.models import Match, MatchData
 
         log.info('Processing match result!')
         match = db.session.get(Match, match_id)
@@ -471,7 +409,6 @@ def process_match_result(match_id):
             sa.desc(MatchData.current_period))
         last_period = accepted_periods.first()
 
-        match_result = MatchResult()
         teams = {
             'home': {
                 'team': match.home_team,
@@ -500,10 +437,9 @@ def process_match_result(match_id):
         }
 
         match_length = match.season_division.season.match_type.match_length
-        game_finished = last_period.created + timedelta(seconds=match_length)
+        data['completed_date'] = last_period.created + timedelta(seconds=match_length)
 
-        match_result.from_dict(data)
-        match_result.completed_date = game_finished
-        match_result.match = match
-        db.session.add(match_result)
+        # creates the result and updates the standings of both teams
+        record_result(match, data)
         db.session.commit()
+        invalidate(*entity_tags('match', match.id), f'season_division:{match.season_division_id}')
@@ -0,0 +1,218 @@
+"""Supervises every active in-game lobby from a single asyncio event loop.
+Each lobby is polled on its own schedule, so hundreds of lobbies cost one process instead of one celery worker each.
+Run with: python -m api.srlm.app.spapi.lobby_supervisor
+"""
+import asyncio
+from datetime import datetime, timedelta
+import requests
+import sqlalchemy as sa
+from celery.contrib.abortable import AbortableAsyncResult
+from celery.result import AsyncResult
+from api.srlm.app import db
+from api.srlm.app.api.utils.cache import invalidate
+from api.srlm.app.models import Lobby, MatchData, PlayerMatchData
+from api.srlm.app.spapi.lobby import get_lobby, delete_lobby
+from api.srlm.app.spapi.lobby_manager import get_match_data, validate_stats
+from api.srlm.logger import get_logger
+
+log = get_logger(__name__)
+
+
+class LobbyMonitor:
+    """Tracks a single lobby. Blocking work (database and Slap API calls) is handed off to a thread so the event loop
+    is never held up by one lobby"""
+    def __init__(self, app, lobby, check_interval, max_time):
+        self.app = app
+        self.id = lobby.id
+        self.lobby_id = lobby.lobby_id
+        self.task_id = lobby.task_id
+        self.match_id = lobby.match.id
+        self.season_division_id = lobby.match.season_division_id
+
+        match_type = lobby.match.season_division.season.match_type
+        self.periods = match_type.periods
+        self.game_mode = match_type.game_mode
+        self.num_players = match_type.num_players
+
+        # how often the monitor will check on the lobby via an API request
+        # is based on match length (aka period length - default is 5 minutes)
+        self.monitor_interval = match_type.match_length
+        self.check_interval = check_interval  # how often to check for abort signal in seconds
+
+        self.start = lobby.monitor_start or datetime.utcnow()
+        self.deadline = self.start + timedelta(minutes=max_time)
+        self.next_request = self.start + timedelta(seconds=self.monitor_interval)
+
+        self.retrieve_stats_task = None  # id of the get_match_data task
+        self.end_reason = None  # used for return message and skip condition in loop
+
+    async def run(self):
+        wait = (self.start - datetime.utcnow()).total_seconds()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        log.info(f'Lobby {self.id} monitor started ||| Deadline: {self.deadline}, Abort check interval: '
+                 f'{self.check_interval} seconds, API Request Interval: {self.monitor_interval} seconds '
+                 f'({self.monitor_interval / 60} minutes)')
+
+        finished = False
+        while not finished:
+            if datetime.utcnow() >= self.deadline:
+                # checks if max time has elapsed
+                self.end_reason = 'Aborted - Max time elapsed'
+                finished = True
+            elif await asyncio.to_thread(self.is_aborted):
+                # checks if has been aborted
+                self.end_reason = 'Aborted - Received abort request'
+                finished = True
+
+            # checks if a match result has been parsed from the API
+            if self.retrieve_stats_task:
+                if await asyncio.to_thread(self.check_match_data):
+                    self.end_reason = 'Match results recorded'
+                    finished = True
+
+            # API request skipped if monitor has been told to stop this loop
+            if datetime.utcnow() >= self.next_request and not self.end_reason:
+                self.next_request += timedelta(seconds=self.monitor_interval)
+                await asyncio.to_thread(self.check_lobby)
+
+            if not finished:
+                await asyncio.sleep(self.check_interval)
+
+        return await asyncio.to_thread(self.close)
+
+    def is_aborted(self):
+        return bool(self.task_id) and AbortableAsyncResult(self.task_id).is_aborted()
+
+    def check_lobby(self):
+        log.info(f'Lobby {self.id}: Making API request')
+        try:
+            lobby_resp = get_lobby(self.lobby_id)
+        except requests.RequestException as e:
+            # retries are exhausted inside the SlapAPI session, try again on the next interval
+            log.warning(f'Lobby {self.id}: API request failed ({e})')
+            return
+        if lobby_resp.status_code == 200:
+            lobby_info = lobby_resp.json()
+            log.info(f"Lobby {self.id}: Period: {lobby_info['current_period']} | In-Game: {lobby_info['in_game']}")
+            if (lobby_info['periods_enabled'] and lobby_info['current_period'] > 3) or (
+                    not lobby_info['periods_enabled'] and lobby_info['current_period'] > 1):
+                # looks like match is completed - tell a worker to get the match results
+                log.info(f'Lobby {self.id}: Detected possible match completion, requesting match data')
+                self.retrieve_stats_task = get_match_data.delay(self.id).id
+
+    def check_match_data(self):
+        # check if the get_match_data task was successful
+        if AsyncResult(self.retrieve_stats_task).state != 'SUCCESS':
+            return False
+
+        with self.app.app_context():
+            period_data = db.session.query(MatchData).filter_by(
+                lobby_id=self.id,
+                periods_enabled=self.periods,
+                gamemode=self.game_mode
+            ).order_by(sa.asc(MatchData.current_period))
+            periods_valid = []
+            current_period = 1
+            for period in period_data:
+                if period.current_period == current_period:
+                    player_count = db.session.query(PlayerMatchData).filter_by(
+                        match_id=period.id
+                    ).count()
+                    if player_count == self.num_players:
+                        periods_valid.append(current_period)
+                        current_period += 1
+
+        if (periods_valid == [1, 2, 3] and self.periods) or (periods_valid == [1] and not self.periods):
+            # looks like the match was completed with the correct number of periods and players
+            validate_stats.delay(self.match_id)
+            log.info(f'Lobby {self.id}: Match data retrieved successfully, requesting validation of data')
+            return True
+
+        # retrieved stats incomplete, need to wait for a new result
+        self.retrieve_stats_task = None
+        return False
+
+    def close(self):
+        log.info(f'Lobby {self.id} monitor closing. Reason: {self.end_reason}')
+
+        # destroy the lobby in-game
+        try:
+            delete = delete_lobby(self.lobby_id)
+        except requests.RequestException as e:
+            log.warning(f'Lobby {self.id}: Delete lobby request failed ({e})')
+            delete = None
+        log.info(f'Lobby {self.id}: Delete lobby request sent: Status code {delete}')
+
+        # mark lobby as inactive in database
+        if delete == 200:
+            with self.app.app_context():
+                db.session.query(Lobby).filter_by(id=self.id).update({'active': False})
+                db.session.commit()
+                invalidate(f'match:{self.match_id}', f'season_division:{self.season_division_id}')
+            log.info(f'Lobby {self.id} marked as inactive')
+
+        # check if get_match_data was run and found correct number of periods
+        # if no good signal received, tell a get_match_data worker to get the match stats
+        if self.end_reason != 'Match results recorded':
+            log.info(f'Lobby {self.id} closing without completed match data - making final match data request')
+            get_match_data.delay(self.id)
+
+        return {
+            'end_reason': f'Lobby closed: {self.end_reason}',
+            'lobby_deleted': delete
+        }
+
+
+class LobbySupervisor:
+    """Periodically scans the database for active lobbies and starts a LobbyMonitor for any it is not yet tracking"""
+    def __init__(self, app):
+        self.app = app
+        self.scan_interval = app.config['LOBBY_SUPERVISOR_SCAN_INTERVAL']
+        self.check_interval = app.config['LOBBY_MONITOR_CHECK_INTERVAL']
+        self.max_time = app.config['LOBBY_MONITOR_MAX_TIME']
+        self.monitors = {}  # lobby.id: asyncio.Task
+        self.closed = set()  # lobbies already closed by this process, even if the delete request failed
+
+    def active_lobbies(self):
+        with self.app.app_context():
+            lobbies = db.session.query(Lobby).filter_by(active=True)
+            return [LobbyMonitor(self.app, lobby, self.check_interval, self.max_time) for lobby in lobbies
+                    if lobby.id not in self.monitors and lobby.id not in self.closed]
+
+    def monitor_done(self, lobby_id, task):
+        self.monitors.pop(lobby_id, None)
+        self.closed.add(lobby_id)
+        if task.cancelled():
+            return
+        if task.exception():
+            log.error(f'Lobby {lobby_id} monitor failed', exc_info=task.exception())
+        else:
+            log.info(f'Lobby {lobby_id} monitor finished: {task.result()}')
+
+    async def run(self):
+        log.info(f'Lobby supervisor started ||| Scan interval: {self.scan_interval} seconds')
+        while True:
+            try:
+                new_monitors = await asyncio.to_thread(self.active_lobbies)
+            except Exception:
+                log.exception('Failed to scan for active lobbies')
+                new_monitors = []
+
+            for monitor in new_monitors:
+                log.info(f'Tracking lobby {monitor.id} (match {monitor.match_id})')
+                task = asyncio.create_task(monitor.run())
+                task.add_done_callback(lambda t, lobby_id=monitor.id: self.monitor_done(lobby_id, t))
+                self.monitors[monitor.id] = task
+
+            await asyncio.sleep(self.scan_interval)
+
+
+def main():
+    from api.srlm.run import app
+    asyncio.run(LobbySupervisor(app).run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""Maintains the Standing table (the league table of each season/division).
+Every recorded MatchResult is applied to the two teams rows as it is written, so reading the standings only touches
+one row per team. Finals matches do not count towards the standings"""
+import sqlalchemy as sa
+from celery import shared_task
+from flask import current_app
+from api.srlm.app import db, create_app
+from api.srlm.app.models import Standing, MatchResult, Match
+from api.srlm.logger import get_logger
+
+log = get_logger(__name__)
+
+# outcome code: (Standing column, points config key)
+OUTCOMES = {
+    'W': ('wins', 'STANDINGS_POINTS_WIN'),
+    'OTW': ('ot_wins', 'STANDINGS_POINTS_OT_WIN'),
+    'OTL': ('ot_losses', 'STANDINGS_POINTS_OT_LOSS'),
+    'D': ('draws', 'STANDINGS_POINTS_DRAW'),
+    'L': ('losses', 'STANDINGS_POINTS_LOSS')
+}
+# overtime results count as a win/loss for the streak
+STREAK_CODES = {'W': 'W', 'OTW': 'W', 'OTL': 'L', 'D': 'D', 'L': 'L'}
+
+
+def result_outcomes(result):
+    """Returns {team_id: (outcome, goals_for, goals_against)} for both teams of a MatchResult"""
+    if result.draw:
+        return {
+            result.winner_id: ('D', result.score_winner, result.score_loser),
+            result.loser_id: ('D', result.score_loser, result.score_winner)
+        }
+    # forfeits are never decided in overtime
+    overtime = result.overtime and not result.forfeit
+    return {
+        result.winner_id: ('OTW' if overtime else 'W', result.score_winner, result.score_loser),
+        result.loser_id: ('OTL' if overtime else 'L', result.score_loser, result.score_winner)
+    }
+
+
+def counts_towards_standings(match):
+    return match is not None and match.final_id is None and match.season_division_id is not None
+
+
+def apply_result(result, sign=1):
+    """Adds (or with sign=-1 removes) a MatchResult to the standings of both teams. Does not commit"""
+    match = result.match or db.session.get(Match, result.id)
+    if not counts_towards_standings(match):
+        return
+
+    outcomes = result_outcomes(result)
+    existing = {
+        standing.team_id: standing for standing in db.session.query(Standing).filter(
+            Standing.season_division_id == match.season_division_id,
+            Standing.team_id.in_(list(outcomes))
+        )
+    }
+    for team_id, (outcome, goals_for, goals_against) in outcomes.items():
+        standing = existing.get(team_id)
+        if standing is None:
+            standing = Standing(season_division_id=match.season_division_id, team_id=team_id, played=0, wins=0,
+                                losses=0, draws=0, ot_wins=0, ot_losses=0, goals_for=0, goals_against=0, points=0)
+            db.session.add(standing)
+        column, points_key = OUTCOMES[outcome]
+        standing.played += sign
+        setattr(standing, column, getattr(standing, column) + sign)
+        standing.goals_for += sign * (goals_for or 0)
+        standing.goals_against += sign * (goals_against or 0)
+        standing.points += sign * current_app.config[points_key]
+
+    db.session.flush()
+    update_streaks(match.season_division_id, list(outcomes))
+
+
+def team_results(season_division_id, team_ids):
+    """Query of the standings results involving the given teams, newest first"""
+    return db.session.query(MatchResult).join(Match, MatchResult.id == Match.id).filter(
+        Match.season_division_id == season_division_id,
+        Match.final_id == None,
+        sa.or_(MatchResult.winner_id.in_(team_ids), MatchResult.loser_id.in_(team_ids))
+    ).order_by(sa.desc(MatchResult.completed_date), sa.desc(MatchResult.id))
+
+
+def update_streaks(season_division_id, team_ids):
+    """Recalculates the current streak of the given teams. Walks back through results only until each streak ends,
+    which also keeps streaks correct when an older result is changed"""
+    streaks = {}
+    remaining = set(team_ids)
+    for result in team_results(season_division_id, team_ids):
+        for team_id, (outcome, _, _) in result_outcomes(result).items():
+            if team_id not in remaining:
+                continue
+            code = STREAK_CODES[outcome]
+            current = streaks.get(team_id)
+            if current is None:
+                streaks[team_id] = [code, 1]
+            elif current[0] == code:
+                current[1] += 1
+            else:
+                remaining.discard(team_id)
+        if not remaining:
+            break
+
+    for standing in db.session.query(Standing).filter(Standing.season_division_id == season_division_id,
+                                                      Standing.team_id.in_(team_ids)):
+        streak = streaks.get(standing.team_id)
+        standing.streak = f'{streak[0]}{streak[1]}' if streak else None
+
+
+def record_result(match, data):
+    """Creates or changes the result of a match and updates the standings in the same transaction. Does not commit.
+    Use this for every write to a MatchResult (including forfeits) so the standings stay in sync"""
+    result = match.results
+    if result is None:
+        result = MatchResult()
+        result.match = match
+        db.session.add(result)
+    else:
+        apply_result(result, sign=-1)
+    result.from_dict(data)
+    if 'completed_date' in data:
+        result.completed_date = data['completed_date']
+    apply_result(result)
+    return result
+
+
+def rebuild_standings(season_division_id=None):
+    """Recalculates the standings from every recorded result. Rebuilds all season/divisions unless one is given"""
+    delete = sa.delete(Standing)
+    query = db.session.query(MatchResult, Match.season_division_id).join(Match, MatchResult.id == Match.id).filter(
+        Match.final_id == None, Match.season_division_id != None)
+    if season_division_id is not None:
+        delete = delete.where(Standing.season_division_id == season_division_id)
+        query = query.filter(Match.season_division_id == season_division_id)
+    db.session.execute(delete)
+
+    rows = {}
+    for result, sd_id in query.order_by(sa.asc(MatchResult.completed_date), sa.asc(MatchResult.id)):
+        for team_id, (outcome, goals_for, goals_against) in result_outcomes(result).items():
+            row = rows.setdefault((sd_id, team_id), {
+                'season_division_id': sd_id, 'team_id': team_id, 'played': 0, 'wins': 0, 'losses': 0, 'draws': 0,
+                'ot_wins': 0, 'ot_losses': 0, 'goals_for': 0, 'goals_against': 0, 'points': 0, 'streak': None
+            })
+            column, points_key = OUTCOMES[outcome]
+            row['played'] += 1
+            row[column] += 1
+            row['goals_for'] += goals_for or 0
+            row['goals_against'] += goals_against or 0
+            row['points'] += current_app.config[points_key]
+
+            # results are in date order so the streak either continues or starts again
+            code = STREAK_CODES[outcome]
+            if row['streak'] and row['streak'][0] == code:
+                row['streak'] = f"{code}{int(row['streak'][1:]) + 1}"
+            else:
+                row['streak'] = f'{code}1'
+
+    if rows:
+        db.session.execute(sa.insert(Standing), list(rows.values()))
+    db.session.commit()
+    return len(rows)
+
+
+@shared_task
+def recompute_standings(season_division_id=None):
+    """Backfills or repairs the standings"""
+    app, celery = create_app()
+    with app.app_context():
+        count = rebuild_standings(season_division_id)
+        log.info(f'Rebuilt {count} standings rows')
+        return count
@@ -0,0 +1,84 @@
+"""Maintains the PlayerSeasonStats rollup table.
+Accepted PlayerMatchData is added to the running totals as it is accepted, so reading a players stats is a single
+indexed lookup instead of aggregating every period they have played"""
+import sqlalchemy as sa
+from celery import shared_task
+from api.srlm.app import db, create_app
+from api.srlm.app.models import PlayerSeasonStats, PlayerMatchData, MatchData, Lobby, Match
+from api.srlm.logger import get_logger
+
+log = get_logger(__name__)
+
+
+def add_player_stats(season_division_id, players_data, sign=1):
+    """Adds (or with sign=-1 removes) PlayerMatchData rows to the season/division totals of each player/team.
+    Does not commit - call inside the same transaction that accepts or edits the stats"""
+    totals = {}
+    for player_data in players_data:
+        if player_data.player_id is None or player_data.team_id is None:
+            continue
+        key = (player_data.player_id, player_data.team_id)
+        total = totals.setdefault(key, dict.fromkeys(['periods'] + PlayerSeasonStats.stat_fields, 0))
+        total['periods'] += sign
+        for field in PlayerSeasonStats.stat_fields:
+            total[field] += sign * (getattr(player_data, field) or 0)
+    if not totals:
+        return
+
+    player_ids = {player_id for player_id, _ in totals}
+    existing = {
+        (row.player_id, row.team_id): row for row in db.session.query(PlayerSeasonStats).filter(
+            PlayerSeasonStats.season_division_id == season_division_id,
+            PlayerSeasonStats.player_id.in_(player_ids)
+        )
+    }
+
+    for (player_id, team_id), total in totals.items():
+        row = existing.get((player_id, team_id))
+        if row is None:
+            row = PlayerSeasonStats(player_id=player_id, season_division_id=season_division_id, team_id=team_id,
+                                    **dict.fromkeys(['periods'] + PlayerSeasonStats.stat_fields, 0))
+            db.session.add(row)
+        for field, value in total.items():
+            setattr(row, field, getattr(row, field) + value)
+
+
+def rebuild_player_stats(season_division_id=None):
+    """Recalculates the rollup from every accepted period. Rebuilds all season/divisions unless one is given"""
+    delete = sa.delete(PlayerSeasonStats)
+    filters = [MatchData.accepted == True]
+    if season_division_id is not None:
+        delete = delete.where(PlayerSeasonStats.season_division_id == season_division_id)
+        filters.append(Match.season_division_id == season_division_id)
+    db.session.execute(delete)
+
+    query = sa.select(
+        PlayerMatchData.player_id,
+        Match.season_division_id,
+        PlayerMatchData.team_id,
+        sa.func.count(PlayerMatchData.id).label('periods'),
+        *[sa.func.coalesce(sa.func.sum(getattr(PlayerMatchData, field)), 0).label(field)
+          for field in PlayerSeasonStats.stat_fields]
+    ).join(MatchData, PlayerMatchData.match_id == MatchData.id).join(
+        Lobby, MatchData.lobby_id == Lobby.id
+    ).join(
+        Match, Lobby.match_id == Match.id
+    ).where(
+        *filters, PlayerMatchData.player_id != None, PlayerMatchData.team_id != None
+    ).group_by(PlayerMatchData.player_id, Match.season_division_id, PlayerMatchData.team_id)
+
+    rows = [dict(row._mapping) for row in db.session.execute(query)]
+    if rows:
+        db.session.execute(sa.insert(PlayerSeasonStats), rows)
+    db.session.commit()
+    return len(rows)
+
+
+@shared_task
+def rebuild_stats(season_division_id=None):
+    """Backfills or repairs the player season stats rollup"""
+    app, celery = create_app()
+    with app.app_context():
+        count = rebuild_player_stats(season_division_id)
+        log.info(f'Rebuilt {count} player season stat rows')
+        return count
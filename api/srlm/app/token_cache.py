@@ -0,0 +1,82 @@
+"""Cache of verified app and user tokens.
+A token is checked against the database at most once per request, and at most once every AUTH_TOKEN_CACHE_TIMEOUT
+seconds across workers. Only the id and expiry of the verified app/user (plus a users compiled permissions) are cached -
+the instance is rebuilt and merged into the session without a query, other attributes load when first accessed.
+Revoking or rotating a token forgets it as soon as the change is committed"""
+import hashlib
+from datetime import datetime, timezone
+import sqlalchemy as sa
+from flask import g, current_app, has_app_context
+from sqlalchemy.orm import Session, make_transient_to_detached
+from api.srlm.app import db, cache
+
+
+def token_key(model, token):
+    return f'token/{model.__tablename__}/{hashlib.sha256(token.encode()).hexdigest()}'
+
+
+def request_tokens():
+    """Tokens verified during the current request/app context"""
+    if 'verified_tokens' not in g:
+        g.verified_tokens = {}
+    return g.verified_tokens
+
+
+def from_cached(model, data):
+    """Rebuilds an instance from its cached id/expiry and attaches it to the session without loading it"""
+    instance = model(id=data['id'], token_expiration=data['token_expiration'])
+    make_transient_to_detached(instance)
+    instance = db.session.merge(instance, load=False)
+    if hasattr(instance, 'load_token_cache_data'):
+        instance.load_token_cache_data(data)
+    return instance
+
+
+def verified_token(model, token):
+    """Returns the app/user (AuthorizedApp or User) the token belongs to, or None if it is invalid or expired"""
+    if not token:
+        return None
+    key = token_key(model, token)
+    verified = request_tokens()
+    if key in verified:
+        return verified[key]
+
+    now = datetime.now(timezone.utc)
+    data = cache.get(key)
+    if data is not None and data['token_expiration'].replace(tzinfo=timezone.utc) > now:
+        instance = from_cached(model, data)
+    else:
+        instance = model.check_token(token)
+        if instance is not None:
+            expires = instance.token_expiration.replace(tzinfo=timezone.utc)
+            timeout = min(current_app.config['AUTH_TOKEN_CACHE_TIMEOUT'], int((expires - now).total_seconds()))
+            if timeout > 0:
+                data = {'id': instance.id, 'token_expiration': instance.token_expiration}
+                # models can cache more with the token, e.g. a users compiled permissions
+                if hasattr(instance, 'token_cache_data'):
+                    data.update(instance.token_cache_data())
+                cache.set(key, data, timeout=timeout)
+
+    verified[key] = instance
+    return instance
+
+
+def forget_token(model, token):
+    """Forgets a verified token once the current transaction commits - call when a token is revoked or replaced"""
+    if token:
+        db.session.info.setdefault('forget_tokens', set()).add(token_key(model, token))
+
+
+@sa.event.listens_for(Session, 'after_commit')
+def forget_committed_tokens(session):
+    keys = session.info.pop('forget_tokens', None)
+    if not keys or not has_app_context():
+        return
+    cache.delete_many(*keys)
+    for key in keys:
+        request_tokens().pop(key, None)
+
+
+@sa.event.listens_for(Session, 'after_soft_rollback')
+def discard_forgotten_tokens(session, previous_transaction):
+    session.info.pop('forget_tokens', None)
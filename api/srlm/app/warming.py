@@ -0,0 +1,116 @@
+"""Pre-renders the hot responses of the active seasons into the cache.
+Runs on a celery beat schedule so the first requests after a deploy, cache flush or invalidation don't hit cold paths.
+Only responses that are missing, or cached with an expiry before the next run, are computed - the rest are still valid
+as writes invalidate them.
+Requests are made through the app itself with the token of the CACHE_WARM_APP authorized app, so the cached responses
+and keys are exactly the ones a client would get"""
+import time
+from datetime import date
+import sqlalchemy as sa
+from celery import shared_task
+from flask import url_for
+from api.srlm.app import db, create_app
+from api.srlm.app.api.utils.cache import WARM_ENVIRON_KEY
+from api.srlm.app.models import Season, SeasonDivision, Match
+from api.srlm.app.rosters import rosters_at
+from api.srlm.api_access.models import AuthorizedApp
+from api.srlm.logger import get_logger
+
+log = get_logger(__name__)
+
+
+def active_seasons(today=None):
+    """Seasons that have started and not yet ended (including their finals)"""
+    today = today or date.today()
+    end = sa.func.coalesce(Season.finals_end, Season.end_date)
+    return db.session.scalars(sa.select(Season).where(
+        Season.start_date != None,
+        Season.start_date <= today,
+        sa.or_(end == None, end >= today)
+    )).all()
+
+
+def hot_urls(season_division):
+    """URLs of the responses requested most during a season - its matches, standings, teams and their players"""
+    sd_id = season_division.id
+    urls = [
+        url_for('api.season_division.get_season_division', season_division_id=sd_id),
+        url_for('api.season_division.get_matches_in_season_division', season_division_id=sd_id),
+        url_for('api.season_division.get_matches_in_season_division', season_division_id=sd_id, unplayed='true'),
+        url_for('api.season_division.get_season_division_standings', season_division_id=sd_id),
+        url_for('api.season_division.get_teams_in_season_division', season_division_id=sd_id)
+    ]
+
+    match_ids = db.session.scalars(sa.select(Match.id).where(Match.season_division_id == sd_id))
+    urls += [url_for('api.match.get_match', match_id=match_id) for match_id in match_ids]
+
+    team_ids = [team.id for team in season_division.teams]
+    for team_id in team_ids:
+        urls.append(url_for('api.teams.get_team', team_id=team_id))
+        urls.append(url_for('api.teams.get_team_players_in_season', team_id=team_id, season_division_id=sd_id))
+
+    player_ids = {player_team.player_id for roster in rosters_at(team_ids).values() for player_team in roster}
+    for player_id in sorted(player_ids):
+        urls.append(url_for('api.players.get_player', player_id=player_id))
+        urls.append(url_for('api.players.get_player_stats', player_id=player_id, season=season_division.season_id,
+                            division=season_division.division_id))
+    return urls
+
+
+def warm_app_token(app_name):
+    """Token of the authorized app used for warming, a new one is issued when it has expired or was never issued"""
+    authorized_app = db.session.scalar(sa.select(AuthorizedApp).where(AuthorizedApp.name == app_name))
+    if authorized_app is None:
+        return None
+    if authorized_app.token is None or authorized_app.token_expiration is None or \
+            AuthorizedApp.check_token(authorized_app.token) is None:
+        authorized_app.get_new_token()
+        db.session.commit()
+    return authorized_app.token
+
+
+def warm_urls(app, urls, token):
+    """Requests each URL as the cache warmer. Returns {url: (status code, seconds)}"""
+    client = app.test_client()
+    headers = {'Authorization': f'Bearer {token}'}
+    timings = {}
+    for url in urls:
+        start = time.perf_counter()
+        response = client.get(url, headers=headers, environ_overrides={WARM_ENVIRON_KEY: True})
+        timings[url] = (response.status_code, time.perf_counter() - start)
+    return timings
+
+
+@shared_task
+def warm_cache():
+    """Warms the cache for every active season/division and logs how long it took"""
+    app, celery = create_app()
+    with app.app_context():
+        token = warm_app_token(app.config['CACHE_WARM_APP'])
+        if token is None:
+            log.warning(f"Cache warming skipped - no authorized app named '{app.config['CACHE_WARM_APP']}'")
+            return None
+
+        summary = {}
+        for season in active_seasons():
+            season_divisions = db.session.scalars(
+                sa.select(SeasonDivision).where(SeasonDivision.season_id == season.id)).all()
+            for season_division in season_divisions:
+                start = time.perf_counter()
+                with app.test_request_context():
+                    urls = hot_urls(season_division)
+                timings = warm_urls(app, urls, token)
+
+                failed = [url for url, (status, _) in timings.items() if status != 200]
+                slowest = max(timings.items(), key=lambda item: item[1][1]) if timings else (None, (None, 0))
+                seconds = time.perf_counter() - start
+                summary[season_division.get_readable_name()] = {
+                    'urls': len(urls),
+                    'failed': len(failed),
+                    'seconds': round(seconds, 3),
+                    'slowest': slowest[0],
+                    'slowest_seconds': round(slowest[1][1], 3)
+                }
+                log.info(f'Warmed {len(urls)} responses for {season_division.get_readable_name()} in {seconds:.2f}s '
+                         f'(slowest {slowest[0]} {slowest[1][1]:.2f}s, {len(failed)} failed)')
+        return summary
@@ -22,12 +22,16 @@ app, celery = create_app()
 log.info('Web app started, accepting requests')
 asgi_app = WsgiToAsgi(app)
 
+import click
 import sqlalchemy as sa
 from api.srlm.app import db
 from api.srlm.app.models import User, Permission, UserPermissions, League, Season, Division, SeasonDivision, \
     Player, Team, Match, Lobby, MatchData, PlayerMatchData
 from api.srlm.api_access.models import AuthorizedApp
 from api.srlm.app.api.utils.errors import error_response
+from api.srlm.app.links import benchmark
+from api.srlm.app.serializers import benchmark as benchmark_serializer
+from api.srlm.app.fairy.schemas import PlayerCollection
 
 
 @app.errorhandler(404)
@@ -35,7 +39,7 @@ def handle_404(e):
     return error_response(e.code, 'Requested resource cannot be found. Check that the URL is correct')
 
 
-# Shell context processor for development purposes
+# Shell context processor and commands for development purposes
 
 
 @app.shell_context_processor
@@ -59,3 +63,23 @@ def make_shell_context():
         'AuthorizedApp': AuthorizedApp
     }
 
+
+@app.cli.command('benchmark-links')
+def benchmark_links():
+    """Times building the _links of a 500 player page with url_for and with the compiled link builder"""
+    timings = benchmark(app)
+    for name, seconds in timings.items():
+        click.echo(f'{name}: {seconds * 1000:.1f}ms')
+    click.echo(f"link_for is {timings['url_for'] / timings['link_for']:.1f}x faster")
+
+
+@app.cli.command('benchmark-serializers')
+def benchmark_serializers():
+    """Times serializing a page of 100 players with marshmallow and with the compiled serializer"""
+    with app.test_request_context():
+        page = Player.to_collection_dict(sa.select(Player), 1, 100, 'api.players.get_players')
+        timings, same = benchmark_serializer(PlayerCollection(), page)
+    for name, seconds in timings.items():
+        click.echo(f'{name}: {seconds * 1000:.1f}ms')
+    click.echo(f"compiled is {timings['marshmallow'] / timings['compiled']:.1f}x faster, output "
+               f"{'identical' if same else 'DIFFERENT'}")